@@ -6,12 +6,14 @@ import queue
 import random
 import logging
 import talib
+import pandas as pd
 
 from backtest.broker import AlpacaBroker, SimulatedBroker
 from backtest.portfolio.portfolio import PercentagePortFolio
 from backtest.portfolio.rebalance import SellLongLosers
 from backtest.portfolio.strategy import DefaultOrder, LongOnly
 from backtest.utilities.backtest import backtest
+from backtest.data.stream import AlpacaStreamFeed, StreamingDataHandler
 from trading_common.data.dataHandler import AlpacaData
 from trading_common.utilities.utils import load_credentials, parse_args, remove_bs
 from trading_common.strategy.ta import BoundedTA, ExtremaTA, MeanReversionTA, TAIndicatorType
@@ -43,7 +45,15 @@ SG = "Singapore"
 live = True
 start_date = "2017-04-05" if not live else None
 
-bars = AlpacaData(event_queue, symbol_list, live=live, start_date=start_date)
+if live:
+    # stream trades into daily bars, seeded with recent history once instead of a REST sweep per cycle
+    broker = AlpacaBroker(event_queue)
+    bars = StreamingDataHandler(event_queue, symbol_list, AlpacaStreamFeed(), timeframe="1D")
+    now = pd.Timestamp.now(tz=NY)
+    bars.warm_start(broker.get_historical_bars(
+        symbol_list, "1D", start=(now - pd.Timedelta(days=60)).isoformat(), end=now.isoformat()))
+else:
+    bars = AlpacaData(event_queue, symbol_list, live=live, start_date=start_date)
 # strategy = MultipleAnyStrategy([
 #     BuyDips(
 #         bars, event_queue, short_time=80, long_time=150
@@ -86,7 +96,6 @@ port = PercentagePortFolio(
 )
 
 if live:
-    broker = AlpacaBroker(event_queue)
     backtest(
         symbol_list,
         bars,
@@ -0,0 +1,2 @@
+import os, sys
+sys.path.append(os.path.join(os.path.dirname(__file__)))
\ No newline at end of file
@@ -0,0 +1,112 @@
+import logging
+import os
+
+import alpaca_trade_api
+import pandas as pd
+
+from trading_common.event import OrderEvent
+from trading_common.utilities.enum import OrderPosition, OrderType
+from backtest.broker import Broker
+from backtest.utilities.http_client import get_client
+from backtest.utilities.order_router import DEAD, FILLED, OPEN, OrderRouter, RateLimiter
+
+
+class AlpacaBroker(Broker):
+    def __init__(self, event_queue):
+        self.events = event_queue
+        self.base_url = "https://paper-api.alpaca.markets"
+        self.data_url = "https://data.alpaca.markets/v2"
+        self.http = get_client()
+        self._auth_headers = {
+            "APCA-API-KEY-ID": os.environ["alpaca_key_id"],
+            "APCA-API-SECRET-KEY": os.environ["alpaca_secret_key"],
+        }
+        self.api = alpaca_trade_api.REST(
+            self._auth_headers["APCA-API-KEY-ID"],
+            self._auth_headers["APCA-API-SECRET-KEY"],
+            self.base_url,
+            api_version="v2",
+        )
+        # Alpaca allows 200 requests/min per account, split between orders and status polls
+        self.router = OrderRouter(
+            self.events, self._submit_order, self._order_status,
+            rate_limiter=RateLimiter(150, 60), poll_limiter=RateLimiter(50, 60), max_workers=16)
+
+    def _alpaca_endpoint(self, url, args: str, ttl: float = None):
+        return self.http.get_json(url + args, headers=self._auth_headers, ttl=ttl)
+
+    """ ORDERS """
+
+    def get_current_orders(self):
+        return self.api.list_orders()
+
+    def _filter_execute_order(self, event: OrderEvent) -> bool:
+        return True
+
+    def _submit_order(self, event: OrderEvent) -> str:
+        side = "buy" if event.direction == OrderPosition.BUY else "sell"
+        try:
+            if event.order_type == OrderType.LIMIT:
+                order = self.api.submit_order(
+                    symbol=event.symbol,
+                    qty=event.quantity,
+                    side=side,
+                    type="limit",
+                    time_in_force="day",
+                    limit_price=event.signal_price,
+                )
+            else:
+                order = self.api.submit_order(
+                    symbol=event.symbol,
+                    qty=event.quantity,
+                    side=side,
+                    type="market",
+                    time_in_force="day",
+                )
+        except alpaca_trade_api.rest.APIError as e:
+            logging.info(
+                f"Status Code [{e.status_code}] {e.code}: {str(e)}\nResponse: {e.response}")
+            raise
+        return order.id
+
+    def _order_status(self, order_id):
+        order = self.api.get_order(order_id)
+        filled_qty = float(order.filled_qty or 0)
+        fill_price = float(order.filled_avg_price) if order.filled_avg_price is not None else None
+        if order.status == "filled" or (order.status in ("canceled", "expired", "rejected") and filled_qty > 0):
+            return FILLED, filled_qty, fill_price
+        elif order.status in ("canceled", "expired", "rejected"):
+            return DEAD, 0, None
+        return OPEN, filled_qty, fill_price
+
+    def execute_order(self, event: OrderEvent) -> bool:
+        """
+        Routes the order asynchronously. FillEvent with the actual fill
+        price is put on the Events Queue once Alpaca reports it filled.
+        """
+        self.router.route(event)
+        return True
+
+    def wait_for_fills(self, timeout=None) -> bool:
+        return self.router.wait(timeout)
+
+    def calculate_commission(self):
+        return 0
+
+    """ PORTFOLIO RELATED """
+
+    def get_positions(self):
+        return self.api.list_positions()
+
+    def get_historical_bars(
+        self, ticker, timeframe, start, end, limit: int = None
+    ) -> pd.DataFrame:
+        assert timeframe in ["1Min", "5Min", "15Min", "day", "1D"]
+        if limit is not None:
+            return self.api.get_barset(
+                ticker, timeframe, start=start, end=end, limit=limit
+            ).df
+        return self.api.get_barset(ticker, timeframe, start=start, end=end).df
+
+    def get_quote(self, ticker):
+        return self.api.get_last_quote(ticker)
@@ -0,0 +1,192 @@
+import logging
+import threading
+
+from ibapi.client import EClient
+from ibapi.contract import Contract
+from ibapi.order import Order
+from ibapi.wrapper import EWrapper
+
+from trading_common.event import FillEvent
+from trading_common.utilities.enum import OrderPosition, OrderType
+from backtest.broker import Broker
+from backtest.utilities.order_router import RateLimiter
+
+
+class OrderIdAllocator(object):
+    """
+    Hands out IB order ids. TWS sends the first valid id through
+    EWrapper.nextValidId once connected; ids increase from there.
+    """
+
+    def __init__(self):
+        self._next_id = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    def set_next(self, order_id: int):
+        with self._lock:
+            if self._next_id is None or order_id > self._next_id:
+                self._next_id = order_id
+        self._ready.set()
+
+    def wait_ready(self, timeout=None) -> bool:
+        return self._ready.wait(timeout)
+
+    def next(self) -> int:
+        with self._lock:
+            order_id = self._next_id
+            self._next_id += 1
+        return order_id
+
+
+class IBBroker(Broker, EWrapper, EClient):
+    # order statuses for which TWS will not fill any further
+    DEAD_STATUSES = ("Cancelled", "ApiCancelled", "Inactive")
+
+    def __init__(self, events, host="127.0.0.1", port=7497, client_id=123, timeout: float = 10):
+        EWrapper.__init__(self)
+        EClient.__init__(self, self)
+        self.events = events
+        self.fill_dict = {}
+        # ids of placed orders that may still fill
+        self._pending = set()
+        self.hist_data = []
+        self._fills_cond = threading.Condition()
+        # TWS disconnects clients sending more than 50 messages/sec, and a
+        # token bucket can send burst + rate messages within one second
+        self.throttle = RateLimiter(40, 1, burst=10)
+        self.order_ids = OrderIdAllocator()
+
+        self.connect(host, port, client_id)
+        self.create_tws_connection()
+        if not self.order_ids.wait_ready(timeout):
+            raise Exception(f"No nextValidId from TWS at {host}:{port} after {timeout}s")
+        self.reqMarketDataType(3)  # DELAYED
+
+    def create_tws_connection(self) -> None:
+        """
+        Starts the EClient message loop in a daemon thread. All EWrapper
+        callbacks below run on that thread.
+        """
+        api_thread = threading.Thread(target=self.run, daemon=True)
+        api_thread.start()
+
+    def sendMsg(self, *args):
+        # every outgoing request passes through here
+        self.throttle.acquire()
+        EClient.sendMsg(self, *args)
+
+    # create a Contract instance and then pair it with an Order instance,
+    # which will be sent to the IB API
+    def create_contract(self, symbol, sec_type, exchange="SMART", currency="USD"):
+        contract = Contract()
+        contract.symbol = symbol
+        contract.secType = sec_type
+        contract.exchange = exchange
+        contract.currency = currency
+        return contract
+
+    # Overwrite EClient.historicalData
+    def historicalData(self, reqId, bar):
+        print(f"Time: {bar.date} Close: {bar.close}")
+        self.hist_data.append([bar.date, bar.close])
+        # if eurusd_contract.symbol in my_td_broker.hist_data.keys():
+        #     my_td_broker.hist_data[eurusd_contract.symbol].append()
+
+    def nextValidId(self, orderId: int):
+        self.order_ids.set_next(orderId)
+
+    def orderStatus(self, orderId, status, filled, remaining, avgFillPrice, *args):
+        with self._fills_cond:
+            fd = self.fill_dict.get(orderId)
+            if fd is None or fd["done"]:
+                return
+            if status == "Filled" and remaining == 0:
+                self.create_fill(orderId, filled, avgFillPrice)
+            elif status in self.DEAD_STATUSES:
+                if filled > 0:
+                    self.create_fill(orderId, filled, avgFillPrice)
+                else:
+                    self._done(orderId)
+                    logging.info(f"Order {orderId} {status}: {fd['order_event'].print_order()}")
+                self._fills_cond.notify_all()
+
+    def error(self, reqId, *args):
+        """
+        older ibapi releases call error(reqId, errorCode, errorString, ...),
+        newer ones error(reqId, errorTime, errorCode, errorString, ...)
+        """
+        errorCode, errorString = (args[0], args[1]) if isinstance(args[1], str) else (args[1], args[2])
+        logging.info(f"TWS error [{errorCode}] reqId {reqId}: {errorString}")
+        with self._fills_cond:
+            fd = self.fill_dict.get(reqId)
+            # 201: order rejected, 202: order cancelled
+            if fd is not None and not fd["done"] and int(errorCode) in (201, 202):
+                self._done(reqId)
+                self._fills_cond.notify_all()
+
+    def _done(self, order_id):
+        """ called with _fills_cond held """
+        self.fill_dict[order_id]["done"] = True
+        self._pending.discard(order_id)
+
+    def create_order(self, order_type, quantity, action, limit_price=None):
+        """
+            order_type - MARKET, LIMIT for Market or Limit orders
+            quantity - Integral number of assets to order
+            action - 'BUY' or 'SELL'
+        """
+        order = Order()
+        order.orderType = "LMT" if order_type == OrderType.LIMIT else "MKT"
+        order.totalQuantity = quantity
+        order.action = action
+        if order_type == OrderType.LIMIT:
+            order.lmtPrice = limit_price
+        return order
+
+    def create_fill(self, order_id, filled, avg_fill_price):
+        """
+        Called from the EWrapper thread with _fills_cond held.
+        """
+        fd = self.fill_dict[order_id]
+        order_event = fd["order_event"]
+        order_event.quantity = filled
+        order_event.trade_price = avg_fill_price
+        self._done(order_id)
+        self.events.put(FillEvent(order_event, self.calculate_commission(filled, avg_fill_price)))
+        self._fills_cond.notify_all()
+
+    def _filter_execute_order(self, event) -> bool:
+        return True
+
+    def execute_order(self, event):
+        if event.type == "ORDER":
+            # Create the Interactive Brokers contract and order via the
+            # passed Order event
+            ib_contract = self.create_contract(event.symbol, "STK")
+            ib_order = self.create_order(
+                event.order_type, event.quantity,
+                "BUY" if event.direction == OrderPosition.BUY else "SELL",
+                event.signal_price)
+
+            order_id = self.order_ids.next()
+            with self._fills_cond:
+                self.fill_dict[order_id] = {"order_event": event, "done": False}
+                self._pending.add(order_id)
+            self.placeOrder(order_id, ib_contract, ib_order)
+            return True
+        return False
+
+    def wait_for_fills(self, timeout=None) -> bool:
+        with self._fills_cond:
+            return self._fills_cond.wait_for(lambda: not self._pending, timeout)
+
+    def calculate_commission(self, quantity, fill_cost):
+        full_cost = 1.3
+        if quantity <= 500:
+            full_cost = max(1.3, 0.013 * quantity)
+        else:
+            full_cost = max(1.3, 0.008 * quantity)
+        full_cost = min(full_cost, 0.005 * quantity * fill_cost)
+
+        return full_cost
@@ -0,0 +1,206 @@
+import json
+import logging
+import os
+
+from trading_common.event import OrderEvent
+from trading_common.utilities.enum import OrderPosition, OrderType
+from backtest.broker import Broker
+from backtest.utilities.http_client import get_client
+from backtest.utilities.order_router import DEAD, FILLED, OPEN, OrderRouter, RateLimiter
+
+
+# not working. Seems like a developer account needs to be created with TDA
+class TDABroker(Broker):
+    def __init__(self, events) -> None:
+        super(TDABroker, self).__init__()
+        self.events = events
+        self.consumer_key = os.environ["TDD_consumer_key"]
+        self.account_id = os.environ["TDA_account_id"]
+        self.access_token = None
+        self.refresh_token = None
+        self.http = get_client()
+        self.router = OrderRouter(
+            self.events, self._submit_order, self._order_status,
+            rate_limiter=RateLimiter(90, 60), poll_limiter=RateLimiter(30, 60), max_workers=16)
+        self.get_token("authorization")
+
+    def _signin_code(self):
+        import selenium
+        from selenium import webdriver
+        from trading_common.utilities.utils import load_credentials, parse_args
+
+        args = parse_args()
+        load_credentials(args.credentials)
+
+        driver = webdriver.Firefox()
+        url = f"https://auth.tdameritrade.com/auth?response_type=code&redirect_uri=http://localhost&client_id={self.consumer_key}@AMER.OAUTHAP"
+        driver.get(url)
+
+        userId = driver.find_element_by_css_selector("#username0")
+        userId.clear()
+        userId.send_keys(os.environ["TDA_username"])
+        pw = driver.find_element_by_css_selector("#password1")
+        pw.clear()
+        pw.send_keys(f"{os.environ['TDA_pw']}")
+        login_button = driver.find_element_by_css_selector("#accept")
+        login_button.click()
+
+        # click accept
+        accept_button = driver.find_element_by_css_selector("#accept")
+        try:
+            accept_button.click()
+        except selenium.common.exceptions.WebDriverException:
+            new_url = driver.current_url
+            code = new_url.split("code=")[1]
+            logging.info("Coded:\n"+code)
+            return code
+        finally:
+            driver.close()
+
+    def get_token(self, grant_type):
+        import urllib
+
+        if grant_type == "authorization":
+            code = self._signin_code()
+            if code is not None:
+                code = urllib.parse.unquote(code)
+                logging.info("Decoded:\n"+code)
+                params = {
+                    "grant_type": "authorization_code",
+                    "access_type": "offline",
+                    "code": code,
+                    "client_id": self.consumer_key,
+                    "redirect_uri": "http://localhost",
+                }
+                headers = {"Content-Type": "application/x-www-form-urlencoded"}
+                res = self.http.post(
+                    r"https://api.tdameritrade.com/v1/oauth2/token",
+                    headers=headers,
+                    data=params,
+                )
+                if res.ok:
+                    res_body = res.json()
+                    logging.info("Obtained access_token & refresh_token")
+                    self.access_token = res_body["access_token"]
+                    self.refresh_token = res_body["refresh_token"]
+                else:
+                    print(res)
+                    print(res.json())
+                    raise Exception(
+                        f"API POST exception: Error {res.status_code}")
+            else:
+                raise Exception("Could not sign in and obtain code")
+        elif grant_type == "refresh":
+            params = {
+                "grant_type": "refresh_token",
+                "refresh_token": self.refresh_token,
+                "client_id": self.consumer_key,
+            }
+            res = self.http.post(
+                r"https://api.tdameritrade.com/v1/oauth2/token",
+                data=params,
+            )
+            if res.ok:
+                res_body = res.json()
+                self.access_token = res_body["access_token"]
+                print(res_body["access_token"])
+            else:
+                print(res.json())
+
+    def get_account_details(self):
+        return self.http.get_json(
+            f"https://api.tdameritrade.com/v1/accounts/{self.account_id}",
+            headers={"Authorization": f"Bearer {self.access_token}"},
+            ttl=5, name="tda.account",
+        )
+
+    def get_quote(self, symbol):
+        return self.http.get_json(
+            f"https://api.tdameritrade.com/v1/marketdata/{symbol}/quotes",
+            params={"apikey": self.consumer_key},
+            ttl=1, name="tda.quote",
+        )
+
+    def calculate_commission(self):
+        return 0
+
+    def _submit_order(self, event: OrderEvent) -> str:
+        data = {
+            "orderType": "MARKET" if event.order_type == OrderType.MARKET else "LIMIT",
+            "session": "NORMAL",
+            "duration": "DAY",
+            "orderStrategyType": "SINGLE",
+            "orderLegCollection": [{
+                "instruction": "BUY" if event.direction == OrderPosition.BUY else "SELL",
+                "quantity": event.quantity,
+                "instrument": {
+                    "symbol": event.symbol,
+                    "assetType": "EQUITY"
+                }
+            }]
+        }
+        if data["orderType"] == "LIMIT":
+            data["price"] = event.signal_price
+        res = self.http.post(
+            f"https://api.tdameritrade.com/v1/accounts/{self.account_id}/orders",
+            data=json.dumps(data),
+            headers={
+                "Authorization": f"Bearer {self.access_token}",
+                "Content-Type": "application/json"
+            }
+        )
+        if not res.ok:
+            raise Exception(f"{res.status_code}\n{res.text}")
+        # order id is only returned in the Location header
+        return res.headers["Location"].rsplit("/", 1)[-1]
+
+    def _order_status(self, order_id):
+        res = self.http.get_json(
+            f"https://api.tdameritrade.com/v1/accounts/{self.account_id}/orders/{order_id}",
+            headers={"Authorization": f"Bearer {self.access_token}"},
+            name="tda.order_status",
+        )
+        legs = [leg for activity in res.get("orderActivityCollection", [])
+                for leg in activity.get("executionLegs", [])]
+        filled_qty = sum(leg["quantity"] for leg in legs)
+        fill_price = sum(leg["quantity"] * leg["price"] for leg in legs) / filled_qty if filled_qty else None
+        if res["status"] == "FILLED" or (res["status"] in ("CANCELED", "REJECTED", "EXPIRED") and filled_qty > 0):
+            return FILLED, filled_qty, fill_price
+        elif res["status"] in ("CANCELED", "REJECTED", "EXPIRED"):
+            return DEAD, 0, None
+        return OPEN, filled_qty, fill_price
+
+    def execute_order(self, event: OrderEvent) -> bool:
+        """
+        Routes the order asynchronously. FillEvent is put on the
+        Events Queue once TDA reports the order as filled.
+        """
+        self.router.route(event)
+        return True
+
+    def wait_for_fills(self, timeout=None) -> bool:
+        return self.router.wait(timeout)
+
+    def cancel_order(self, order_id) -> bool:
+        # NOTE: Unused and only skeleton.
+        # TODO: Implement while improving TDABroker class
+        res = self.http.delete(
+            f"https://api.tdameritrade.com/v1/accounts/{self.account_id}/orders/{order_id}",
+            headers={"Authorization": f"Bearer {self.access_token}"}
+        )
+        if res.ok:
+            return True
+        return False
+
+    def _filter_execute_order(self, event: OrderEvent) -> bool:
+        return True
+
+    def get_past_transactions(self):
+        return self.http.get_json(
+            f"https://api.tdameritrade.com/v1/accounts/{self.account_id}/transactions",
+            params={
+                "type": "ALL",
+            },
+            headers={"Authorization": f"Bearer {self.access_token}"},
+            ttl=30, name="tda.transactions",
+        )
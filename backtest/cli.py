@@ -0,0 +1,288 @@
+"""
+backtest run SPEC [SPEC ...] [-j N] [-c credentials.json] [-r RESULTS_DIR]
+backtest validate SPEC [SPEC ...]
+
+Runs declarative run specs (see backtest.config) instead of editing loop scripts.
+"""
+import argparse
+import contextlib
+import logging
+import os
+import queue
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from backtest.config import build_value, load_spec, read_universe_index, resolve_universe, validate
+
+
+def build_data_handler(spec: dict, symbol_list: list, event_queue, resources: contextlib.ExitStack = None):
+    """
+    resources - stores the handler loads for itself are entered into it, so they
+        are released when it closes. Without it they live as long as the process
+    """
+    data = dict(spec["data"])
+    source = data.pop("source", "csv")
+    start, end = spec["dates"].get("start"), spec["dates"].get("end")
+    live = spec["mode"] == "live"
+    if source == "csv" and "fill" in data:
+        ## a gap policy needs the calendar aligned store, as batches use
+        from backtest.data.shared import SharedBarStore, SharedDataHandler
+        csv_dir = os.path.abspath(data.pop("csv_dir", "data/data/daily"))
+        fill = data.pop("fill")
+        if data:
+            raise Exception(f"data.fill can't be combined with {sorted(data)}")
+        store = SharedBarStore.from_csv(csv_dir, symbol_list, fill=fill)
+        if resources is not None:
+            resources.enter_context(store)
+        index = spec["universe"].get("index")
+        universe = read_universe_index(os.path.abspath(index)) if index else None
+        return SharedDataHandler(event_queue, store, symbol_list, start_date=start, end_date=end,
+                                 universe=universe)
+    elif source == "csv":
+        from trading_common.data.dataHandler import HistoricCSVDataHandler
+        csv_dir = os.path.abspath(data.pop("csv_dir", "data/data/daily"))
+        if end is not None:
+            data["end_date"] = end
+        return HistoricCSVDataHandler(event_queue, csv_dir=csv_dir, symbol_list=symbol_list,
+                                      start_date=start, **data)
+    elif source == "alpaca":
+        from trading_common.data.dataHandler import AlpacaData
+        return AlpacaData(event_queue, symbol_list, live=live, start_date=start, **data)
+    elif source == "tda":
+        from trading_common.data.dataHandler import TDAData
+        return TDAData(event_queue, symbol_list, start, **data)
+    elif source == "shared":
+        from backtest.data.shared import SharedBarStore, SharedDataHandler
+        index = spec["universe"].get("index")
+        universe = read_universe_index(os.path.abspath(index)) if index else None
+        return SharedDataHandler(event_queue, SharedBarStore.attach(data["handle"]), symbol_list,
+                                 start_date=start, end_date=end, universe=universe)
+    elif source == "compact":
+        from backtest.data.compact import CompactBarStore, CompactDataHandler
+        csv_dir = os.path.abspath(data.pop("csv_dir", "data/data/daily"))
+        store = CompactBarStore.from_csv(csv_dir, symbol_list, **data)
+        if resources is not None:
+            resources.enter_context(store)
+        index = spec["universe"].get("index")
+        universe = read_universe_index(os.path.abspath(index)) if index else None
+        return CompactDataHandler(event_queue, store, symbol_list, start_date=start, end_date=end,
+                                  universe=universe)
+    elif source == "stream":
+        from backtest.data.stream import AlpacaStreamFeed, StreamingDataHandler
+        return StreamingDataHandler(event_queue, symbol_list, AlpacaStreamFeed(), **data)
+
+
+def build_broker(spec: dict, bars, port, event_queue, order_queue):
+    if spec["broker"] == "simulated":
+        from backtest.broker import SimulatedBroker
+        return SimulatedBroker(bars, port, event_queue, order_queue)
+    elif spec["broker"] == "alpaca":
+        from backtest.broker import AlpacaBroker
+        return AlpacaBroker(event_queue)
+    elif spec["broker"] == "tda":
+        from backtest.broker import TDABroker
+        return TDABroker(event_queue)
+    elif spec["broker"] == "ib":
+        from backtest.broker import IBBroker
+        return IBBroker(event_queue)
+
+
+def build_run(spec: dict) -> dict:
+    """
+    constructs every component of a validated spec. resources is an ExitStack
+    holding what the run loaded for itself, to be closed once it is done
+    """
+    symbol_list = resolve_universe(spec["universe"], spec["dates"])
+    event_queue = queue.LifoQueue()
+    order_queue = queue.Queue()
+    resources = contextlib.ExitStack()
+    bars = build_data_handler(spec, symbol_list, event_queue, resources)
+    signals = spec.get("signals") or {}
+    if "replay" in signals:
+        from backtest.strategy.replay import ReplayStrategy, SignalRecording
+        strategy = ReplayStrategy(bars, event_queue, SignalRecording.load(signals["replay"]))
+    else:
+        strategy = build_value(spec["strategy"], (bars, event_queue))
+        if "record" in signals:
+            from backtest.strategy.replay import SignalRecorder
+            strategy = SignalRecorder(strategy)
+    portfolio = dict(spec["portfolio"])
+    portfolio.setdefault("kwargs", {})
+    portfolio["kwargs"] = dict(portfolio["kwargs"], portfolio_name=spec["name"])
+    port = build_value(portfolio, (bars, event_queue, order_queue))
+    broker = build_broker(spec, bars, port, event_queue, order_queue)
+    return dict(symbol_list=symbol_list, bars=bars, event_queue=event_queue, order_queue=order_queue,
+                strategy=strategy, port=port, broker=broker, resources=resources)
+
+
+def _results_keys(spec: dict, symbol_list):
+    """
+    config hash and data version of a spec with results, before its universe
+    is resolved and its data moved to shared memory
+    """
+    from backtest.results import config_hash, data_version
+
+    results = spec["results"]
+    results.setdefault("config_hash", config_hash(spec))
+    if "data_version" not in results and spec["data"].get("source", "csv") == "csv":
+        csv_dir = os.path.abspath(spec["data"].get("csv_dir", "data/data/daily"))
+        results["data_version"] = data_version(csv_dir, symbol_list)
+
+
+def run_spec(spec: dict) -> dict:
+    """
+    runs one spec. Returns its name and summary stats, and if the spec has
+    results, the index row of the run (its files are already written) for ResultsStore.add
+    """
+    from backtest.utilities.backtest import backtest
+
+    spec = validate(spec)
+    if spec.get("log"):
+        logging.basicConfig(filename=spec["log"], level=logging.INFO)
+    run = build_run(spec)
+    ## stores the run loaded for itself are released once it is done
+    with run["resources"]:
+        checkpoint = None
+        if spec.get("checkpoint"):
+            from backtest.utilities.checkpoint import Checkpointer
+            checkpoint = Checkpointer(**spec["checkpoint"])
+        cache = None
+        if spec.get("cache") is not None:
+            from backtest.utilities.cache import RunCache
+            cache = RunCache(**spec["cache"])
+        backtest(run["symbol_list"], run["bars"], run["event_queue"], run["order_queue"],
+                 run["strategy"], run["port"], run["broker"],
+                 start_date=spec["dates"].get("start"),
+                 loop_live=spec["mode"] == "live",
+                 checkpoint=checkpoint,
+                 plot=spec["plot"],
+                 cache=cache)
+        if "record" in (spec.get("signals") or {}):
+            run["strategy"].recording.export(spec["signals"]["record"])
+        stats = run["port"].output_summary_stats() if spec["mode"] == "backtest" else []
+        record, results_dir = None, None
+        if spec.get("results") and spec["mode"] == "backtest":
+            from backtest.results import run_record
+            results = spec["results"]
+            record = run_record(results["dir"], run["port"], spec, family=results.get("family"),
+                                config_hash_=results.get("config_hash"), data_version_=results.get("data_version"))
+            results_dir = results["dir"]
+    return {"name": spec["name"], "stats": stats, "record": record, "results_dir": results_dir}
+
+
+def _prepare(specs: list) -> list:
+    """
+    Validates every spec up front and resolves universes once in the parent,
+    so workers get plain symbol lists instead of each re-reading the files.
+    """
+    prepared = []
+    for spec in specs:
+        spec = validate(spec)
+        symbol_list = resolve_universe(spec["universe"], spec["dates"])
+        if spec.get("results"):
+            _results_keys(spec, symbol_list)
+        spec["universe"] = {"symbols": symbol_list, "index": spec["universe"].get("index")}
+        prepared.append(spec)
+    return prepared
+
+
+def _share_csv_data(specs: list) -> list:
+    """
+    Loads the universes of csv specs once per csv_dir (and fill policy) into shared memory and
+    points the specs at it. Returns the stores, to be unlinked after the batch.
+    """
+    from backtest.data.shared import SharedBarStore
+
+    by_dir = {}
+    for spec in specs:
+        if spec["data"].get("source", "csv") == "csv" and set(spec["data"]) <= {"source", "csv_dir", "fill"}:
+            csv_dir = os.path.abspath(spec["data"].get("csv_dir", "data/data/daily"))
+            by_dir.setdefault((csv_dir, spec["data"].get("fill", "ffill")), []).append(spec)
+    stores = []
+    for (csv_dir, fill), dir_specs in by_dir.items():
+        symbols = [s for spec in dir_specs for s in spec["universe"]["symbols"]]
+        store = SharedBarStore.from_csv(csv_dir, symbols, fill=fill)
+        stores.append(store)
+        for spec in dir_specs:
+            spec["data"] = {"source": "shared", "handle": store.handle()}
+    return stores
+
+
+def _record_results(results) -> list:
+    """
+    Adds the runs' index rows to their ResultsStores as they finish.
+    Workers write the Parquet files, rows go in batched transactions.
+    """
+    from backtest.results import ResultsStore
+
+    stores = {}
+    done = []
+    try:
+        for result in results:
+            if result["record"] is not None:
+                root = result["results_dir"]
+                if root not in stores:
+                    stores[root] = ResultsStore(root)
+                stores[root].add(result["record"])
+            done.append(result)
+    finally:
+        for store in stores.values():
+            store.close()
+    return done
+
+
+def run_batch(specs: list, parallelism: int = 1) -> list:
+    specs = _prepare(specs)
+    if parallelism <= 1 or len(specs) == 1:
+        return _record_results(run_spec(spec) for spec in specs)
+    stores = _share_csv_data(specs)
+    try:
+        with ProcessPoolExecutor(max_workers=parallelism) as pool:
+            return _record_results(pool.map(run_spec, specs))
+    finally:
+        for store in stores:
+            store.unlink()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="backtest", description="Run backtests from run specs")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="run one or more specs")
+    run.add_argument("specs", nargs="+", help="YAML / TOML / JSON run specs")
+    run.add_argument("-j", "--parallelism", type=int, default=1, help="specs to run concurrently")
+    run.add_argument("-c", "--credentials", type=str, default=None, help="filepath to credentials.json")
+    run.add_argument("-r", "--results", type=str, default=None,
+                     help="ResultsStore directory for specs without their own 'results'")
+    check = sub.add_parser("validate", help="validate specs without running them")
+    check.add_argument("specs", nargs="+")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    specs = [load_spec(fp) for fp in args.specs]
+    if args.command == "validate":
+        failed = False
+        for fp, spec in zip(args.specs, specs):
+            try:
+                validate(spec)
+                print(f"{fp}: ok")
+            except Exception as e:
+                print(f"{fp}: {e}")
+                failed = True
+        sys.exit(1 if failed else 0)
+
+    if args.credentials is not None:
+        from trading_common.utilities.utils import load_credentials
+        load_credentials(args.credentials)
+    if args.results is not None:
+        for spec in specs:
+            spec.setdefault("results", args.results)
+    for result in run_batch(specs, args.parallelism):
+        print(result["name"])
+        for stat, value in result["stats"]:
+            print(f"  {stat}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""
+Declarative run specifications.
+
+A run spec is a YAML / TOML / JSON file (or dict) describing one run:
+
+    name: loop
+    mode: backtest                  # backtest | live
+    universe:
+      files: [data/dow_stock_list.txt, data/snp500.txt]
+      symbols: [DUK, JPM]           # added to the files
+      index: data/universe.csv      # optional point-in-time membership (symbol,start,end),
+                                    # keeps symbols that are members during the dates
+      sample: 45                    # optional random sample of the universe
+      seed: 0
+    dates: {start: "2017-01-05", end: null}
+    data:
+      source: csv                   # csv | alpaca | tda | stream | shared | compact
+      csv_dir: data/data/daily
+      fill: ffill                   # optional gap policy, see trading_calendar.FILL_POLICIES.
+                                    # Runs with one read a calendar aligned SharedBarStore
+    strategy:
+      class: MultipleAllStrategy
+      inject: false                 # takes only the list, its strategies get (bars, events)
+      args:
+        - - class: BoundedTA
+            args: [10, 20, -95, 150, {ref: talib.CCI}]
+            kwargs: {ta_indicator_type: {ref: trading_common.strategy.ta.TAIndicatorType.ThreeArgs}}
+    portfolio:
+      class: PercentagePortFolio
+      kwargs: {percentage: 0.15, mode: asset, expires: 7, rebalance: {ref: BaseRebalance}}
+    broker: simulated               # simulated | alpaca | tda | ib
+    results: results                # optional ResultsStore directory (backtest.results),
+                                    # or {dir: results, family: BoundedTA}
+    checkpoint: {path: loop.ckpt, every_n_bars: 250}   # optional Checkpointer (backtest.utilities.checkpoint),
+                                                       # or every_seconds for live sessions
+    cache: {path: cache/runs, max_bytes: 1073741824}   # optional RunCache (backtest.utilities.cache)
+    signals: {record: signals.parquet}   # optional, or {replay: signals.parquet} to skip the
+                                         # strategy (backtest.strategy.replay)
+
+Components are {"class": name, "args": [...], "kwargs": {...}}. Strategies
+get (bars, events) and portfolios (bars, events, order_queue) prepended to
+their args, as do the components nested in them, unless they set
+"inject": false. Composites that only take other components (COMPOSITE_CLASSES)
+default to false. {"ref": name} resolves to an object (class, function, enum
+member) without calling it. Names are dotted paths or a class name from
+COMPONENT_MODULES.
+
+data.source "shared" reads from a SharedBarStore (backtest.data.shared)
+given by data.handle. Batches set it up themselves for csv specs.
+data.source "compact" loads csv_dir into a CompactBarStore (backtest.data.compact),
+taking price_dtype, volume_dtype, decimals, memory_budget and spill_dir.
+"""
+import copy
+import functools
+import importlib
+import json
+import os
+import random
+
+import pandas as pd
+
+MODES = ("backtest", "live")
+DATA_SOURCES = ("csv", "alpaca", "tda", "stream", "shared", "compact")
+BROKERS = ("simulated", "alpaca", "tda", "ib")
+CHECKPOINT_KEYS = {"path", "every_n_bars", "every_seconds"}
+SPEC_KEYS = {"name", "mode", "universe", "dates", "data", "strategy", "portfolio",
+             "broker", "checkpoint", "plot", "log", "results", "cache", "signals"}
+
+## modules searched for bare class names
+COMPONENT_MODULES = [
+    "backtest.strategy.naive",
+    "backtest.strategy.fundamental",
+    "backtest.portfolio.portfolio",
+    "backtest.portfolio.strategy",
+    "backtest.portfolio.rebalance",
+    "trading_common.strategy.ta",
+    "trading_common.strategy.multiple",
+    "trading_common.strategy.naive",
+]
+## classes built from their args only, without the (bars, events, ...) prefix
+COMPOSITE_CLASSES = ("MultipleAllStrategy", "MultipleAnyStrategy")
+
+
+def resolve(name: str):
+    """ dotted path (module.attr.attr...) or bare name from COMPONENT_MODULES to an object """
+    if "." not in name:
+        for module_name in COMPONENT_MODULES:
+            try:
+                module = importlib.import_module(module_name)
+            except ImportError:
+                continue
+            if hasattr(module, name):
+                return getattr(module, name)
+        raise Exception(f"Cannot resolve '{name}' in {COMPONENT_MODULES}")
+    parts = name.split(".")
+    for i in range(len(parts) - 1, 0, -1):
+        try:
+            obj = importlib.import_module(".".join(parts[:i]))
+        except ImportError:
+            continue
+        for attr in parts[i:]:
+            obj = getattr(obj, attr)
+        return obj
+    raise Exception(f"Cannot resolve '{name}'")
+
+
+def load_spec(fp: str) -> dict:
+    """ reads a run spec from .yaml/.yml, .toml or .json """
+    ext = os.path.splitext(fp)[1].lower()
+    if ext in (".yaml", ".yml"):
+        import yaml
+        with open(fp, "r") as f:
+            spec = yaml.safe_load(f)
+    elif ext == ".toml":
+        try:
+            import tomllib
+        except ImportError:  # python < 3.11
+            import tomli as tomllib
+        with open(fp, "rb") as f:
+            spec = tomllib.load(f)
+    elif ext == ".json":
+        with open(fp, "r") as f:
+            spec = json.load(f)
+    else:
+        raise Exception(f"Unknown run spec format: {fp}")
+    spec.setdefault("name", os.path.splitext(os.path.basename(fp))[0])
+    return spec
+
+
+def _check_component(component, where: str, errors: list):
+    if isinstance(component, dict) and "ref" in component:
+        try:
+            resolve(component["ref"])
+        except Exception as e:
+            errors.append(f"{where}: {e}")
+        return
+    if not isinstance(component, dict) or "class" not in component:
+        errors.append(f"{where}: expected a mapping with a 'class' key")
+        return
+    if not isinstance(component.get("inject", True), bool):
+        errors.append(f"{where}.inject: must be true or false")
+    try:
+        resolve(component["class"])
+    except Exception as e:
+        errors.append(f"{where}: {e}")
+    for i, arg in enumerate(component.get("args", [])):
+        _check_values(arg, f"{where}.args[{i}]", errors)
+    for k, v in component.get("kwargs", {}).items():
+        _check_values(v, f"{where}.kwargs.{k}", errors)
+
+
+def _check_values(value, where: str, errors: list):
+    if isinstance(value, dict) and ("class" in value or "ref" in value):
+        _check_component(value, where, errors)
+    elif isinstance(value, list):
+        for i, v in enumerate(value):
+            _check_values(v, f"{where}[{i}]", errors)
+
+
+def validate(spec: dict) -> dict:
+    """ fills defaults and raises one Exception listing every problem found """
+    spec = copy.deepcopy(spec)
+    errors = []
+    unknown = set(spec) - SPEC_KEYS
+    if unknown:
+        errors.append(f"unknown keys: {sorted(unknown)}")
+    spec.setdefault("name", "run")
+    spec.setdefault("mode", "backtest")
+    spec.setdefault("broker", "simulated")
+    spec.setdefault("plot", False)
+    spec.setdefault("data", {"source": "csv"})
+    spec.setdefault("dates", {})
+    if spec["mode"] not in MODES:
+        errors.append(f"mode: must be one of {MODES}")
+    if spec["broker"] not in BROKERS:
+        errors.append(f"broker: must be one of {BROKERS}")
+    if spec["data"].get("source", "csv") not in DATA_SOURCES:
+        errors.append(f"data.source: must be one of {DATA_SOURCES}")
+    if isinstance(spec.get("results"), str):
+        spec["results"] = {"dir": spec["results"]}
+    if spec.get("results") is not None and not spec["results"].get("dir"):
+        errors.append("results: needs a 'dir'")
+
+    universe = spec.get("universe")
+    if not isinstance(universe, dict) or not (universe.get("files") or universe.get("symbols")
+                                              or universe.get("index")):
+        errors.append("universe: needs 'files', 'symbols' and/or 'index'")
+    else:
+        for fp in universe.get("files", []):
+            if not os.path.exists(fp):
+                errors.append(f"universe.files: {fp} does not exist")
+        if universe.get("index") and not os.path.exists(universe["index"]):
+            errors.append(f"universe.index: {universe['index']} does not exist")
+
+    for key in ("start", "end"):
+        if spec["dates"].get(key) is not None:
+            try:
+                pd.Timestamp(spec["dates"][key])
+            except ValueError:
+                errors.append(f"dates.{key}: '{spec['dates'][key]}' is not a date")
+    if spec["mode"] == "backtest" and spec["dates"].get("start") is None:
+        errors.append("dates.start: required for backtests")
+
+    checkpoint = spec.get("checkpoint")
+    if checkpoint is not None:
+        if not isinstance(checkpoint, dict) or not checkpoint.get("path"):
+            errors.append("checkpoint: needs a 'path'")
+        else:
+            if set(checkpoint) - CHECKPOINT_KEYS:
+                errors.append(f"checkpoint: unknown keys {sorted(set(checkpoint) - CHECKPOINT_KEYS)}")
+            for key in ("every_n_bars", "every_seconds"):
+                value = checkpoint.get(key)
+                if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))
+                                          or value <= 0):
+                    errors.append(f"checkpoint.{key}: must be a positive number")
+
+    signals = spec.get("signals")
+    if signals is not None:
+        if set(signals) not in ({"record"}, {"replay"}):
+            errors.append("signals: needs one of 'record' or 'replay'")
+        elif "replay" in signals and not os.path.exists(signals["replay"]):
+            errors.append(f"signals.replay: {signals['replay']} does not exist")
+    replay = signals is not None and "replay" in signals
+    for key in ("strategy", "portfolio"):
+        if key == "strategy" and replay and key not in spec:
+            continue
+        if key not in spec:
+            errors.append(f"{key}: required")
+        else:
+            _check_component(spec[key], key, errors)
+
+    if errors:
+        raise Exception(f"Invalid run spec '{spec['name']}':\n  " + "\n  ".join(errors))
+    return spec
+
+
+@functools.lru_cache(maxsize=None)
+def read_universe_file(fp: str) -> tuple:
+    """ symbols in a universe file, read once per process """
+    with open(fp, "r") as fin:
+        return tuple(line.strip() for line in fin if line.strip())
+
+
+@functools.lru_cache(maxsize=None)
+def read_universe_index(fp: str):
+    from backtest.data.universe import UniverseIndex
+    return UniverseIndex.from_csv(fp)
+
+
+def resolve_universe(universe: dict, dates: dict = None) -> list:
+    """
+    Symbols of the files and symbols lists. With an index, symbols that are
+    never members between dates start and end are dropped, and if there are
+    no files or symbols every member in that window is taken.
+    """
+    symbols = []
+    for fp in universe.get("files", []):
+        symbols += read_universe_file(os.path.abspath(fp))
+    symbols += universe.get("symbols", [])
+    if universe.get("index"):
+        dates = dates or {}
+        members = read_universe_index(os.path.abspath(universe["index"])).ever_active(
+            dates.get("start"), dates.get("end"))
+        if symbols:
+            members = set(members)
+            symbols = [s for s in symbols if s in members]
+        else:
+            symbols = members
+    symbols = list(dict.fromkeys(symbols))  # drop duplicates, keep order
+    if universe.get("sample") is not None:
+        rng = random.Random(universe.get("seed"))
+        symbols = rng.sample(symbols, min(universe["sample"], len(symbols)))
+    return symbols
+
+
+def injects(component: dict) -> bool:
+    """ whether a component gets the prefix args, see "inject" in the module docstring """
+    default = component["class"].split(".")[-1] not in COMPOSITE_CLASSES
+    return component.get("inject", default)
+
+
+def build_value(value, prefix_args: tuple = ()):
+    """
+    Instantiates {"class": ...} (with prefix_args prepended unless it sets
+    "inject": false), resolves {"ref": ...} and recurses into lists.
+    Other values are returned as is.
+    """
+    if isinstance(value, dict) and "ref" in value:
+        return resolve(value["ref"])
+    if isinstance(value, dict) and "class" in value:
+        cls = resolve(value["class"])
+        args = [build_value(a, prefix_args) for a in value.get("args", [])]
+        kwargs = dict((k, build_value(v, prefix_args)) for k, v in value.get("kwargs", {}).items())
+        prefix = prefix_args if injects(value) else ()
+        return cls(*prefix, *args, **kwargs)
+    if isinstance(value, list):
+        return [build_value(v, prefix_args) for v in value]
+    return value
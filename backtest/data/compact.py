@@ -0,0 +1,345 @@
+"""
+Memory-lean bar store for large universes in one process.
+
+Compared to a DataFrame per symbol (float64 / object columns and a string
+or datetime index each), CompactBarStore keeps
+    - one int64 epoch ns timestamp array, the TradingCalendar every symbol is aligned to
+    - per symbol only the rows from its first to its last bar: open / high /
+      low / close as price_dtype (float32 by default, rounded to `decimals`),
+      volume as volume_dtype (uint32 / uint64) and a bool mask of real bars
+    - symbols as interned strings with an integer id (symbol_idx)
+
+The closes and the real bar mask of every symbol are also kept as (time x
+symbol) columns, built on first use, so the cross-section of a bar is one
+row read instead of a lookup per symbol.
+
+memory_budget (bytes) bounds what stays in RAM, columns included: once the
+resident arrays take more, the least recently used symbols are written to
+spill_dir and read back through memory-mapped files, so the OS pages them
+in as needed, and the columns go last. Spill files are written once, and
+spilled arrays are loaded back into RAM, most recently used first, whenever
+they fit in the budget again (a symbol as soon as it is read). memory_report()
+gives the bytes used per symbol, its share of the columns included.
+
+CompactDataHandler replays a store like SharedDataHandler does; reads
+return float64 copies, so strategies (eg. talib) get the usual dtypes.
+"""
+import os
+import shutil
+import sys
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from backtest.data.shared import SharedDataHandler, _read_csv
+from backtest.data.store import BAR_FIELDS
+from backtest.data.trading_calendar import TradingCalendar
+
+PRICE_DTYPES = (np.float32, np.float64)
+VOLUME_DTYPES = (np.uint32, np.uint64)
+PRICE_FIELDS = BAR_FIELDS[:4]
+ENTRY_ARRAYS = ("prices", "volume", "real")
+
+
+class CompactBarStore(object):
+    def __init__(self, calendar: TradingCalendar, price_dtype=np.float32, volume_dtype=np.uint64,
+                 decimals: int = None, memory_budget: int = None, spill_dir: str = None):
+        if np.dtype(price_dtype) not in [np.dtype(d) for d in PRICE_DTYPES]:
+            raise Exception(f"price_dtype has to be one of {PRICE_DTYPES}")
+        if np.dtype(volume_dtype) not in [np.dtype(d) for d in VOLUME_DTYPES]:
+            raise Exception(f"volume_dtype has to be one of {VOLUME_DTYPES}")
+        self.calendar = calendar
+        self.timestamps = calendar.timestamps
+        self.price_dtype = np.dtype(price_dtype)
+        self.volume_dtype = np.dtype(volume_dtype)
+        self.decimals = decimals
+        self.memory_budget = memory_budget
+        self._own_spill_dir = spill_dir is None
+        self.spill_dir = spill_dir
+        self.symbol_list = []
+        self.symbol_idx = {}
+        ## symbol -> {"start", "prices", "volume", "real"}, least recently used first
+        self._bars = OrderedDict()
+        self._spilled = set()
+        self.first_valid = np.zeros(0, dtype=np.int64)
+        ## (close, real) as (time x symbol) arrays, None until columns() builds them
+        self._columns = None
+        self.columns_spilled = False
+        ## bytes of the arrays in RAM
+        self._resident = 0
+
+    @classmethod
+    def from_csv(cls, csv_dir, symbol_list, fill: str = "ffill", **kwargs):
+        """ loads {csv_dir}/{symbol}.csv, aligned to the union of their dates """
+        symbol_list = list(dict.fromkeys(symbol_list))
+        store = cls(TradingCalendar.from_csv_dir(csv_dir, symbol_list), **kwargs)
+        for symbol in symbol_list:
+            store.add(symbol, _read_csv(csv_dir, symbol), fill)
+        return store
+
+    def add(self, symbol, df: pd.DataFrame, fill: str = "ffill"):
+        """ aligns one symbol's bars to the calendar and keeps the rows from its first to its last price """
+        values, real = self.calendar.align(df, fill)
+        priced = np.flatnonzero(~np.isnan(values[:, BAR_FIELDS.index("close")]))
+        start, stop = (int(priced[0]), int(priced[-1]) + 1) if len(priced) > 0 else (len(real), len(real))
+        prices = values[start:stop, :len(PRICE_FIELDS)]
+        if self.decimals is not None:
+            prices = np.round(prices, self.decimals)
+        volume = np.nan_to_num(values[start:stop, BAR_FIELDS.index("volume")])
+        if len(volume) > 0 and (volume.min() < 0 or volume.max() > np.iinfo(self.volume_dtype).max):
+            raise Exception(f"{symbol}: volume does not fit in {self.volume_dtype}")
+
+        symbol = sys.intern(str(symbol))
+        if symbol not in self.symbol_idx:
+            self.symbol_idx[symbol] = len(self.symbol_list)
+            self.symbol_list.append(symbol)
+            self.first_valid = np.append(self.first_valid, start)
+        else:
+            self.first_valid[self.symbol_idx[symbol]] = start
+            self._forget(symbol)
+        self._bars[symbol] = {
+            "start": start,
+            "prices": np.ascontiguousarray(prices, dtype=self.price_dtype),
+            "volume": volume.astype(self.volume_dtype),
+            "real": real[start:stop].copy(),
+        }
+        self._resident += self._nbytes(self._bars[symbol])
+        self._bars.move_to_end(symbol)
+        self._drop_columns()
+        self._enforce_budget()
+
+    @staticmethod
+    def _nbytes(entry: dict) -> int:
+        return sum(entry[name].nbytes for name in ENTRY_ARRAYS)
+
+    def _columns_nbytes(self) -> int:
+        return sum(col.nbytes for col in self._columns) if self._columns is not None else 0
+
+    def resident_bytes(self) -> int:
+        return self._resident
+
+    def _spill_file(self, name: str) -> str:
+        return os.path.join(self.spill_dir, f"{name}.npy")
+
+    def _to_disk(self, name: str, arr: np.ndarray) -> np.ndarray:
+        """ arr as a read-only memory map of its spill file, written the first time only """
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix="bars_")
+        os.makedirs(self.spill_dir, exist_ok=True)
+        fp = self._spill_file(name)
+        if not os.path.exists(fp):
+            np.save(fp, arr)
+        return np.load(fp, mmap_mode="r")
+
+    def _remove_files(self, names):
+        if self.spill_dir is None:
+            return
+        for name in names:
+            if os.path.exists(self._spill_file(name)):
+                os.remove(self._spill_file(name))
+
+    def _forget(self, symbol):
+        """ drops the old bars of a symbol that is added again """
+        if symbol in self._spilled:
+            self._spilled.discard(symbol)
+        else:
+            self._resident -= self._nbytes(self._bars[symbol])
+        self._remove_files(f"{self.symbol_idx[symbol]}_{name}" for name in ENTRY_ARRAYS)
+
+    def _drop_columns(self):
+        if self._columns is not None and not self.columns_spilled:
+            self._resident -= self._columns_nbytes()
+        self._columns = None
+        self.columns_spilled = False
+        self._remove_files(("columns_close", "columns_real"))
+
+    def _spill(self, symbol):
+        entry = self._bars[symbol]
+        self._resident -= self._nbytes(entry)
+        for name in ENTRY_ARRAYS:
+            entry[name] = self._to_disk(f"{self.symbol_idx[symbol]}_{name}", entry[name])
+        self._spilled.add(symbol)
+
+    def _load(self, symbol):
+        entry = self._bars[symbol]
+        for name in ENTRY_ARRAYS:
+            entry[name] = np.array(entry[name])
+        self._spilled.discard(symbol)
+        self._resident += self._nbytes(entry)
+
+    def _fits(self, nbytes: int) -> bool:
+        return self.memory_budget is None or self._resident + nbytes <= self.memory_budget
+
+    def _enforce_budget(self):
+        """ spills least recently used symbols, then the columns, until the budget holds """
+        if self.memory_budget is None:
+            return
+        for symbol in list(self._bars):
+            if self._resident <= self.memory_budget:
+                return
+            if symbol not in self._spilled and self._nbytes(self._bars[symbol]) > 0:
+                self._spill(symbol)
+        if self._resident > self.memory_budget and self._columns is not None and not self.columns_spilled:
+            self._resident -= self._columns_nbytes()
+            self._columns = (self._to_disk("columns_close", self._columns[0]),
+                             self._to_disk("columns_real", self._columns[1]))
+            self.columns_spilled = True
+
+    def set_memory_budget(self, memory_budget: int = None):
+        """ spills or loads back arrays to fit a new budget, the columns and most recently used symbols first """
+        self.memory_budget = memory_budget
+        self._enforce_budget()
+        if self.columns_spilled and self._fits(self._columns_nbytes()):
+            self._columns = (np.array(self._columns[0]), np.array(self._columns[1]))
+            self.columns_spilled = False
+            self._resident += self._columns_nbytes()
+        for symbol in reversed(list(self._bars)):
+            if symbol in self._spilled and self._fits(self._nbytes(self._bars[symbol])):
+                self._load(symbol)
+
+    def _entry(self, symbol) -> dict:
+        self._bars.move_to_end(symbol)
+        if symbol in self._spilled and self._fits(self._nbytes(self._bars[symbol])):
+            self._load(symbol)
+        return self._bars[symbol]
+
+    def rows(self, symbol, lo: int, hi: int) -> tuple:
+        """
+        (values, real) of calendar rows lo:hi as a float64 (rows x BAR_FIELDS)
+        array, NaN outside the symbol's bars
+        """
+        entry = self._entry(symbol)
+        values = np.full((max(hi - lo, 0), len(BAR_FIELDS)), np.nan)
+        real = np.zeros(len(values), dtype=bool)
+        start = entry["start"]
+        a, b = max(lo, start), min(hi, start + len(entry["real"]))
+        if b > a:
+            values[a - lo:b - lo, :len(PRICE_FIELDS)] = entry["prices"][a - start:b - start]
+            values[a - lo:b - lo, len(PRICE_FIELDS)] = entry["volume"][a - start:b - start]
+            real[a - lo:b - lo] = entry["real"][a - start:b - start]
+            ## gaps left unfilled have no volume either
+            values[np.isnan(values[:, BAR_FIELDS.index("close")]), len(PRICE_FIELDS)] = np.nan
+        return values, real
+
+    def field(self, symbol, lo: int, hi: int, field: str) -> np.ndarray:
+        """ one field of calendar rows lo:hi as float64, NaN outside the symbol's bars """
+        entry = self._entry(symbol)
+        out = np.full(max(hi - lo, 0), np.nan)
+        start = entry["start"]
+        a, b = max(lo, start), min(hi, start + len(entry["real"]))
+        if b > a:
+            if field == "volume":
+                out[a - lo:b - lo] = entry["volume"][a - start:b - start]
+                out[a - lo:b - lo][np.isnan(entry["prices"][a - start:b - start, PRICE_FIELDS.index("close")])] = np.nan
+            else:
+                out[a - lo:b - lo] = entry["prices"][a - start:b - start, PRICE_FIELDS.index(field)]
+        return out
+
+    def columns(self) -> tuple:
+        """ (close, real) of every symbol as (time x symbol) arrays ordered like symbol_list """
+        if self._columns is None:
+            close = np.full((len(self.timestamps), len(self.symbol_list)), np.nan, dtype=self.price_dtype)
+            real = np.zeros(close.shape, dtype=bool)
+            for idx, symbol in enumerate(self.symbol_list):
+                entry = self._bars[symbol]
+                start, stop = entry["start"], entry["start"] + len(entry["real"])
+                close[start:stop, idx] = entry["prices"][:, PRICE_FIELDS.index("close")]
+                real[start:stop, idx] = entry["real"]
+            self._columns = (close, real)
+            self._resident += self._columns_nbytes()
+            self._enforce_budget()
+        return self._columns
+
+    def is_real(self, symbol, row: int) -> bool:
+        entry = self._entry(symbol)
+        i = row - entry["start"]
+        return bool(entry["real"][i]) if 0 <= i < len(entry["real"]) else False
+
+    def memory_report(self) -> pd.DataFrame:
+        """
+        rows and bytes per symbol, and whether they are in RAM or spilled to
+        disk. column_bytes is the symbol's share of the columns, which
+        columns_spilled tells about
+        """
+        column_bytes = self._columns_nbytes() // max(len(self.symbol_list), 1)
+        report = pd.DataFrame([{
+            "symbol": symbol,
+            "rows": len(entry["real"]),
+            "price_bytes": entry["prices"].nbytes,
+            "volume_bytes": entry["volume"].nbytes,
+            "mask_bytes": entry["real"].nbytes,
+            "column_bytes": column_bytes,
+            "bytes": self._nbytes(entry) + column_bytes,
+            "spilled": symbol in self._spilled,
+        } for symbol, entry in ((s, self._bars[s]) for s in self.symbol_list)],
+            columns=["symbol", "rows", "price_bytes", "volume_bytes", "mask_bytes", "column_bytes", "bytes",
+                     "spilled"])
+        return report.set_index("symbol")
+
+    def nbytes(self) -> int:
+        """ bytes of every symbol's bars plus the shared timestamps and columns, resident or not """
+        return self.timestamps.nbytes + self._columns_nbytes() + \
+            sum(self._nbytes(entry) for entry in self._bars.values())
+
+    def close(self):
+        """ drops the memory maps and removes spill files of a temporary spill_dir """
+        self._bars.clear()
+        self._spilled.clear()
+        self._columns = None
+        self.columns_spilled = False
+        self._resident = 0
+        if self._own_spill_dir and self.spill_dir is not None:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CompactDataHandler(SharedDataHandler):
+    """
+    SharedDataHandler over a CompactBarStore. Same replay, accessors and
+    universe handling, but bars are read per symbol and returned as float64
+    copies. Closes and the bar mask come from the store's columns.
+    """
+
+    def get_latest_bars(self, symbol, N=1):
+        start = max(self._cursor - N, self._first[symbol])
+        end = max(self._cursor, start)
+        values, _ = self.store.rows(symbol, start, end)
+        bars = {"datetime": pd.to_datetime(self.store.timestamps[start:end])}
+        for idx, field in enumerate(BAR_FIELDS):
+            bars[field] = values[:, idx]
+        return bars
+
+    def latest_field(self, field: str = "close") -> np.ndarray:
+        row = self._cursor - 1
+        if field == "close":
+            return self.store.columns()[0][row, self._rows].astype(np.float64)
+        return np.array([self.store.field(s, row, row + 1, field)[0] for s in self.symbol_list])
+
+    def bar_mask(self) -> np.ndarray:
+        return self.store.columns()[1][self._cursor - 1, self._rows]
+
+    def latest_window(self, N: int, field: str = "close") -> np.ndarray:
+        window = np.full((len(self.symbol_list), N), np.nan)
+        start = max(self._cursor - N, self._start)
+        if self._cursor > start:
+            if field == "close":
+                close = self.store.columns()[0]
+                window[:, N - (self._cursor - start):] = close[start:self._cursor, self._rows].T
+            else:
+                for idx, symbol in enumerate(self.symbol_list):
+                    window[idx, N - (self._cursor - start):] = self.store.field(symbol, start, self._cursor, field)
+        return window
+
+    def arrays(self) -> dict:
+        arrays = {"datetime": np.array(self.store.timestamps[self._start:self._end])}
+        for field in BAR_FIELDS:
+            arrays[field] = np.ascontiguousarray(np.stack(
+                [self.store.field(s, self._start, self._end, field) for s in self.symbol_list], axis=1))
+        return arrays
@@ -0,0 +1,147 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from backtest.utilities.http_client import get_client
+from backtest.utilities.order_router import RateLimiter
+
+FMP_BASE_URL = "https://financialmodelingprep.com/api/v3/"
+DEFAULT_DB = os.path.join(os.path.dirname(__file__), "..", "..", "data", "metadata.db")
+## columns that can be looked up one symbol at a time
+PROFILE_FIELDS = ("sector", "industry", "market_cap", "country")
+
+
+class MetadataService(object):
+    """
+    Company profiles (sector, industry, market cap, ...) from FMP, cached per
+    symbol in SQLite with a TTL. Only missing or stale profiles are downloaded,
+    concurrently and within the FMP rate limit.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB, ttl_days: float = 7, api_key: str = None,
+                 max_workers: int = 8, rate_limiter: RateLimiter = None):
+        self.ttl = ttl_days * 24 * 60 * 60
+        self.api_key = api_key if api_key is not None else os.environ.get("FMP_API")
+        self.max_workers = max_workers
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter(300, 60)
+        self.http = get_client()
+        self._lock = threading.Lock()
+        # symbol -> error of the profiles the last refresh() couldn't download
+        self.failed = {}
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS profiles (
+                symbol TEXT PRIMARY KEY,
+                fetched_at REAL NOT NULL,
+                sector TEXT,
+                industry TEXT,
+                market_cap REAL,
+                country TEXT,
+                profile TEXT
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_sector ON profiles (sector)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_industry ON profiles (industry)")
+        self.conn.commit()
+
+    def _fetch(self, symbol):
+        """ (symbol, profile, None), or (symbol, None, error) instead of raising """
+        try:
+            self.rate_limiter.acquire()
+            res = self.http.get(FMP_BASE_URL + f"profile/{symbol}", params={"apikey": self.api_key},
+                                name="fmp.profile")
+            if not res.ok:
+                return symbol, None, f"{res.status_code} {res.text}"
+            body = res.json()
+            return symbol, (body[0] if len(body) > 0 else {}), None
+        except Exception as e:
+            return symbol, None, str(e)
+
+    def stale_symbols(self, symbol_list) -> list:
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            fresh = {row[0] for row in self.conn.execute(
+                "SELECT symbol FROM profiles WHERE fetched_at >= ?", (cutoff,))}
+        return [sym for sym in symbol_list if sym not in fresh]
+
+    def refresh(self, symbol_list, force: bool = False) -> int:
+        """
+        downloads profiles that are missing or older than the ttl. Returns the
+        number fetched; the symbols that failed are in self.failed with their error
+        """
+        to_fetch = list(symbol_list) if force else self.stale_symbols(symbol_list)
+        self.failed = {}
+        if len(to_fetch) == 0:
+            return 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            results = list(pool.map(self._fetch, to_fetch))
+        now = time.time()
+        rows = [
+            (sym, now, p.get("sector"), p.get("industry"), p.get("mktCap"), p.get("country"), json.dumps(p))
+            for sym, p, _ in results if p is not None
+        ]
+        self.failed = dict((sym, error) for sym, p, error in results if p is None)
+        if self.failed:
+            logging.info(f"FMP profile failed for {len(self.failed)} symbols: {self.failed}")
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self.conn.commit()
+        return len(rows)
+
+    def lookup(self, symbol_list=None) -> pd.DataFrame:
+        """ sector, industry, market_cap and country indexed by symbol """
+        query = "SELECT symbol, sector, industry, market_cap, country FROM profiles"
+        params = ()
+        if symbol_list is not None:
+            symbol_list = list(symbol_list)
+            query += f" WHERE symbol IN ({','.join('?' * len(symbol_list))})"
+            params = tuple(symbol_list)
+        with self._lock:
+            df = pd.read_sql_query(query, self.conn, params=params)
+        return df.set_index("symbol")
+
+    def profile(self, symbol) -> dict:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT profile FROM profiles WHERE symbol = ?", (symbol,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def sector(self, symbol):
+        return self._field(symbol, "sector")
+
+    def industry(self, symbol):
+        return self._field(symbol, "industry")
+
+    def market_cap(self, symbol):
+        return self._field(symbol, "market_cap")
+
+    def _field(self, symbol, field):
+        if field not in PROFILE_FIELDS:
+            raise Exception(f"Unknown profile field {field}, has to be one of {PROFILE_FIELDS}")
+        with self._lock:
+            row = self.conn.execute(
+                f"SELECT {field} FROM profiles WHERE symbol = ?", (symbol,)).fetchone()
+        return row[0] if row is not None else None
+
+    def group_by(self, field: str, symbol_list=None) -> dict:
+        """ field ('sector' | 'industry') -> list of symbols, for sector-neutral portfolios """
+        df = self.lookup(symbol_list).dropna(subset=[field])
+        return {k: list(v) for k, v in df.groupby(field).groups.items()}
+
+    def screen(self, symbol_list=None, min_market_cap: float = None, sectors=None, country: str = None) -> list:
+        """ symbols passing the filters, for universe construction """
+        df = self.lookup(symbol_list)
+        mask = pd.Series(True, index=df.index)
+        if min_market_cap is not None:
+            mask &= df["market_cap"] > min_market_cap
+        if sectors is not None:
+            mask &= df["sector"].isin(sectors)
+        if country is not None:
+            mask &= df["country"] == country
+        return list(df.index[mask])
@@ -0,0 +1,213 @@
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from trading_common.data.dataHandler import DataHandler
+from trading_common.event import MarketEvent
+from backtest.data.store import BAR_FIELDS
+from backtest.data.trading_calendar import TradingCalendar
+
+
+def _read_csv(csv_dir, symbol) -> pd.DataFrame:
+    df = pd.read_csv(os.path.join(csv_dir, f"{symbol}.csv"), index_col=0)
+    df.index = pd.to_datetime(df.index)
+    return df[~df.index.duplicated(keep="last")].sort_index()
+
+
+class SharedBarStore(object):
+    """
+    A universe of daily CSVs loaded once into a single shared memory block:
+    int64 epoch ns timestamps (T), float64 bars laid out as
+    (symbol x time x field) and a bool (symbol x time) mask of the bars that
+    really exist. Every symbol is aligned to one TradingCalendar (the union
+    of their dates) at load time with the given fill policy, rows before a
+    symbol's first bar stay NaN.
+
+    The creating process owns the block and must unlink() it once every
+    reader is done. Worker processes attach with SharedBarStore.attach(handle),
+    where handle is the small picklable dict returned by handle(), and get
+    read-only views, so any number of backtests share one copy of the data.
+    """
+
+    def __init__(self, shm, symbol_list, n_times: int, owner: bool = False):
+        self.shm = shm
+        self.symbol_list = list(symbol_list)
+        self.symbol_idx = dict((s, idx) for idx, s in enumerate(self.symbol_list))
+        self.owner = owner
+        n_symbols = len(self.symbol_list)
+        shape = (n_symbols, n_times, len(BAR_FIELDS))
+        self.timestamps = np.ndarray((n_times,), dtype=np.int64, buffer=shm.buf)
+        self.values = np.ndarray(shape, dtype=np.float64, buffer=shm.buf, offset=n_times * 8)
+        self.real = np.ndarray((n_symbols, n_times), dtype=bool, buffer=shm.buf,
+                               offset=n_times * 8 * (1 + n_symbols * len(BAR_FIELDS)))
+        if not owner:
+            for arr in (self.timestamps, self.values, self.real):
+                arr.setflags(write=False)
+        ## first row with data per symbol, n_times if the symbol has none
+        self.first_valid = np.where(self.real.any(axis=1), self.real.argmax(axis=1), n_times)
+
+    @staticmethod
+    def nbytes(n_symbols: int, n_times: int) -> int:
+        return n_times * 8 * (1 + n_symbols * len(BAR_FIELDS)) + n_symbols * n_times
+
+    @classmethod
+    def from_csv(cls, csv_dir, symbol_list, name: str = None, fill: str = "ffill"):
+        """
+        loads {csv_dir}/{symbol}.csv for every symbol into a new shared memory block
+        fill - gap policy, see backtest.data.trading_calendar.FILL_POLICIES
+        """
+        symbol_list = list(dict.fromkeys(symbol_list))
+        ## first pass only reads the dates to build the calendar
+        calendar = TradingCalendar.from_csv_dir(csv_dir, symbol_list)
+        n_times = len(calendar)
+        shm = shared_memory.SharedMemory(name=name, create=True,
+                                         size=max(cls.nbytes(len(symbol_list), n_times), 1))
+        store = cls(shm, symbol_list, n_times, owner=True)
+        store.timestamps[:] = calendar.timestamps
+        for idx, symbol in enumerate(symbol_list):
+            _, store.real[idx] = calendar.align(_read_csv(csv_dir, symbol), fill, out=store.values[idx])
+        store.first_valid = np.where(store.real.any(axis=1), store.real.argmax(axis=1), n_times)
+        return store
+
+    def handle(self) -> dict:
+        return {"name": self.shm.name, "symbol_list": self.symbol_list, "n_times": len(self.timestamps)}
+
+    @classmethod
+    def attach(cls, handle: dict):
+        shm = shared_memory.SharedMemory(name=handle["name"])
+        return cls(shm, handle["symbol_list"], handle["n_times"])
+
+    def close(self):
+        ## views must go before the buffer they point into is released
+        self.timestamps = self.values = self.real = None
+        self.shm.close()
+
+    def unlink(self):
+        self.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self.owner:
+            self.unlink()
+        else:
+            self.close()
+
+
+class SharedDataHandler(DataHandler):
+    """
+    Backtest DataHandler reading from a SharedBarStore. Behaves like
+    HistoricCSVDataHandler: every update_bars() reveals the next date
+    between start_date and end_date and puts a MarketEvent on the queue.
+    get_latest_bars returns views into the shared block, never copies of it.
+    Since all symbols share one calendar, the latest cross-section is also
+    available as arrays ordered like symbol_list (latest_field, latest_window,
+    valid_mask, bar_mask), which the portfolio uses instead of per-symbol lookups.
+
+    universe - optional backtest.data.universe.UniverseIndex. symbol_list is
+        narrowed to the symbols that are members at some point between
+        start_date and end_date, and active_symbols / is_active() tell which
+        ones are members on the current bar. The backtest loop only runs
+        per-symbol strategies over active_symbols and the symbols still held.
+    """
+
+    def __init__(self, event_queue, store: SharedBarStore, symbol_list=None,
+                 start_date=None, end_date=None, universe=None):
+        self.events = event_queue
+        self.store = store
+        self.symbol_list = list(symbol_list) if symbol_list is not None else list(store.symbol_list)
+        self.universe = universe
+        if universe is not None:
+            members = set(universe.ever_active(start_date, end_date))
+            self.symbol_list = [s for s in self.symbol_list if s in members]
+        missing = [s for s in self.symbol_list if s not in store.symbol_idx]
+        if missing:
+            raise Exception(f"Symbols not in the shared store: {missing}")
+        self.start_date = start_date
+        self.end_date = end_date
+        timestamps = store.timestamps
+        self._start = np.searchsorted(timestamps, pd.Timestamp(start_date).value) if start_date is not None else 0
+        self._end = np.searchsorted(timestamps, pd.Timestamp(end_date).value, side="right") \
+            if end_date is not None else len(timestamps)
+        self._first = dict((s, max(self._start, store.first_valid[store.symbol_idx[s]])) for s in self.symbol_list)
+        self._rows = np.array([store.symbol_idx[s] for s in self.symbol_list], dtype=np.intp)
+        self._cursor = self._start
+        self._period = None
+        self.active_symbols = list(self.symbol_list)
+        self._active = set(self.active_symbols)
+        self.continue_backtest = self._cursor < self._end
+
+    def _update_active(self):
+        ## membership only changes at interval boundaries
+        period = self.universe.period(self.store.timestamps[self._cursor - 1])
+        if period == self._period:
+            return
+        self._period = period
+        members = set(self.universe.period_members(period))
+        self.active_symbols = [s for s in self.symbol_list if s in members]
+        self._active = set(self.active_symbols)
+
+    def is_active(self, symbol) -> bool:
+        return symbol in self._active
+
+    def update_bars(self):
+        if self._cursor >= self._end:
+            self.continue_backtest = False
+            return
+        self._cursor += 1
+        if self.universe is not None:
+            self._update_active()
+        self.events.put(MarketEvent())
+
+    def get_latest_bars(self, symbol, N=1):
+        start = max(self._cursor - N, self._first[symbol])
+        end = max(self._cursor, start)
+        values = self.store.values[self.store.symbol_idx[symbol], start:end]
+        bars = {"datetime": pd.to_datetime(self.store.timestamps[start:end])}
+        for idx, field in enumerate(BAR_FIELDS):
+            bars[field] = values[:, idx]
+        return bars
+
+    def latest_datetime(self) -> pd.Timestamp:
+        return pd.Timestamp(self.store.timestamps[self._cursor - 1])
+
+    def latest_field(self, field: str = "close") -> np.ndarray:
+        """ field of the current bar for every symbol in symbol_list, NaN where there is no price """
+        return self.store.values[self._rows, self._cursor - 1, BAR_FIELDS.index(field)]
+
+    def valid_mask(self) -> np.ndarray:
+        """ symbols with a price on the current bar, real or filled """
+        return ~np.isnan(self.latest_field("close"))
+
+    def bar_mask(self) -> np.ndarray:
+        """ symbols with an actual bar (not a filled one) on the current bar """
+        return self.store.real[self._rows, self._cursor - 1]
+
+    def latest_window(self, N: int, field: str = "close") -> np.ndarray:
+        """ (len(symbol_list) x N) array of the latest N values of field, oldest first, NaN padded """
+        window = np.full((len(self._rows), N), np.nan)
+        start = max(self._cursor - N, self._start)
+        if self._cursor > start:
+            window[:, N - (self._cursor - start):] = \
+                self.store.values[self._rows, start:self._cursor, BAR_FIELDS.index(field)]
+        return window
+
+    def position(self) -> int:
+        """ row of the current bar in arrays(), -1 before the first update_bars() """
+        return self._cursor - self._start - 1
+
+    def arrays(self) -> dict:
+        """
+        (time x symbol) copies of every field over the whole backtest window,
+        plus "datetime" as int64 epoch ns, for array / kernel strategies.
+        """
+        window = slice(self._start, self._end)
+        arrays = {"datetime": np.array(self.store.timestamps[window])}
+        for idx, field in enumerate(BAR_FIELDS):
+            arrays[field] = np.ascontiguousarray(self.store.values[self._rows, window, idx].T)
+        return arrays
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+
+BAR_FIELDS = ("open", "high", "low", "close", "volume")
+
+
+def to_epoch_ns(index) -> np.ndarray:
+    """ datetime-like index (tz-aware ones are taken as UTC) to int64 epoch ns """
+    return pd.DatetimeIndex(index).values.astype("datetime64[ns]").astype(np.int64)
+
+
+class BarStore(object):
+    """
+    Array-backed OHLCV store with one growable buffer per symbol.
+
+    Appending a bar is amortized O(1) (buffers double when full) and
+    get_latest_bars returns the same dict layout as HistoricCSVDataHandler,
+    so strategies and portfolios can read from it unchanged.
+    """
+
+    def __init__(self, symbol_list, capacity: int = 256):
+        self.symbol_list = []
+        self._capacity = capacity
+        self._timestamps = {}
+        self._values = {}
+        self._size = {}
+        for symbol in symbol_list:
+            self.add_symbol(symbol)
+
+    def add_symbol(self, symbol):
+        if symbol in self._size:
+            return
+        self.symbol_list.append(symbol)
+        self._timestamps[symbol] = np.empty(self._capacity, dtype=np.int64)
+        self._values[symbol] = np.empty(
+            (self._capacity, len(BAR_FIELDS)), dtype=np.float64)
+        self._size[symbol] = 0
+
+    def _reserve(self, symbol, n: int):
+        size = self._size[symbol]
+        capacity = len(self._timestamps[symbol])
+        if size + n <= capacity:
+            return
+        new_capacity = max(2 * capacity, size + n)
+        timestamps = np.empty(new_capacity, dtype=np.int64)
+        timestamps[:size] = self._timestamps[symbol][:size]
+        values = np.empty((new_capacity, len(BAR_FIELDS)), dtype=np.float64)
+        values[:size] = self._values[symbol][:size]
+        self._timestamps[symbol] = timestamps
+        self._values[symbol] = values
+
+    def __contains__(self, symbol) -> bool:
+        return symbol in self._size
+
+    def size(self, symbol) -> int:
+        return self._size[symbol]
+
+    def latest_timestamp(self, symbol):
+        """ epoch nanoseconds of the last stored bar, None if empty """
+        size = self._size[symbol]
+        return int(self._timestamps[symbol][size - 1]) if size > 0 else None
+
+    def append(self, symbol, timestamp: int, open, high, low, close, volume):
+        """
+        Appends a single bar. A bar with the same timestamp as the last one
+        replaces it, which lets a partially built bar be revised in place.
+        """
+        size = self._size[symbol]
+        if size > 0 and self._timestamps[symbol][size - 1] == timestamp:
+            self._values[symbol][size - 1] = (open, high, low, close, volume)
+            return
+        self._reserve(symbol, 1)
+        self._timestamps[symbol][size] = timestamp
+        self._values[symbol][size] = (open, high, low, close, volume)
+        self._size[symbol] = size + 1
+
+    def extend(self, symbol, df: pd.DataFrame):
+        """
+        Bulk appends bars from a DataFrame indexed by datetime with
+        open/high/low/close/volume columns (eg. REST history on start up).
+        Rows not newer than the last stored bar are skipped.
+        """
+        if df is None or len(df) == 0:
+            return
+        timestamps = to_epoch_ns(df.index)
+        last = self.latest_timestamp(symbol)
+        if last is not None:
+            newer = timestamps > last
+            df, timestamps = df[newer], timestamps[newer]
+        n = len(timestamps)
+        if n == 0:
+            return
+        self._reserve(symbol, n)
+        size = self._size[symbol]
+        self._timestamps[symbol][size:size + n] = timestamps
+        self._values[symbol][size:size + n] = df.loc[:, list(BAR_FIELDS)].to_numpy(
+            dtype=np.float64)
+        self._size[symbol] = size + n
+
+    def get_latest_bars(self, symbol, N: int = 1) -> dict:
+        size = self._size[symbol]
+        start = max(size - N, 0)
+        bars = {"datetime": pd.to_datetime(self._timestamps[symbol][start:size])}
+        values = self._values[symbol][start:size]
+        for idx, field in enumerate(BAR_FIELDS):
+            bars[field] = values[:, idx]
+        return bars
@@ -0,0 +1,293 @@
+import json
+import logging
+import os
+import queue
+import threading
+from abc import ABC, abstractmethod
+
+import pandas as pd
+
+from trading_common.data.dataHandler import DataHandler
+from trading_common.event import MarketEvent
+from backtest.data.store import BarStore
+
+
+DAY_NS = pd.Timedelta("1D").value
+
+
+def _to_ns(ts) -> int:
+    if isinstance(ts, (int, float)):
+        return int(ts)
+    return pd.Timestamp(ts).value
+
+
+class BarAggregator(object):
+    """
+    Folds trades (and optionally quote mid prices) into fixed-width time bars.
+
+    A bar is completed once a tick for a later bucket arrives or flush() is
+    called with a time past the end of its bucket.
+
+    Intraday buckets are aligned to UTC. Daily (and longer) buckets start at
+    midnight of the session date in exchange_tz, the time REST bars are
+    stamped with, so streamed bars line up with warm start history.
+
+    Ticks for a bar that is already out are dropped and counted in late_ticks.
+    """
+
+    def __init__(self, timeframe="1min", use_quotes: bool = False, exchange_tz="America/New_York"):
+        self.timeframe_ns = pd.Timedelta(timeframe).value
+        self.use_quotes = use_quotes
+        self.exchange_tz = exchange_tz
+        # symbol -> [bucket_start, open, high, low, close, volume]
+        self._building = {}
+        # (start, end) of the last session bucket, to skip the tz conversion for most ticks
+        self._session = (0, 0)
+        self.late_ticks = 0
+
+    def _bucket(self, ts_ns: int) -> int:
+        if self.timeframe_ns < DAY_NS:
+            return ts_ns - ts_ns % self.timeframe_ns
+        if self._session[0] <= ts_ns < self._session[1]:
+            return self._session[0]
+        local = pd.Timestamp(ts_ns, tz="UTC").tz_convert(self.exchange_tz).tz_localize(None).value
+        start = local - local % self.timeframe_ns
+        self._session = (pd.Timestamp(start).tz_localize(self.exchange_tz).value,
+                         pd.Timestamp(start + self.timeframe_ns).tz_localize(self.exchange_tz).value)
+        return self._session[0]
+
+    def _update(self, symbol, ts_ns: int, price: float, size: float):
+        bucket = self._bucket(ts_ns)
+        bar = self._building.get(symbol)
+        completed = None
+        if bar is not None and bucket > bar[0]:
+            completed = (symbol, *bar)
+            bar = None
+        elif bar is not None and bucket < bar[0]:
+            # late tick for a bar that is already out
+            self.late_ticks += 1
+            logging.info(f"Dropped late tick for {symbol} at {pd.Timestamp(ts_ns, tz='UTC')}, "
+                         f"its bar is out ({self.late_ticks} late ticks so far)")
+            return None
+        if bar is None:
+            self._building[symbol] = [bucket, price, price, price, price, size]
+        else:
+            bar[2] = max(bar[2], price)
+            bar[3] = min(bar[3], price)
+            bar[4] = price
+            bar[5] += size
+        return completed
+
+    def on_trade(self, symbol, ts_ns: int, price: float, size: float):
+        return self._update(symbol, ts_ns, price, size)
+
+    def on_quote(self, symbol, ts_ns: int, bid: float, ask: float):
+        if not self.use_quotes or bid <= 0 or ask <= 0:
+            return None
+        return self._update(symbol, ts_ns, (bid + ask) / 2, 0.0)
+
+    def flush(self, now_ns: int) -> list:
+        """ completes every bar whose bucket ended before now_ns """
+        completed = []
+        now_bucket = self._bucket(now_ns)
+        for symbol, bar in list(self._building.items()):
+            if bar[0] < now_bucket:
+                completed.append((symbol, *bar))
+                del self._building[symbol]
+        return completed
+
+
+class Feed(ABC):
+    """
+    Market data transport. messages() blocks and yields decoded messages
+    in Alpaca v2 stream format, ie. dicts with "T" ("t" trade, "q" quote,
+    "b" bar) and "S" (symbol) keys.
+    """
+
+    @abstractmethod
+    def subscribe(self, symbol_list):
+        raise NotImplementedError("Should implement subscribe()")
+
+    @abstractmethod
+    def messages(self):
+        raise NotImplementedError("Should implement messages()")
+
+    def close(self):
+        return
+
+
+class QueueFeed(Feed):
+    """
+    In-process feed. Messages are pushed with put(), which makes it a local
+    stand-in for a websocket server when developing or replaying ticks.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self.symbol_list = []
+
+    def subscribe(self, symbol_list):
+        self.symbol_list = list(symbol_list)
+
+    def put(self, msg: dict):
+        self._queue.put(msg)
+
+    def messages(self):
+        while True:
+            msg = self._queue.get()
+            if msg is None:
+                return
+            yield msg
+
+    def close(self):
+        self._queue.put(None)
+
+
+class AlpacaStreamFeed(Feed):
+    """
+    Alpaca market data v2 websocket. Requires the websocket-client package.
+    """
+
+    def __init__(self, url="wss://stream.data.alpaca.markets/v2/iex", trades=True, quotes=False):
+        self.url = url
+        self.trades = trades
+        self.quotes = quotes
+        self.symbol_list = []
+        self.ws = None
+
+    def _connect(self):
+        import websocket
+
+        self.ws = websocket.create_connection(self.url)
+        self.ws.recv()  # connected message
+        self.ws.send(json.dumps({
+            "action": "auth",
+            "key": os.environ["alpaca_key_id"],
+            "secret": os.environ["alpaca_secret_key"],
+        }))
+        res = json.loads(self.ws.recv())
+        if not any(msg.get("T") == "success" and msg.get("msg") == "authenticated" for msg in res):
+            raise Exception(f"Alpaca stream authentication failed: {res}")
+        sub = {"action": "subscribe"}
+        if self.trades:
+            sub["trades"] = self.symbol_list
+        if self.quotes:
+            sub["quotes"] = self.symbol_list
+        self.ws.send(json.dumps(sub))
+
+    def subscribe(self, symbol_list):
+        self.symbol_list = list(symbol_list)
+
+    def messages(self):
+        self._connect()
+        while self.ws is not None:
+            raw = self.ws.recv()
+            if not raw:
+                return
+            for msg in json.loads(raw):
+                yield msg
+
+    def close(self):
+        if self.ws is not None:
+            self.ws.close()
+            self.ws = None
+
+
+class StreamingDataHandler(DataHandler):
+    """
+    Live DataHandler fed by a streaming Feed instead of REST polling.
+
+    A reader thread aggregates ticks into bars. update_bars() moves completed
+    bars into a BarStore and puts a single MarketEvent on the queue if any
+    symbol got a new bar; the symbols updated are in self.updated_symbols and
+    the event loop only runs per-symbol strategies over them. The first
+    update_bars() after warm_start() always puts a MarketEvent, with the
+    warm started symbols as updated, so strategies act on the history without
+    waiting for the next bar to complete (a day for daily bars).
+    """
+
+    def __init__(self, event_queue, symbol_list, feed: Feed, timeframe="1min",
+                 use_quotes: bool = False, start_date=None, exchange_tz="America/New_York"):
+        self.events = event_queue
+        self.symbol_list = list(symbol_list)
+        self.start_date = start_date
+        self.feed = feed
+        self.store = BarStore(self.symbol_list)
+        self.aggregator = BarAggregator(timeframe, use_quotes, exchange_tz)
+        self.continue_backtest = True
+        self.updated_symbols = set()
+        self._warm_started = set()
+        self._completed = queue.Queue()
+        self._lock = threading.Lock()
+        self._reader = None
+
+    def warm_start(self, history):
+        """
+        Seeds the store with historical bars before streaming.
+        history - dict of symbol -> DataFrame, or a DataFrame with
+        (symbol, field) columns as returned by AlpacaBroker.get_historical_bars
+        """
+        if isinstance(history, pd.DataFrame):
+            history = {sym: history[sym].dropna()
+                       for sym in history.columns.get_level_values(0).unique()}
+        for sym, df in history.items():
+            if sym in self.symbol_list and len(df):
+                self.store.extend(sym, df)
+                self._warm_started.add(sym)
+
+    def start(self):
+        self.feed.subscribe(self.symbol_list)
+        self._reader = threading.Thread(target=self._read_feed, daemon=True)
+        self._reader.start()
+
+    def stop(self):
+        self.continue_backtest = False
+        self.feed.close()
+
+    def _read_feed(self):
+        try:
+            for msg in self.feed.messages():
+                self.on_message(msg)
+        except Exception as e:
+            logging.error(f"Streaming feed stopped: {e}")
+        self.continue_backtest = False
+
+    def on_message(self, msg: dict):
+        msg_type = msg.get("T")
+        symbol = msg.get("S")
+        if symbol not in self.store:
+            return
+        with self._lock:
+            if msg_type == "t":
+                completed = self.aggregator.on_trade(
+                    symbol, _to_ns(msg["t"]), msg["p"], msg["s"])
+            elif msg_type == "q":
+                completed = self.aggregator.on_quote(
+                    symbol, _to_ns(msg["t"]), msg["bp"], msg["ap"])
+            elif msg_type == "b":
+                completed = (symbol, self.aggregator._bucket(_to_ns(msg["t"])),
+                             msg["o"], msg["h"], msg["l"], msg["c"], msg["v"])
+            else:
+                return
+        if completed is not None:
+            self._completed.put(completed)
+
+    def update_bars(self):
+        if self._reader is None:
+            self.start()
+        with self._lock:
+            for bar in self.aggregator.flush(pd.Timestamp.now(tz="UTC").value):
+                self._completed.put(bar)
+        self.updated_symbols, self._warm_started = self._warm_started, set()
+        while True:
+            try:
+                symbol, *bar = self._completed.get(block=False)
+            except queue.Empty:
+                break
+            self.store.append(symbol, *bar)
+            self.updated_symbols.add(symbol)
+        if self.updated_symbols:
+            self.events.put(MarketEvent())
+
+    def get_latest_bars(self, symbol, N=1):
+        return self.store.get_latest_bars(symbol, N)
@@ -0,0 +1,98 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from backtest.data.store import BAR_FIELDS, to_epoch_ns
+
+## how gaps in a symbol's bars are filled once aligned to the calendar
+## ffill - carry the last bar forward, also after the symbol's data ends
+## listed - carry forward only between the first and last bar of the symbol
+## none - leave gaps as NaN
+FILL_POLICIES = ("ffill", "listed", "none")
+
+
+class TradingCalendar(object):
+    """
+    Master index of trading days (or intraday bar times) every symbol is
+    aligned to. Dates that aren't on the calendar snap to the next (or
+    previous) trading day instead of raising KeyError.
+    """
+
+    def __init__(self, index):
+        self.index = pd.DatetimeIndex(index).unique().sort_values()
+        self.timestamps = to_epoch_ns(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    @classmethod
+    def from_union(cls, indexes):
+        union = pd.DatetimeIndex([])
+        for index in indexes:
+            union = union.union(pd.DatetimeIndex(index))
+        return cls(union)
+
+    @classmethod
+    def from_csv_dir(cls, csv_dir: str, symbol_list):
+        """ union of the dates in {csv_dir}/{symbol}.csv, reading only the date column """
+        return cls.from_union(
+            pd.to_datetime(pd.read_csv(os.path.join(csv_dir, f"{s}.csv"), index_col=0, usecols=[0]).index)
+            for s in symbol_list)
+
+    def position(self, date, side: str = "next") -> int:
+        """
+        position of date on the calendar. If date is not a trading day,
+        side="next" gives the following trading day, "previous" the one before.
+        """
+        ts = pd.Timestamp(date).value
+        if side == "next":
+            pos = int(np.searchsorted(self.timestamps, ts, side="left"))
+        elif side == "previous":
+            pos = int(np.searchsorted(self.timestamps, ts, side="right")) - 1
+        else:
+            raise Exception(f"side has to be 'next' or 'previous', got {side}")
+        if pos < 0 or pos >= len(self.timestamps):
+            raise Exception(f"{date} is outside the calendar {self.index[0]} - {self.index[-1]}")
+        return pos
+
+    def snap(self, date, side: str = "next") -> pd.Timestamp:
+        return self.index[self.position(date, side)]
+
+    def window(self, start=None, end=None) -> slice:
+        """ positions from start to end (inclusive), either may fall on a non trading day """
+        lo = int(np.searchsorted(self.timestamps, pd.Timestamp(start).value)) if start is not None else 0
+        hi = int(np.searchsorted(self.timestamps, pd.Timestamp(end).value, side="right")) \
+            if end is not None else len(self.timestamps)
+        return slice(lo, hi)
+
+    def align(self, df: pd.DataFrame, fill: str = "ffill", out: np.ndarray = None):
+        """
+        Aligns one symbol's bars (datetime index, BAR_FIELDS columns) to the calendar.
+        Filled bars get the previous bar's prices and zero volume.
+        out - optional (T x fields) float64 array to write into, eg. a shared memory view
+        Returns (values, real) where real marks the bars that exist in df.
+        """
+        if fill not in FILL_POLICIES:
+            raise Exception(f"fill has to be one of {FILL_POLICIES}, got {fill}")
+        values = out if out is not None else np.empty((len(self.timestamps), len(BAR_FIELDS)))
+        values[:] = np.nan
+        real = np.zeros(len(self.timestamps), dtype=bool)
+        timestamps = to_epoch_ns(df.index)
+        pos = np.searchsorted(self.timestamps, timestamps)
+        on_calendar = pos < len(self.timestamps)
+        on_calendar[on_calendar] = self.timestamps[pos[on_calendar]] == timestamps[on_calendar]
+        pos = pos[on_calendar]
+        values[pos] = df.loc[:, list(BAR_FIELDS)].to_numpy(dtype=np.float64)[on_calendar]
+        real[pos] = True
+        if fill == "none" or len(pos) == 0:
+            return values, real
+
+        ## forward fill: index of the last real bar at or before each row
+        last = np.maximum.accumulate(np.where(real, np.arange(len(real)), -1))
+        fill_rows = ~real & (last >= 0)
+        if fill == "listed":
+            fill_rows &= np.arange(len(real)) < pos.max()
+        values[fill_rows] = values[last[fill_rows]]
+        values[fill_rows, BAR_FIELDS.index("volume")] = 0.0
+        return values, real
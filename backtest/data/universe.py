@@ -0,0 +1,147 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from backtest.data.store import to_epoch_ns
+
+## end of an interval that is still open, ie. a current member
+OPEN_END = np.iinfo(np.int64).max
+
+
+def _to_ns(date) -> int:
+    return pd.Timestamp(date).value
+
+
+class UniverseIndex(object):
+    """
+    Point-in-time universe: membership intervals per symbol, eg. when it was
+    listed / delisted or added to / removed from an index. A symbol can have
+    several intervals. Each interval is [start, end] with end inclusive, an
+    empty end means it is still a member.
+
+    Intervals are kept as three int arrays (symbol code, start ns, end ns),
+    so the index for decades of S&P 500 changes is a few kilobytes.
+    Lookups binary search the sorted interval boundaries; the members of
+    the period between two boundaries are computed once and cached, so
+    stepping bar by bar costs a searchsorted and a dict lookup.
+    """
+
+    def __init__(self, symbols, starts, ends):
+        symbols = np.asarray(symbols, dtype=object)
+        self.symbols, codes = np.unique(symbols, return_inverse=True)
+        self.codes = codes.astype(np.int32)
+        self.starts = np.asarray(starts, dtype=np.int64)
+        ## stored exclusive internally
+        ends = np.asarray(ends, dtype=np.int64)
+        self.ends = np.where(ends == OPEN_END, OPEN_END, ends + 1)
+        if np.any(self.ends <= self.starts):
+            raise Exception("UniverseIndex: every interval needs start <= end")
+        self.boundaries = np.unique(np.r_[self.starts, self.ends[self.ends != OPEN_END]])
+        self._members = {}
+
+    def __len__(self):
+        return len(self.codes)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame):
+        """ df with symbol, start and end columns, end empty / NaT for current members """
+        starts = to_epoch_ns(pd.to_datetime(df["start"]))
+        end = pd.to_datetime(df["end"])
+        ends = np.where(end.isna().to_numpy(), OPEN_END, to_epoch_ns(end.fillna(pd.Timestamp(0))))
+        return cls(df["symbol"].to_numpy(), starts, ends)
+
+    @classmethod
+    def from_csv(cls, fp: str):
+        return cls.from_frame(pd.read_csv(fp))
+
+    @classmethod
+    def from_csv_dir(cls, csv_dir: str, symbol_list, open_after=None):
+        """
+        Listing intervals from the first and last date in each {symbol}.csv.
+        open_after - symbols with data after this date are treated as still listed
+        """
+        rows = []
+        for symbol in symbol_list:
+            fp = os.path.join(csv_dir, f"{symbol}.csv")
+            if not os.path.exists(fp):
+                continue
+            dates = pd.to_datetime(pd.read_csv(fp, index_col=0, usecols=[0]).index)
+            if len(dates) == 0:
+                continue
+            end = dates.max()
+            if open_after is not None and end >= pd.Timestamp(open_after):
+                end = pd.NaT
+            rows.append((symbol, dates.min(), end))
+        return cls.from_frame(pd.DataFrame(rows, columns=["symbol", "start", "end"]))
+
+    def to_frame(self) -> pd.DataFrame:
+        ends = pd.to_datetime(np.where(self.ends == OPEN_END, np.iinfo(np.int64).min, self.ends - 1))
+        return pd.DataFrame({
+            "symbol": self.symbols[self.codes],
+            "start": pd.to_datetime(self.starts),
+            "end": ends,
+        })
+
+    def to_csv(self, fp: str):
+        self.to_frame().to_csv(fp, index=False, date_format="%Y-%m-%d")
+
+    def _segment(self, ts: int) -> int:
+        return int(np.searchsorted(self.boundaries, ts, side="right")) - 1
+
+    def _segment_members(self, segment: int) -> np.ndarray:
+        """ sorted symbol codes active between boundaries[segment] and the next one """
+        if segment not in self._members:
+            if segment < 0:
+                members = np.empty(0, dtype=np.int32)
+            else:
+                t = self.boundaries[segment]
+                members = np.unique(self.codes[(self.starts <= t) & (t < self.ends)])
+            self._members[segment] = members
+        return self._members[segment]
+
+    def period(self, date) -> int:
+        """
+        id of the stretch of time between two membership changes that date
+        (or epoch ns) falls in. Members only change when the period does
+        """
+        return self._segment(date if isinstance(date, (int, np.integer)) else _to_ns(date))
+
+    def period_members(self, period: int) -> list:
+        """ symbols that are members during a period """
+        return self.symbols[self._segment_members(period)].tolist()
+
+    def active(self, date) -> list:
+        """ symbols that are members on date """
+        return self.symbols[self._segment_members(self._segment(_to_ns(date)))].tolist()
+
+    def active_codes(self, date) -> np.ndarray:
+        return self._segment_members(self._segment(_to_ns(date)))
+
+    def is_active(self, symbol, date) -> bool:
+        code = np.searchsorted(self.symbols, symbol)
+        if code >= len(self.symbols) or self.symbols[code] != symbol:
+            return False
+        t = _to_ns(date)
+        return bool(np.any((self.codes == code) & (self.starts <= t) & (t < self.ends)))
+
+    def ever_active(self, start=None, end=None) -> list:
+        """ symbols that are members at some point between start and end (inclusive) """
+        lo = _to_ns(start) if start is not None else np.iinfo(np.int64).min
+        hi = _to_ns(end) if end is not None else OPEN_END - 1
+        overlap = (self.starts <= hi) & (lo < self.ends)
+        return self.symbols[np.unique(self.codes[overlap])].tolist()
+
+    def active_mask(self, timestamps, symbol_list) -> np.ndarray:
+        """ (time x symbol) bool matrix of membership for epoch ns timestamps """
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        columns = np.full(len(self.symbols), -1)
+        symbol_idx = dict((s, idx) for idx, s in enumerate(symbol_list))
+        for code, symbol in enumerate(self.symbols):
+            columns[code] = symbol_idx.get(symbol, -1)
+        mask = np.zeros((len(timestamps), len(symbol_list)), dtype=bool)
+        segments = np.searchsorted(self.boundaries, timestamps, side="right") - 1
+        for segment in np.unique(segments):
+            cols = columns[self._segment_members(segment)]
+            mask[np.ix_(segments == segment, cols[cols >= 0])] = True
+        return mask
@@ -0,0 +1,380 @@
+"""
+Kernel mode: runs array strategies through the portfolio / simulated broker
+rules in one compiled loop instead of the event queue.
+
+A strategy is a (time x symbol) int8 matrix of signal codes (NO_SIGNAL, BUY,
+SELL, EXIT_LONG, EXIT_SHORT), usually computed from the bar arrays by a
+causal array function such as buy_and_hold or threshold. run_kernel replays,
+bar by bar, what the event loop does with a NaivePortfolio / PercentagePortFolio
+(no rebalance) and a SimulatedBroker, in the same order the LIFO event queue
+processes them: pending orders newest first, then signals from the last
+symbol to the first. Limit orders go through the same cash, expiry and
+high / low checks on the next bar and fill at the close of the bar after.
+
+Numba is optional. Without it the same functions run as plain python, which
+gives identical results, only slowly.
+"""
+import numpy as np
+import pandas as pd
+
+from backtest.portfolio.portfolio import PercentagePortFolio
+from backtest.portfolio.rebalance import NoRebalance
+from backtest.portfolio.strategy import DefaultOrder, LongOnly, ProgressiveOrder
+from trading_common.event import SignalEvent
+from trading_common.strategy.naive import Strategy
+from trading_common.utilities.enum import OrderPosition, OrderType
+
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:  # numba is an optional dependency
+    HAS_NUMBA = False
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
+
+## signal codes
+NO_SIGNAL, BUY, SELL, EXIT_LONG, EXIT_SHORT = 0, 1, 2, 3, 4
+SIGNAL_POSITIONS = {
+    BUY: OrderPosition.BUY,
+    SELL: OrderPosition.SELL,
+    EXIT_LONG: OrderPosition.EXIT_LONG,
+    EXIT_SHORT: OrderPosition.EXIT_SHORT,
+}
+
+## order sizing
+SIZE_FIXED, SIZE_CASH, SIZE_ASSET = 0, 1, 2
+## portfolio strategies
+ORDER_DEFAULT, ORDER_PROGRESSIVE, ORDER_LONG_ONLY = 0, 1, 2
+ORDER_STYLES = {DefaultOrder: ORDER_DEFAULT, ProgressiveOrder: ORDER_PROGRESSIVE, LongOnly: ORDER_LONG_ONLY}
+
+DAY_NS = 86400 * 10**9
+
+
+@njit(cache=True)
+def buy_and_hold(close):
+    """ BuyAndHoldStrategy: BUY once, on the first bar each symbol has a price """
+    n_times, n_symbols = close.shape
+    signals = np.zeros((n_times, n_symbols), dtype=np.int8)
+    for s in range(n_symbols):
+        for t in range(n_times):
+            if not np.isnan(close[t, s]):
+                signals[t, s] = BUY
+                break
+    return signals
+
+
+@njit(cache=True)
+def threshold(indicator, lower, upper):
+    """ BUY while indicator < lower, SELL while indicator > upper. indicator is (time x symbol) """
+    n_times, n_symbols = indicator.shape
+    signals = np.zeros((n_times, n_symbols), dtype=np.int8)
+    for t in range(n_times):
+        for s in range(n_symbols):
+            if indicator[t, s] < lower:
+                signals[t, s] = BUY
+            elif indicator[t, s] > upper:
+                signals[t, s] = SELL
+    return signals
+
+
+@njit(cache=True)
+def _order_quantity(style, signal, size, cur):
+    """ quantity and side (1 buy, -1 sell) of the order a portfolio strategy sends, 0 side for none """
+    if signal == EXIT_LONG:
+        if cur > 0:
+            return cur, -1
+        return 0.0, 0
+    if style == ORDER_LONG_ONLY:
+        if signal == BUY:
+            return size, 1
+        if signal == SELL and cur > 0:
+            return cur, -1
+        return 0.0, 0
+    if signal == EXIT_SHORT:
+        if cur < 0:
+            return -cur, 1
+        return 0.0, 0
+    if style == ORDER_DEFAULT:
+        if signal == BUY and cur <= 0:
+            return size - cur, 1
+        if signal == SELL and cur >= 0:
+            return size + cur, -1
+        return 0.0, 0
+    ## ORDER_PROGRESSIVE
+    if signal == BUY:
+        return (size - cur, 1) if cur < 0 else (size, 1)
+    if signal == SELL:
+        return (size + cur, -1) if cur > 0 else (size, -1)
+    return 0.0, 0
+
+
+@njit(cache=True)
+def _simulate(timestamps, high, low, close, signals, signal_price, active,
+              initial_capital, sizing, size_param, style, limit, expires_ns):
+    n_times, n_symbols = close.shape
+    quantity = np.zeros(n_symbols)
+    cash = initial_capital
+    totals = np.empty(n_times)
+    cash_at = np.empty(n_times)
+    market_value = np.zeros((n_times, n_symbols))
+    last_close = np.full(n_symbols, np.nan)
+
+    ## pending limit orders, oldest first: symbol, side, quantity, limit price,
+    ## expiry, processed, signal bar
+    cap = 2 * n_symbols + 1
+    q_sym = np.empty(cap, dtype=np.int64)
+    q_side = np.empty(cap, dtype=np.int64)
+    q_qty = np.empty(cap)
+    q_price = np.empty(cap)
+    q_exp = np.empty(cap, dtype=np.int64)
+    q_done = np.empty(cap, dtype=np.bool_)
+    q_bar = np.empty(cap, dtype=np.int64)
+    n_q = 0
+    n_sym = np.empty(cap, dtype=np.int64)
+    n_side = np.empty(cap, dtype=np.int64)
+    n_qty = np.empty(cap)
+    n_price = np.empty(cap)
+    n_exp = np.empty(cap, dtype=np.int64)
+    n_done = np.empty(cap, dtype=np.bool_)
+    n_bar = np.empty(cap, dtype=np.int64)
+
+    ## fills: bar, symbol, side, quantity, price, signal bar
+    f_cap = max(n_times, 16)
+    fills = np.empty((f_cap, 6))
+    n_fills = 0
+
+    for t in range(n_times):
+        ## update_timeindex
+        total = cash
+        for s in range(n_symbols):
+            c = close[t, s]
+            if not np.isnan(c):
+                last_close[s] = c
+            if not np.isnan(last_close[s]):
+                market_value[t, s] = quantity[s] * last_close[s]
+                total += market_value[t, s]
+        totals[t] = total
+        cash_at[t] = cash
+
+        n_new = 0
+        ## pending orders come off the LIFO queue newest first, then the signals
+        ## from the last symbol to the first
+        for j in range(n_q + n_symbols):
+            if j < n_q:
+                k = n_q - 1 - j
+                s = q_sym[k]
+                side = q_side[k]
+                qty = q_qty[k]
+                price = q_price[k]
+                exp = q_exp[k]
+                done = q_done[k]
+                bar = q_bar[k]
+            else:
+                s = n_symbols - 1 - (j - n_q)
+                signal = signals[t, s]
+                if signal == NO_SIGNAL:
+                    continue
+                ## inactive symbols may only exit or reduce, as NaivePortfolio.update_signal
+                if not active[t, s] and ((signal == BUY and quantity[s] >= 0) or
+                                         (signal == SELL and quantity[s] <= 0)):
+                    continue
+                c = close[t, s]
+                if np.isnan(c) or c == 0.0:
+                    continue
+                if sizing == SIZE_FIXED:
+                    size = size_param
+                elif sizing == SIZE_CASH:
+                    size = float(int(cash * size_param / c))
+                else:
+                    size = float(int(total * size_param / c))
+                qty, side = _order_quantity(style, signal, size, quantity[s])
+                if side == 0:
+                    continue
+                price = signal_price[t, s]
+                exp = timestamps[t] + expires_ns
+                done = False
+                bar = t
+                if limit:
+                    ## limit orders wait in order_queue for the next bar
+                    n_sym[n_new] = s
+                    n_side[n_new] = side
+                    n_qty[n_new] = qty
+                    n_price[n_new] = price
+                    n_exp[n_new] = exp
+                    n_done[n_new] = done
+                    n_bar[n_new] = bar
+                    n_new += 1
+                    continue
+
+            ## SimulatedBroker._filter_execute_order
+            c = close[t, s]
+            value = abs(qty * c)
+            if not ((side == 1 and cash > value) or (side == -1 and total > value)):
+                continue
+            if limit:
+                if timestamps[t] > exp:
+                    continue
+                if (side == 1 and price > high[t, s]) or (side == -1 and price < low[t, s]):
+                    continue
+                if not done:
+                    n_sym[n_new] = s
+                    n_side[n_new] = side
+                    n_qty[n_new] = qty
+                    n_price[n_new] = price
+                    n_exp[n_new] = exp
+                    n_done[n_new] = True
+                    n_bar[n_new] = bar
+                    n_new += 1
+                    continue
+            ## fill at the close
+            quantity[s] += side * qty
+            cash -= side * c * qty
+            if n_fills == f_cap:
+                grown = np.empty((2 * f_cap, 6))
+                grown[:f_cap] = fills
+                fills = grown
+                f_cap *= 2
+            fills[n_fills, 0] = t
+            fills[n_fills, 1] = s
+            fills[n_fills, 2] = side
+            fills[n_fills, 3] = qty
+            fills[n_fills, 4] = c
+            fills[n_fills, 5] = bar
+            n_fills += 1
+
+        n_q = n_new
+        q_sym[:n_q] = n_sym[:n_q]
+        q_side[:n_q] = n_side[:n_q]
+        q_qty[:n_q] = n_qty[:n_q]
+        q_price[:n_q] = n_price[:n_q]
+        q_exp[:n_q] = n_exp[:n_q]
+        q_done[:n_q] = n_done[:n_q]
+        q_bar[:n_q] = n_bar[:n_q]
+
+    return totals, cash_at, market_value, quantity, cash, fills[:n_fills]
+
+
+def _portfolio_params(port) -> dict:
+    if not isinstance(port.rebalance, NoRebalance):
+        raise Exception("Kernel mode only supports portfolios without rebalance")
+    style = type(port.portfolio_strategy)
+    if style not in ORDER_STYLES:
+        raise Exception(f"Kernel mode doesn't support portfolio strategy {style.__name__}")
+    if isinstance(port, PercentagePortFolio):
+        sizing, size_param = (SIZE_CASH if port.mode == "cash" else SIZE_ASSET), float(port.perc)
+    else:
+        sizing, size_param = SIZE_FIXED, float(port.qty)
+    return dict(initial_capital=float(port.initial_capital), sizing=sizing, size_param=size_param,
+                style=ORDER_STYLES[style], limit=port.order_type == OrderType.LIMIT,
+                expires_ns=int(port.expires) * DAY_NS)
+
+
+def run_kernel(bars, port, signals, signal_price=None, active=None):
+    """
+    Runs a backtest in kernel mode and leaves port as the event loop would:
+    all_holdings, current_holdings, ledger, journal and equity_curve.
+
+    bars - calendar aligned data handler (backtest.data.shared.SharedDataHandler)
+    port - NaivePortfolio / PercentagePortFolio without rebalance, built on bars
+    signals - (time x symbol) int8 signal codes, or a function of the
+        bars.arrays() dict returning them
+    signal_price - (time x symbol) limit prices, defaults to the close
+    active - (time x symbol) bool mask of symbols that may open or add to positions, eg. from
+        UniverseIndex.active_mask. Defaults to bars.universe if set
+    """
+    arrays = bars.arrays()
+    if callable(signals):
+        signals = signals(arrays)
+    signals = np.ascontiguousarray(signals, dtype=np.int8)
+    close = arrays["close"]
+    if signals.shape != close.shape:
+        raise Exception(f"signals have shape {signals.shape}, bars {close.shape}")
+    signal_price = close if signal_price is None else np.ascontiguousarray(signal_price, dtype=np.float64)
+    if active is None:
+        active = bars.universe.active_mask(arrays["datetime"], bars.symbol_list) \
+            if getattr(bars, "universe", None) is not None else np.ones(close.shape, dtype=np.bool_)
+
+    totals, cash_at, market_value, quantity, cash, fills = _simulate(
+        arrays["datetime"], arrays["high"], arrays["low"], close, signals, signal_price,
+        np.ascontiguousarray(active, dtype=np.bool_), **_portfolio_params(port))
+    _book(port, arrays, totals, cash_at, market_value, quantity, cash, fills)
+    port.create_equity_curve_df()
+    return port.equity_curve
+
+
+def _book(port, arrays, totals, cash_at, market_value, quantity, cash, fills):
+    """ writes kernel results into the portfolio's holdings, ledger and journal """
+    symbol_list = port.symbol_list
+    datetimes = pd.to_datetime(arrays["datetime"])
+    close = arrays["close"]
+    ## positions are marked at the last known close, as in update_timeindex
+    last_close = pd.DataFrame(close).ffill().to_numpy()
+    fill_bar = fills[:, 0].astype(np.int64)
+    fill_sym = fills[:, 1].astype(np.int64)
+    ## realized / unrealized pnl are recorded before the bar's fills, as in update_timeindex
+    bounds = np.searchsorted(fill_bar, np.arange(len(totals) + 1))
+    for t in range(len(totals)):
+        row = dict(zip(symbol_list, market_value[t].tolist()))
+        row['datetime'] = datetimes[t]
+        row['cash'] = cash_at[t]
+        row['commission'] = 0.0
+        row['total'] = totals[t]
+        row['realized_pnl'] = port.ledger.realized_pnl.sum()
+        row['unrealized_pnl'] = port.ledger.unrealized_pnl(last_close[t]).sum()
+        port.all_holdings.append(row)
+        for i in range(bounds[t], bounds[t + 1]):
+            port.ledger.on_fill(symbol_list[fill_sym[i]], fills[i, 2] * fills[i, 3], fills[i, 4], 0.0)
+
+    for idx, s in enumerate(symbol_list):
+        port.current_holdings[s]['quantity'] = quantity[idx]
+        port.current_holdings[s]['avg_cost'] = port.ledger.avg_cost_of(idx)
+    for i in range(len(fills)):
+        s = symbol_list[fill_sym[i]]
+        port.current_holdings[s]['last_traded'] = datetimes[fill_bar[i]]
+        port.current_holdings[s]['last_trade_price'] = fills[i, 4]
+    port.current_holdings['cash'] = cash
+    if len(totals) > 0:
+        port.current_holdings['datetime'] = datetimes[-1]
+        port.latest_close = close[-1].copy()
+        port.last_close = last_close[-1].copy()
+
+    ## the journal records the bar each order filled on
+    timestamps = arrays["datetime"]
+    fill_date = timestamps[fill_bar]
+    port.journal.extend(
+        timestamp=fill_date,
+        symbol=fill_sym,
+        side=fills[:, 2],
+        quantity=fills[:, 3],
+        price=fills[:, 4],
+        commission=np.zeros(len(fills)),
+        order_type=np.full(len(fills), 1 if port.order_type == OrderType.LIMIT else 0),
+        latency=fill_date - timestamps[fills[:, 5].astype(np.int64)],
+    )
+
+
+class ArraySignalStrategy(Strategy):
+    """
+    Event path twin of a kernel strategy: emits the SignalEvents of a
+    precomputed (time x symbol) signal matrix on a calendar aligned data
+    handler, so both modes can be run and compared on the same signals.
+    """
+
+    def __init__(self, bars, events, signals, signal_price=None):
+        super().__init__(bars, events)
+        arrays = bars.arrays()
+        self.signals = signals(arrays) if callable(signals) else np.asarray(signals)
+        self.signal_price = arrays["close"] if signal_price is None else np.asarray(signal_price)
+        self.datetimes = pd.to_datetime(arrays["datetime"])
+        self.symbol_idx = dict((s, idx) for idx, s in enumerate(bars.symbol_list))
+
+    def _calculate_signal(self, symbol) -> SignalEvent:
+        t = self.bars.position()
+        s = self.symbol_idx[symbol]
+        signal = self.signals[t, s]
+        if signal == NO_SIGNAL:
+            return None
+        return SignalEvent(symbol, self.datetimes[t], SIGNAL_POSITIONS[signal], self.signal_price[t, s])
@@ -0,0 +1,67 @@
+from collections import deque
+import numpy as np
+
+
+class PositionLedger(object):
+    """
+    Per-symbol position accounting held in arrays indexed like symbol_list.
+
+    Open lots are kept FIFO in a deque per symbol, as [signed quantity, price].
+    Each lot is pushed and popped once, so a fill costs O(1) amortized.
+    cost_basis is the sum of quantity * price over open lots, which gives
+    the average cost of the open position without walking the lots.
+    """
+
+    def __init__(self, symbol_list):
+        n = len(symbol_list)
+        self.symbol_idx = dict((s, idx) for idx, s in enumerate(symbol_list))
+        self.quantity = np.zeros(n)
+        self.cost_basis = np.zeros(n)
+        self.realized_pnl = np.zeros(n)
+        self.commission = np.zeros(n)
+        self.lots = [deque() for _ in range(n)]
+
+    @property
+    def avg_cost(self) -> np.ndarray:
+        """ average cost of open positions, NaN when flat """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(self.quantity != 0, self.cost_basis / self.quantity, np.nan)
+
+    def avg_cost_of(self, idx: int):
+        """ average cost of the open position at idx, None when flat """
+        if self.quantity[idx] == 0:
+            return None
+        return self.cost_basis[idx] / self.quantity[idx]
+
+    def on_fill(self, symbol, quantity: float, price: float, commission: float = 0.0) -> float:
+        """
+        Books a fill of signed quantity (+ve buy, -ve sell).
+        Returns the PnL realized by the fill, net of commission.
+        """
+        idx = self.symbol_idx[symbol]
+        lots = self.lots[idx]
+        realized = 0.0 - commission
+        remaining = quantity
+        ## close existing lots of the opposite sign first
+        while remaining != 0 and lots and np.sign(lots[0][0]) != np.sign(remaining):
+            lot = lots[0]
+            closed = np.sign(lot[0]) * min(abs(lot[0]), abs(remaining))
+            realized += closed * (price - lot[1])
+            self.cost_basis[idx] -= closed * lot[1]
+            lot[0] -= closed
+            remaining += closed
+            if lot[0] == 0:
+                lots.popleft()
+        if remaining != 0:
+            lots.append([remaining, price])
+            self.cost_basis[idx] += remaining * price
+        self.quantity[idx] += quantity
+        if self.quantity[idx] == 0:
+            self.cost_basis[idx] = 0.0
+        self.realized_pnl[idx] += realized
+        self.commission[idx] += commission
+        return realized
+
+    def unrealized_pnl(self, close: np.ndarray) -> np.ndarray:
+        """ mark to market of open positions at close, 0 where there is no price """
+        return np.where(np.isnan(close) | (self.quantity == 0), 0.0, self.quantity * close - self.cost_basis)
@@ -0,0 +1,99 @@
+import numpy as np
+
+from backtest.portfolio.weights import risk_parity
+
+
+class EWCovariance(object):
+    """
+    Exponentially weighted mean and covariance of per-bar returns, updated
+    in O(N^2) per bar instead of recomputing over a window.
+    Missing returns (NaN) carry no information: the asset's mean, variance
+    and covariances are left as they are for that bar.
+    """
+
+    def __init__(self, n: int, halflife: float = 60, min_periods: int = 20):
+        self.alpha = 1 - np.exp(np.log(0.5) / halflife)
+        self.min_periods = min_periods
+        self.mean = np.zeros(n)
+        self.cov = np.zeros((n, n))
+        self.count = np.zeros(n, dtype=np.int64)
+
+    def update(self, returns: np.ndarray):
+        observed = np.isfinite(returns)
+        d = np.where(observed, returns - self.mean, 0.0)
+        self.mean += self.alpha * d
+        ## only pairs observed together decay
+        self.cov *= 1 - self.alpha * np.outer(observed, observed)
+        self.cov += (self.alpha * (1 - self.alpha)) * np.outer(d, d)
+        self.count += observed
+
+    def ready(self) -> np.ndarray:
+        """ mask of assets with enough observations to be used """
+        return self.count >= self.min_periods
+
+
+def _shrink(cov: np.ndarray, shrinkage: float) -> np.ndarray:
+    """ shrinks towards the diagonal so the solve stays well conditioned """
+    target = np.diag(np.diag(cov))
+    return (1 - shrinkage) * cov + shrinkage * target
+
+
+def _long_only(solve, n: int) -> np.ndarray:
+    """
+    Active-set loop: solve on the remaining assets, drop those with
+    negative weight and repeat until all weights are non-negative.
+    All zeros (everything in cash) if no asset is left.
+    """
+    active = np.ones(n, dtype=bool)
+    while active.any():
+        w = np.zeros(n)
+        w[active] = solve(active)
+        if (w[active] >= 0).all():
+            total = w.sum()
+            return w / total if total > 0 else w
+        active &= w > 0
+    return np.zeros(n)
+
+
+def min_variance(mu: np.ndarray, cov: np.ndarray) -> np.ndarray:
+    ones = np.ones(len(cov))
+    return _long_only(lambda a: np.linalg.solve(cov[np.ix_(a, a)], ones[a]), len(cov))
+
+
+def max_sharpe(mu: np.ndarray, cov: np.ndarray) -> np.ndarray:
+    if (mu <= 0).all():
+        return min_variance(mu, cov)
+    return _long_only(lambda a: np.linalg.solve(cov[np.ix_(a, a)], mu[a]), len(cov))
+
+
+def mean_variance(mu: np.ndarray, cov: np.ndarray, risk_aversion: float = 10.0) -> np.ndarray:
+    """ max w'mu - risk_aversion/2 w'cov w subject to sum(w) = 1 """
+    def solve(a):
+        sub = cov[np.ix_(a, a)]
+        inv_mu = np.linalg.solve(sub, mu[a])
+        inv_one = np.linalg.solve(sub, np.ones(a.sum()))
+        gamma = (1 - inv_mu.sum() / risk_aversion) / inv_one.sum()
+        return inv_mu / risk_aversion + gamma * inv_one
+    return _long_only(solve, len(cov))
+
+
+OPTIMIZERS = {
+    "min_variance": min_variance,
+    "max_sharpe": max_sharpe,
+    "mean_variance": mean_variance,
+    "risk_parity": lambda mu, cov: risk_parity(cov),
+}
+
+
+def optimize(method: str, mu: np.ndarray, cov: np.ndarray, max_weight: float = None,
+             shrinkage: float = 0.1) -> np.ndarray:
+    """
+    Long-only target weights summing to 1 for the given expected returns and covariance.
+    max_weight caps single positions, the excess is left in cash.
+    """
+    if len(cov) == 0:
+        return np.zeros(0)
+    w = OPTIMIZERS[method](mu, _shrink(cov, shrinkage))
+    if max_weight is not None:
+        w = np.minimum(w, max_weight)
+    return w
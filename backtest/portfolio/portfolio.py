@@ -10,6 +10,9 @@ from abc import ABCMeta, abstractmethod
 from trading_common.event import FillEvent, OrderEvent, SignalEvent
 from backtest.performance import create_sharpe_ratio, create_drawdowns
 from backtest.portfolio.rebalance import NoRebalance
+from backtest.portfolio.optimizer import EWCovariance, optimize
+from backtest.portfolio.ledger import PositionLedger
+from backtest.utilities.journal import TradeJournal
 
 class Portfolio(object):
     __metaclass__ = ABCMeta
@@ -49,8 +52,13 @@ class NaivePortfolio(Portfolio):
         self.qty = stock_size
         self.expires = expires
         self.name = portfolio_name
+        self.ledger = PositionLedger(self.symbol_list)
+        self.journal = TradeJournal(self.symbol_list)
         self.current_holdings = self.construct_current_holdings()
         self.all_holdings = self.construct_all_holdings()
+        self.latest_close = np.full(len(self.symbol_list), np.nan)
+        ## last known close per symbol, what positions are marked at on bars without a price
+        self.last_close = np.full(len(self.symbol_list), np.nan)
         self.order_type = order_type
         self.portfolio_strategy = portfolio_strategy(self.bars, self.current_holdings, self.order_type)
         self.rebalance = rebalance(self.events, self.bars) if rebalance is not None else NoRebalance()
@@ -65,6 +73,8 @@ class NaivePortfolio(Portfolio):
             cash,
             daily_commission,
             total_asset,
+            realized_pnl,
+            unrealized_pnl,
         })
         """
         d = dict((s, 0.0) for s in self.symbol_list)
@@ -72,13 +82,16 @@ class NaivePortfolio(Portfolio):
         d['cash'] = self.initial_capital
         d['commission'] = 0.0
         d['total'] = self.initial_capital
+        d['realized_pnl'] = 0.0
+        d['unrealized_pnl'] = 0.0
         return [d]
 
     def construct_current_holdings(self, ):
         d = dict( (s, {
             'quantity': 0.0,
             'last_traded': None,
-            'last_trade_price': None
+            'last_trade_price': None,
+            'avg_cost': None,
         }) for s in self.symbol_list )
         d['cash'] = self.initial_capital
         d['commission'] = 0.0
@@ -86,28 +99,39 @@ class NaivePortfolio(Portfolio):
         return d
 
     def update_timeindex(self, event):
-        bars = {}
-        for sym in self.symbol_list:
-            bars[sym] = self.bars.get_latest_bars(sym, N=1)
-        self.current_holdings['datetime'] = bars[self.symbol_list[0]]['datetime'][0]
+        if hasattr(self.bars, "latest_field"):
+            ## calendar aligned handlers give the latest cross-section as arrays
+            self.current_holdings['datetime'] = self.bars.latest_datetime()
+            self.latest_close = self.bars.latest_field("close")
+        else:
+            bars = {}
+            for sym in self.symbol_list:
+                bars[sym] = self.bars.get_latest_bars(sym, N=1)
+            ## symbols that aren't listed yet have no bars
+            self.current_holdings['datetime'] = next(
+                bars[s]['datetime'][0] for s in self.symbol_list if len(bars[s]['datetime']) > 0)
+            ## latest close per symbol, NaN if there is no bar
+            self.latest_close = np.array([
+                bars[s]['close'][0] if 'close' in bars[s] and len(bars[s]['close']) > 0 else np.nan
+                for s in self.symbol_list])
 
         ## update holdings based off last trading day
-        dh = dict( (s,0) for s in self.symbol_list )
+        ## position size * last known close, 0 if the symbol never had a price
+        self.last_close = np.where(np.isnan(self.latest_close), self.last_close, self.latest_close)
+        market_val = np.where(np.isnan(self.last_close), 0.0, self.ledger.quantity * self.last_close)
+        dh = dict(zip(self.symbol_list, market_val.tolist()))
         dh['datetime'] = self.current_holdings['datetime']
         dh['cash'] = self.current_holdings['cash']
         dh['commission'] = self.current_holdings['commission']
-        dh['total'] = self.current_holdings['cash']
+        dh['total'] = self.current_holdings['cash'] + market_val.sum()
+        dh['realized_pnl'] = self.ledger.realized_pnl.sum()
+        dh['unrealized_pnl'] = self.ledger.unrealized_pnl(self.last_close).sum()
 
-        for s in self.symbol_list:
-            ## position size * close price
-            market_val = self.current_holdings[s]['quantity'] * (bars[s]['close'][0] if 'close' in bars[s] and len(bars[s]['close']) > 0 else 0)
-            dh[s] = market_val
-            dh['total'] += market_val
-        
         ## append current holdings
         self.all_holdings.append(dh)
         self.current_holdings["commission"] = 0.0  # reset commission for the day
-        self.rebalance.rebalance(self.symbol_list, self.current_holdings)
+        for order in self.rebalance.rebalance(self.symbol_list, self.current_holdings) or []:
+            self._put_to_event(order)
 
     def update_holdings_from_fill(self, fill: FillEvent):
         fill_dir = 0
@@ -116,17 +140,20 @@ class NaivePortfolio(Portfolio):
         elif fill.order_event.direction == OrderPosition.SELL:
             fill_dir = -1  
 
+        symbol = fill.order_event.symbol
         cash = fill_dir * fill.order_event.trade_price * fill.order_event.quantity
-        self.current_holdings[fill.order_event.symbol]['last_traded'] = fill.order_event.date
-        self.current_holdings[fill.order_event.symbol]["quantity"] += fill_dir*fill.order_event.quantity
-        # latest trade price. Might need to change to avg trade price
-        self.current_holdings[fill.order_event.symbol]['last_trade_price'] = fill.order_event.trade_price
+        self.ledger.on_fill(symbol, fill_dir * fill.order_event.quantity, fill.order_event.trade_price, fill.commission)
+        self.current_holdings[symbol]['last_traded'] = fill.order_event.date
+        self.current_holdings[symbol]["quantity"] += fill_dir*fill.order_event.quantity
+        self.current_holdings[symbol]['last_trade_price'] = fill.order_event.trade_price
+        self.current_holdings[symbol]['avg_cost'] = self.ledger.avg_cost_of(self.ledger.symbol_idx[symbol])
         self.current_holdings['commission'] += fill.commission
         self.current_holdings['cash'] -= (cash + fill.commission)
         
     def update_fill(self, event):
         if event.type == "FILL":
             self.update_holdings_from_fill(event)
+            self.journal.record(event, self.current_holdings['datetime'])
     
     def generate_order(self, signal:SignalEvent) -> OrderEvent:
         signal.quantity = self.qty
@@ -141,9 +168,22 @@ class NaivePortfolio(Portfolio):
             elif order.order_type == OrderType.MARKET:
                 self.events.put(order)
 
+    def _opens(self, signal:SignalEvent) -> bool:
+        """ whether a signal opens or adds to a position (BUY while not short, SELL while not long) """
+        cur_quantity = self.current_holdings[signal.symbol]["quantity"]
+        return (signal.signal_type == OrderPosition.BUY and cur_quantity >= 0) or \
+            (signal.signal_type == OrderPosition.SELL and cur_quantity <= 0)
+
     def update_signal(self, event):
         if event.type == 'SIGNAL':
+            ## point-in-time universes: no new or bigger positions in symbols that aren't
+            ## members today, exits and reductions always go through
+            if hasattr(self.bars, "is_active") and not self.bars.is_active(event.symbol) \
+                    and self._opens(event):
+                return
             order = self.generate_order(event)
+            if order is not None:
+                order.signal_datetime = event.datetime
             self._put_to_event(order)
 
     def create_equity_curve_df(self):
@@ -172,7 +212,7 @@ class NaivePortfolio(Portfolio):
         return stats
 
     def get_backtest_results(self,fp):
-        if self.equity_curve == None:
+        if getattr(self, "equity_curve", None) is None:
             raise Exception("Error: equity_curve is not initialized.")
         self.equity_curve.to_csv(fp)
 
@@ -198,4 +238,81 @@ class PercentagePortFolio(NaivePortfolio):
         size = int(self.current_holdings["cash"] * self.perc / latest_snapshot['close'][-1]) if self.mode == 'cash' \
             else int(self.all_holdings[-1]["total"] * self.perc / latest_snapshot['close'][-1])
         signal.quantity = size
-        return self.portfolio_strategy._filter_order_to_send(signal)
\ No newline at end of file
+        return self.portfolio_strategy._filter_order_to_send(signal)
+
+class OptimizedPortfolio(NaivePortfolio):
+    """
+    Sizes orders from optimized target weights instead of a fixed size.
+
+    Symbols with a BUY signal (or an open long position) form the candidate set.
+    Target weights over the candidates are solved with `optimizer`
+    ("min_variance" | "mean_variance" | "max_sharpe" | "risk_parity") from an
+    exponentially weighted covariance updated once per bar, and a BUY signal
+    becomes an order for the difference between the position and its target
+    weight of total equity: a buy of the shortfall, or a sell of the excess when
+    the target shrank. A held symbol is only resized when it gets a BUY signal.
+    SELL / EXIT_LONG signals drop the symbol from the candidates and are sent
+    through portfolio_strategy, which closes the position. Long only.
+    """
+    def __init__(self, bars, events, order_queue, portfolio_name, optimizer="min_variance",
+                halflife: float = 60, min_periods: int = 20, max_weight: float = None,
+                initial_capital=100000.0, rebalance=None, order_type=OrderType.LIMIT,
+                portfolio_strategy=DefaultOrder, expires:int = 1):
+        super().__init__(bars, events, order_queue, 0, portfolio_name,
+                        initial_capital=initial_capital, rebalance=rebalance, portfolio_strategy=portfolio_strategy,
+                        order_type=order_type, expires=expires)
+        self.optimizer = optimizer
+        self.max_weight = max_weight
+        self.covariance = EWCovariance(len(self.symbol_list), halflife, min_periods)
+        self.symbol_idx = dict((s, idx) for idx, s in enumerate(self.symbol_list))
+        self.candidates = np.zeros(len(self.symbol_list), dtype=bool)
+        self.target_weights = np.zeros(len(self.symbol_list))
+        self._prev_close = None
+        self._solved = False
+
+    def update_timeindex(self, event):
+        super().update_timeindex(event)
+        if self._prev_close is not None:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                self.covariance.update(self.latest_close / self._prev_close - 1)
+        self._prev_close = np.where(np.isnan(self.latest_close), self._prev_close, self.latest_close) \
+            if self._prev_close is not None else self.latest_close.copy()
+        self._solved = False
+
+    def _solve(self):
+        usable = self.candidates & self.covariance.ready()
+        cov = self.covariance.cov[np.ix_(usable, usable)]
+        self.target_weights = np.zeros(len(self.symbol_list))
+        self.target_weights[usable] = optimize(self.optimizer, self.covariance.mean[usable], cov,
+                                               max_weight=self.max_weight)
+        self._solved = True
+
+    def generate_order(self, signal:SignalEvent) -> OrderEvent:
+        idx = self.symbol_idx[signal.symbol]
+        cur_quantity = self.current_holdings[signal.symbol]["quantity"]
+        is_candidate = signal.signal_type == OrderPosition.BUY or \
+            (cur_quantity > 0 and signal.signal_type not in (OrderPosition.SELL, OrderPosition.EXIT_LONG))
+        if is_candidate != self.candidates[idx]:
+            self.candidates[idx] = is_candidate
+            self._solved = False
+
+        if signal.signal_type != OrderPosition.BUY:
+            if cur_quantity == 0:
+                return
+            signal.quantity = 0
+            return self.portfolio_strategy._filter_order_to_send(signal)
+
+        if not self._solved:
+            self._solve()
+        close = self.latest_close[idx]
+        if np.isnan(close) or close == 0.0:
+            return
+        target = int(self.target_weights[idx] * self.all_holdings[-1]["total"] / close)
+        delta = target - cur_quantity
+        if delta == 0 or (delta < 0 and cur_quantity <= 0):
+            return
+        signal.quantity = abs(delta)
+        order = OrderEvent(signal.symbol, self.current_holdings['datetime'], abs(delta),
+                           OrderPosition.BUY if delta > 0 else OrderPosition.SELL, signal.price)
+        order.signal_price = signal.price
+        return order
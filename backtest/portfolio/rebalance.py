@@ -1,9 +1,13 @@
 from abc import ABCMeta, abstractmethod
+import numpy as np
+import pandas as pd
 from trading_common.data.dataHandler import DataHandler
 from trading_common.utilities.enum import OrderPosition
-from trading_common.event import SignalEvent
+from trading_common.event import OrderEvent, SignalEvent
 
-class Rebalance(metaclass=ABCMeta):                
+from backtest.portfolio.weights import WEIGHTINGS
+
+class Rebalance(metaclass=ABCMeta):
     def __init__(self, events, bars: DataHandler) -> None:
         self.events = events
         self.bars = bars
@@ -17,10 +21,39 @@ class Rebalance(metaclass=ABCMeta):
     @abstractmethod
     def rebalance(self, stock_list, current_holdings):
         """
-        Updates portfolio based on rebalancing criteria
+        Updates portfolio based on rebalancing criteria, by putting signals on
+        the events queue or by returning sized OrderEvents, which the portfolio
+        sends like its own orders (order_type, expires)
         """
         raise NotImplementedError("Should implement rebalance(). If not required, just pass")
 
+    def _latest_closes(self, stock_list, N: int = 1) -> np.ndarray:
+        """
+        (len(stock_list) x N) array of the latest N closes, oldest first.
+        Symbols with less than N bars are NaN padded at the front.
+        """
+        if hasattr(self.bars, "latest_window") and list(stock_list) == self.bars.symbol_list:
+            return self.bars.latest_window(N, "close")
+        closes = np.full((len(stock_list), N), np.nan)
+        for idx, symbol in enumerate(stock_list):
+            close = self.bars.get_latest_bars(symbol, N)['close']
+            if len(close) > 0:
+                closes[idx, N - len(close):] = close
+        return closes
+
+    @staticmethod
+    def _holding_arrays(stock_list, current_holdings):
+        """ quantity and average cost arrays aligned to stock_list """
+        quantity = np.array([current_holdings[s]['quantity'] for s in stock_list], dtype=np.float64)
+        avg_cost = np.array([current_holdings[s]['avg_cost'] or np.nan for s in stock_list], dtype=np.float64)
+        return quantity, avg_cost
+
+    def _exit_signals(self, stock_list, current_holdings, mask, quantity, close):
+        """ puts 1 EXIT signal for each position selected by mask """
+        for idx in np.flatnonzero(mask):
+            direction = OrderPosition.EXIT_LONG if quantity[idx] > 0 else OrderPosition.EXIT_SHORT
+            self.events.put(SignalEvent(stock_list[idx], current_holdings['datetime'], direction, close[idx]))
+
 class NoRebalance():
     ''' No variables initialized as need_balance returns false'''
     def need_rebalance(self, current_holdings):
@@ -40,11 +73,12 @@ class BaseRebalance(Rebalance):
 
     def rebalance(self, stock_list, current_holdings) -> None:
         if self.need_rebalance(current_holdings):
-            for symbol in stock_list:
-                latest_close_price = self.bars.get_latest_bars(symbol)['close'][-1]
-                ## only 1 will go through if there is position
-                self.events.put(SignalEvent(symbol, current_holdings['datetime'], OrderPosition.EXIT_LONG, latest_close_price))
-                self.events.put(SignalEvent(symbol, current_holdings['datetime'], OrderPosition.EXIT_SHORT, latest_close_price))
+            quantity, _ = self._holding_arrays(stock_list, current_holdings)
+            held = quantity != 0
+            if not held.any():
+                return
+            close = self._latest_closes(stock_list)[:, -1]
+            self._exit_signals(stock_list, current_holdings, held, quantity, close)
 
 class SellLongLosers(Rebalance):
     def __init__(self, events, bars) -> None:
@@ -56,10 +90,74 @@ class SellLongLosers(Rebalance):
 
     def rebalance(self, stock_list, current_holdings) -> None:
         if self.need_rebalance(current_holdings):
-            for symbol in stock_list:
-                ## sell all losers
-                latest_close_price = self.bars.get_latest_bars(symbol)['close'][-1]
-                if current_holdings[symbol]["quantity"] > 0 and latest_close_price < current_holdings[symbol]["last_trade_price"]:
-                    self.events.put(SignalEvent(symbol, current_holdings['datetime'], OrderPosition.EXIT_LONG, latest_close_price))
-                elif current_holdings[symbol]["quantity"] < 0 and latest_close_price > current_holdings[symbol]["last_trade_price"]:
-                    self.events.put(SignalEvent(symbol, current_holdings['datetime'], OrderPosition.EXIT_SHORT, latest_close_price))
\ No newline at end of file
+            quantity, avg_cost = self._holding_arrays(stock_list, current_holdings)
+            if not (quantity != 0).any():
+                return
+            close = self._latest_closes(stock_list)[:, -1]
+            ## sell all losers against their average cost
+            losers = ((quantity > 0) & (close < avg_cost)) | ((quantity < 0) & (close > avg_cost))
+            self._exit_signals(stock_list, current_holdings, losers, quantity, close)
+
+
+class TargetWeightRebalance(Rebalance):
+    '''
+    Trades the whole universe towards target weights once per period, returning
+    only the net order needed per symbol for the portfolio to send. The weights
+    are long only, so a sell never takes a position short. Pass extra arguments with
+    functools.partial, eg. rebalance=partial(TargetWeightRebalance, weighting="risk_parity")
+
+    weighting - "equal" | "inverse_vol" | "risk_parity", or a function of a (T x N) returns array
+    period - pandas period alias to rebalance on, eg. "M", "Q", "Y"
+    lookback - number of bars used to estimate volatility / covariance
+    max_turnover - cap on sum(|traded value|) / total equity per rebalance, trades scaled down pro rata
+    min_trade_value - skip trades smaller than this
+    '''
+    def __init__(self, events, bars, weighting="equal", period: str = "M", lookback: int = 60,
+                 max_turnover: float = None, min_trade_value: float = 0.0) -> None:
+        super().__init__(events, bars)
+        self.weighting = WEIGHTINGS[weighting] if isinstance(weighting, str) else weighting
+        self.period = period
+        self.lookback = lookback
+        self.max_turnover = max_turnover
+        self.min_trade_value = min_trade_value
+        self._last_period = None
+
+    def need_rebalance(self, current_holdings):
+        return pd.Timestamp(current_holdings['datetime']).to_period(self.period) != self._last_period
+
+    def target_weights(self, closes: np.ndarray) -> np.ndarray:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            returns = (closes[:, 1:] / closes[:, :-1] - 1).T
+        return self.weighting(returns)
+
+    def order_quantities(self, quantity, close, cash, weights) -> np.ndarray:
+        """ signed share quantities to trade to move the holdings to weights """
+        priced = np.isfinite(close) & (close > 0)
+        value = np.where(priced, quantity * close, 0.0)
+        equity = cash + value.sum()
+        delta_value = np.where(priced, weights * equity - value, 0.0)
+        if self.max_turnover is not None and equity > 0:
+            turnover = np.abs(delta_value).sum() / equity
+            if turnover > self.max_turnover:
+                delta_value *= self.max_turnover / turnover
+        delta_value[np.abs(delta_value) < self.min_trade_value] = 0.0
+        return np.trunc(np.divide(delta_value, close, out=np.zeros_like(delta_value), where=priced))
+
+    def rebalance(self, stock_list, current_holdings) -> list:
+        if not self.need_rebalance(current_holdings):
+            return []
+        self._last_period = pd.Timestamp(current_holdings['datetime']).to_period(self.period)
+        closes = self._latest_closes(stock_list, self.lookback + 1)
+        close = closes[:, -1]
+        quantity, _ = self._holding_arrays(stock_list, current_holdings)
+        weights = self.target_weights(closes)
+        trade = self.order_quantities(quantity, close, current_holdings['cash'], weights)
+        ## buys come first so that on the LIFO event queue the sells execute first and free up cash
+        orders = []
+        for idx in sorted(np.flatnonzero(trade), key=lambda i: trade[i] > 0, reverse=True):
+            direction = OrderPosition.BUY if trade[idx] > 0 else OrderPosition.SELL
+            order = OrderEvent(stock_list[idx], current_holdings['datetime'], abs(trade[idx]), direction, close[idx])
+            order.signal_price = close[idx]
+            order.signal_datetime = current_holdings['datetime']
+            orders.append(order)
+        return orders
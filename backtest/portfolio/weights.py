@@ -0,0 +1,81 @@
+import logging
+
+import numpy as np
+
+## weighting schemes over a universe of N assets.
+## returns are (T x N) arrays of period returns, NaN where unavailable.
+## every function returns long-only weights summing to 1 (0 for unusable assets).
+
+
+def _normalize(w: np.ndarray) -> np.ndarray:
+    w = np.where(np.isfinite(w) & (w > 0), w, 0.0)
+    total = w.sum()
+    return w / total if total > 0 else w
+
+
+def equal_weight(returns: np.ndarray) -> np.ndarray:
+    usable = np.isfinite(returns).any(axis=0) if returns.ndim == 2 else np.ones(len(returns), dtype=bool)
+    return _normalize(usable.astype(np.float64))
+
+
+def inverse_vol(returns: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return _normalize(1.0 / np.nanstd(returns, axis=0))
+
+
+def risk_parity(cov: np.ndarray, iterations: int = 500, tol: float = 1e-8) -> np.ndarray:
+    """
+    Equal risk contribution weights, w_i * (cov @ w)_i equal for every i.
+    Cyclical coordinate descent on min 1/2 y'cov y - sum(log y) / n, whose
+    minimizer normalized is the solution; it converges for any covariance,
+    including ones with negative correlations. Stops once every risk
+    contribution is within tol (relative) of their mean.
+    """
+    var = np.diag(cov)
+    usable = np.isfinite(var) & (var > 0)
+    w = np.zeros(len(cov))
+    if not usable.any():
+        return w
+    sub = cov[np.ix_(usable, usable)]
+    n = len(sub)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        y = 1.0 / np.sqrt(np.diag(sub)) / n
+    cov_y = sub @ y
+    for _ in range(iterations):
+        for i in range(n):
+            others = cov_y[i] - sub[i, i] * y[i]
+            new_y = (-others + np.sqrt(others * others + 4 * sub[i, i] / n)) / (2 * sub[i, i])
+            cov_y += sub[:, i] * (new_y - y[i])
+            y[i] = new_y
+        contribution = y * cov_y
+        if np.abs(contribution / contribution.mean() - 1).max() < tol:
+            break
+    else:
+        logging.info(f"risk_parity did not converge in {iterations} iterations")
+    w[usable] = y / y.sum()
+    return w
+
+
+def nan_cov(returns: np.ndarray) -> np.ndarray:
+    """
+    pairwise-complete covariance: each pair over the rows where both assets
+    have a return, so a late listed asset doesn't cut the window of the others.
+    NaN variance for assets with fewer than 2 returns, 0 covariance for pairs
+    that overlap less than that
+    """
+    observed = np.isfinite(returns).astype(np.float64)
+    x = np.where(observed > 0, returns, 0.0)
+    n = observed.T @ observed
+    sums = x.T @ observed  # sums[i, j]: asset i over the rows asset j has too
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = (x.T @ x - sums * sums.T / n) / (n - 1)
+    cov = np.where(n >= 2, cov, 0.0)
+    np.fill_diagonal(cov, np.where(np.diag(n) >= 2, np.diag(cov), np.nan))
+    return cov
+
+
+WEIGHTINGS = {
+    "equal": equal_weight,
+    "inverse_vol": inverse_vol,
+    "risk_parity": lambda returns: risk_parity(nan_cov(returns)),
+}
@@ -0,0 +1,221 @@
+"""
+Results database for backtest runs.
+
+    store = ResultsStore("results")
+    store.save(port, spec)                      # or add(row) + flush() for batches
+    store.top(10, family="BoundedTA")          # best runs of a strategy family by sharpe
+    store.compare(config_hash(spec))            # the same config over different dates / data
+    store.equity_curve(run_id), store.trades(run_id)
+
+Layout of the store directory:
+    index.sqlite - one row per run: config hash, data version, dates and
+        summary stats, with indexes for the usual queries
+    runs/<run_id>/equity.parquet, runs/<run_id>/trades.parquet
+
+Equity curves and trades are written as Parquet files by whoever produced
+them (eg. batch workers, write_run_files) while index rows are buffered and
+inserted batch_size at a time in one transaction, so a parallel sweep never
+waits on the database. Needs pyarrow.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from backtest.robustness import return_metrics
+
+STATS = ("total_return", "sharpe", "max_drawdown", "drawdown_duration", "n_trades", "lowest_cash")
+COLUMNS = ("run_id", "name", "family", "config_hash", "data_version", "start_date", "end_date", "created") \
+    + STATS + ("config", "equity_path", "trades_path")
+## keys that don't change what a run computes, plus the dates so runs of one config over
+## different periods share a hash
+_UNHASHED_KEYS = ("name", "log", "plot", "checkpoint", "results", "dates", "cache")
+
+
+def config_hash(spec: dict) -> str:
+    """
+    sha1 of the spec without its name, dates, logging / plotting / caching
+    options, signal recording and shared memory handle. Takes the spec as
+    written: a universe resolved for some dates hashes differently
+    """
+    spec = dict((k, v) for k, v in spec.items() if k not in _UNHASHED_KEYS)
+    if "data" in spec:
+        spec["data"] = dict((k, v) for k, v in spec["data"].items() if k != "handle")
+    if "signals" in spec:
+        spec["signals"] = dict((k, v) for k, v in spec["signals"].items() if k != "record")
+        if not spec["signals"]:
+            del spec["signals"]
+    return hashlib.sha1(json.dumps(spec, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def data_version(csv_dir: str, symbol_list) -> str:
+    """ sha1 of the names, sizes and modification times of {csv_dir}/{symbol}.csv """
+    h = hashlib.sha1()
+    for symbol in sorted(symbol_list):
+        fp = os.path.join(csv_dir, f"{symbol}.csv")
+        if os.path.exists(fp):
+            st = os.stat(fp)
+            h.update(f"{symbol}:{st.st_size}:{st.st_mtime_ns};".encode())
+    return h.hexdigest()
+
+
+def summary_stats(port) -> dict:
+    """ numeric output_summary_stats of a finished portfolio """
+    curve = port.equity_curve
+    returns = curve["equity_returns"].to_numpy(dtype=np.float64)
+    metrics = return_metrics(returns[None, :]) if len(returns) > 0 else {}
+    stats = dict((name, float(value[0])) for name, value in metrics.items())
+    stats["n_trades"] = len(port.journal)
+    stats["lowest_cash"] = float(curve["cash"].min()) if len(curve) > 0 else np.nan
+    return stats
+
+
+def write_run_files(root: str, run_id: str, port) -> tuple:
+    """ writes the equity curve and trades of a run under root. Returns their paths relative to root """
+    run_dir = os.path.join("runs", run_id)
+    os.makedirs(os.path.join(root, run_dir), exist_ok=True)
+    equity_path = os.path.join(run_dir, "equity.parquet")
+    port.equity_curve.to_parquet(os.path.join(root, equity_path))
+    trades_path = os.path.join(run_dir, "trades.parquet")
+    port.journal.export(os.path.join(root, trades_path))
+    return equity_path, trades_path
+
+
+def run_record(root: str, port, spec: dict = None, name: str = None, family: str = None,
+               config_hash_: str = None, data_version_: str = None) -> dict:
+    """
+    Writes the run's files and returns its index row, for ResultsStore.add.
+    family defaults to the spec's strategy class.
+    """
+    spec = spec if spec is not None else {}
+    run_id = uuid.uuid4().hex
+    equity_path, trades_path = write_run_files(root, run_id, port)
+    curve = port.equity_curve
+    row = {
+        "run_id": run_id,
+        "name": name if name is not None else spec.get("name", port.name),
+        "family": family if family is not None else spec.get("strategy", {}).get("class"),
+        "config_hash": config_hash_ if config_hash_ is not None else (config_hash(spec) if spec else None),
+        "data_version": data_version_,
+        "start_date": str(curve.index[0].date()) if len(curve) > 0 else None,
+        "end_date": str(curve.index[-1].date()) if len(curve) > 0 else None,
+        "created": time.time(),
+        "config": json.dumps(spec, sort_keys=True, default=str) if spec else None,
+        "equity_path": equity_path,
+        "trades_path": trades_path,
+    }
+    row.update(dict((stat, None) for stat in STATS))
+    row.update(summary_stats(port))
+    return row
+
+
+class ResultsStore(object):
+    def __init__(self, root: str = "results", batch_size: int = 100):
+        self.root = root
+        self.batch_size = batch_size
+        self._pending = []
+        os.makedirs(root, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(root, "index.sqlite"))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                name TEXT,
+                family TEXT,
+                config_hash TEXT,
+                data_version TEXT,
+                start_date TEXT,
+                end_date TEXT,
+                created REAL NOT NULL,
+                {", ".join(f"{stat} REAL" for stat in STATS)},
+                config TEXT,
+                equity_path TEXT,
+                trades_path TEXT
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_family_sharpe ON runs (family, sharpe)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_config ON runs (config_hash, start_date, end_date)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_dates ON runs (start_date, end_date)")
+        self.conn.commit()
+
+    def add(self, row: dict):
+        """ buffers an index row (run_record), written once batch_size rows are pending """
+        self._pending.append(tuple(row.get(col) for col in COLUMNS))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if len(self._pending) == 0:
+            return
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO runs VALUES ({', '.join('?' * len(COLUMNS))})", self._pending)
+        self._pending = []
+
+    def save(self, port, spec: dict = None, **kwargs) -> str:
+        """ records a finished portfolio right away. Returns its run_id """
+        row = run_record(self.root, port, spec, **kwargs)
+        self.add(row)
+        self.flush()
+        return row["run_id"]
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def query(self, where: str = None, params: tuple = (), order_by: str = None, limit: int = None) -> pd.DataFrame:
+        """ runs matching an SQL where clause, eg. query("sharpe > ? AND family = ?", (1, "BoundedTA")) """
+        self.flush()
+        sql = "SELECT * FROM runs"
+        if where:
+            sql += f" WHERE {where}"
+        if order_by:
+            sql += f" ORDER BY {order_by}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return pd.read_sql_query(sql, self.conn, params=params).set_index("run_id")
+
+    def top(self, n: int = 10, metric: str = "sharpe", family: str = None, start: str = None,
+            end: str = None, ascending: bool = False) -> pd.DataFrame:
+        """ best n runs by metric, optionally of one strategy family and within dates """
+        if metric not in STATS:
+            raise Exception(f"metric has to be one of {STATS}")
+        clauses, params = [f"{metric} IS NOT NULL"], []
+        if family is not None:
+            clauses.append("family = ?")
+            params.append(family)
+        if start is not None:
+            clauses.append("start_date >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("end_date <= ?")
+            params.append(end)
+        return self.query(" AND ".join(clauses), tuple(params),
+                          order_by=f"{metric} {'ASC' if ascending else 'DESC'}", limit=n)
+
+    def compare(self, config_hash_: str) -> pd.DataFrame:
+        """ every run of one config, eg. over different dates or data versions, by start date """
+        return self.query("config_hash = ?", (config_hash_,), order_by="start_date, end_date, created")
+
+    def _path(self, run_id: str, column: str) -> str:
+        self.flush()
+        row = self.conn.execute(f"SELECT {column} FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        if row is None:
+            raise Exception(f"No run {run_id} in {self.root}")
+        return os.path.join(self.root, row[0])
+
+    def equity_curve(self, run_id: str) -> pd.DataFrame:
+        return pd.read_parquet(self._path(run_id, "equity_path"))
+
+    def trades(self, run_id: str) -> pd.DataFrame:
+        return pd.read_parquet(self._path(run_id, "trades_path"))
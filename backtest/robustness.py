@@ -0,0 +1,151 @@
+"""
+Resampling based confidence intervals for backtest metrics.
+
+    robustness(port.equity_curve, method="block")
+    robustness(port.equity_curve, trades=port.journal.round_trips(), method="shuffle")
+
+Methods:
+block - circular block bootstrap of the daily returns, keeps autocorrelation within blocks
+perturb - returns plus gaussian noise of `noise` x their standard deviation
+shuffle - the round trip PnLs in random order (with replacement if replace=True).
+    Total return only changes with replacement, drawdowns show how much the
+    observed one owes to the order the trades happened in.
+
+Every resample is a row of a (samples x periods) matrix and the metrics are
+computed on whole matrices at once. Samples are split in chunks of `chunk`
+rows spread over a process pool, each chunk with its own seed spawned from
+`seed`, so results don't depend on the number of workers.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+METHODS = ("block", "perturb", "shuffle")
+
+
+def sharpe(returns: np.ndarray, periods: int = 252) -> np.ndarray:
+    """ create_sharpe_ratio over the last axis """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.sqrt(periods) * returns.mean(axis=-1) / returns.std(axis=-1)
+
+
+def drawdowns(curve: np.ndarray):
+    """
+    create_drawdowns over the last axis of equity curves:
+    max drawdown (high water mark - curve) and the longest stretch under water
+    """
+    hwm = np.maximum(np.maximum.accumulate(curve, axis=-1), 0)
+    drawdown = hwm - curve
+    periods = np.arange(curve.shape[-1])
+    last_high = np.maximum.accumulate(np.where(drawdown == 0, periods, 0), axis=-1)
+    return drawdown.max(axis=-1), (periods - last_high).max(axis=-1)
+
+
+def return_metrics(returns: np.ndarray, periods: int = 252) -> dict:
+    """ metrics of a (samples x periods) matrix of period returns """
+    curve = np.cumprod(1 + returns, axis=-1)
+    max_dd, dd_duration = drawdowns(curve)
+    return {
+        "total_return": curve[..., -1] - 1,
+        "sharpe": sharpe(returns, periods),
+        "max_drawdown": max_dd,
+        "drawdown_duration": dd_duration,
+    }
+
+
+def trade_metrics(pnl: np.ndarray, initial_capital: float) -> dict:
+    """ metrics of a (samples x trades) matrix of trade PnLs, drawdown durations in trades """
+    curve = 1 + np.cumsum(pnl, axis=-1) / initial_capital
+    max_dd, dd_duration = drawdowns(curve)
+    return {
+        "total_return": curve[..., -1] - 1,
+        "max_drawdown": max_dd,
+        "drawdown_duration": dd_duration,
+    }
+
+
+def block_indices(n_periods: int, n_samples: int, block: int, rng) -> np.ndarray:
+    """ (n_samples x n_periods) indices of circular blocks of `block` periods with random starts """
+    n_blocks = -(-n_periods // block)
+    starts = rng.integers(0, n_periods, size=(n_samples, n_blocks, 1))
+    return ((starts + np.arange(block)) % n_periods).reshape(n_samples, -1)[:, :n_periods]
+
+
+def _resample_chunk(method: str, data: np.ndarray, n_samples: int, seed, params: dict) -> dict:
+    rng = np.random.default_rng(seed)
+    if method == "block":
+        idx = block_indices(len(data), n_samples, params["block"], rng)
+        return return_metrics(data[idx], params["periods"])
+    elif method == "perturb":
+        noise = rng.normal(0.0, params["noise"] * data.std(), size=(n_samples, len(data)))
+        return return_metrics(data + noise, params["periods"])
+    elif method == "shuffle":
+        if params["replace"]:
+            pnl = data[rng.integers(0, len(data), size=(n_samples, len(data)))]
+        else:
+            pnl = rng.permuted(np.tile(data, (n_samples, 1)), axis=1)
+        return trade_metrics(pnl, params["initial_capital"])
+    raise Exception(f"method has to be one of {METHODS}, got {method}")
+
+
+def resample(method: str, data: np.ndarray, n_samples: int, params: dict, seed=0,
+             chunk: int = 500, max_workers: int = None) -> dict:
+    """ metric name -> array of n_samples resampled values """
+    data = np.asarray(data, dtype=np.float64)
+    sizes = [min(chunk, n_samples - start) for start in range(0, n_samples, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [(method, data, size, s, params) for size, s in zip(sizes, seeds)]
+    if max_workers == 1 or len(args) == 1:
+        results = [_resample_chunk(*a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(_resample_chunk, *zip(*args)))
+    return dict((name, np.concatenate([r[name] for r in results])) for name in results[0])
+
+
+def robustness(equity_curve: pd.DataFrame, trades=None, method: str = "block", n_samples: int = 5000,
+               confidence: float = 0.95, block: int = 20, noise: float = 0.5, replace: bool = False,
+               periods: int = 252, seed=0, chunk: int = 500, max_workers: int = None,
+               return_samples: bool = False):
+    """
+    Confidence intervals of the backtest metrics.
+
+    equity_curve - NaivePortfolio.equity_curve (equity_returns, equity_curve and total columns)
+    trades - round trips with a pnl column (TradeJournal.round_trips()) or an
+        array of trade PnLs, needed for method="shuffle"
+    Returns a DataFrame indexed by metric with the observed value, the mean and
+    standard deviation of the resamples and the lower / upper bounds, plus the
+    samples themselves if return_samples.
+    """
+    if method not in METHODS:
+        raise Exception(f"method has to be one of {METHODS}, got {method}")
+    returns = equity_curve["equity_returns"].to_numpy(dtype=np.float64)
+    if method == "shuffle":
+        if trades is None:
+            raise Exception("method='shuffle' needs the trades")
+        data = trades["pnl"].to_numpy(dtype=np.float64) if isinstance(trades, pd.DataFrame) \
+            else np.asarray(trades, dtype=np.float64)
+        if len(data) == 0:
+            raise Exception("No trades to shuffle")
+        ## capital before the first return of the curve
+        initial_capital = equity_curve["total"].iloc[0] / equity_curve["equity_curve"].iloc[0]
+        params = {"replace": replace, "initial_capital": initial_capital}
+        observed = trade_metrics(data[None, :], initial_capital)
+    else:
+        data = returns
+        params = {"block": block, "noise": noise, "periods": periods}
+        observed = return_metrics(returns[None, :], periods)
+
+    samples = resample(method, data, n_samples, params, seed=seed, chunk=chunk, max_workers=max_workers)
+    alpha = (1 - confidence) / 2
+    summary = pd.DataFrame({
+        "observed": [observed[name][0] for name in samples],
+        "mean": [np.nanmean(samples[name]) for name in samples],
+        "std": [np.nanstd(samples[name]) for name in samples],
+        "lower": [np.nanquantile(samples[name], alpha) for name in samples],
+        "upper": [np.nanquantile(samples[name], 1 - alpha) for name in samples],
+    }, index=list(samples))
+    if return_samples:
+        return summary, pd.DataFrame(samples)
+    return summary
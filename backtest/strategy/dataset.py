@@ -0,0 +1,192 @@
+"""
+Out-of-core pooled training sets for the statistical strategies.
+
+Pooling every symbol's features into one DataFrame needs the whole universe
+(and a couple of copies of it) in RAM. build_dataset runs a
+BaseStatisticalData processor one symbol at a time and writes its rows
+straight into memory-mapped files:
+
+    dataset = build_dataset(BaseStatisticalData(bars, 30, 2), csv_frames("data/data/daily", symbols),
+                            "data/datasets/reg30")
+    dataset.partial_fit(SGDRegressor(), batch_size=65536)
+
+Layout of a dataset directory:
+    X.f32 - float32 (rows x features), y.f32 - float32 targets,
+    symbol.i32 - index into symbols, date.i64 - epoch ns of the row,
+    meta.json - columns, symbols and number of rows
+Files grow by doubling while building (pass capacity, eg. the total number
+of bars, to allocate once) and are cut to size at the end.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from backtest.data.shared import _read_csv
+
+## file name -> dtype of the dataset arrays
+DATASET_FILES = {
+    "X": ("X.f32", np.float32),
+    "y": ("y.f32", np.float32),
+    "symbol": ("symbol.i32", np.int32),
+    "date": ("date.i64", np.int64),
+}
+
+
+def csv_frames(csv_dir: str, symbol_list, start_date=None, end_date=None):
+    """ (symbol, bars DataFrame) of {csv_dir}/{symbol}.csv, one at a time """
+    for symbol in symbol_list:
+        df = _read_csv(csv_dir, symbol)
+        yield symbol, df.loc[start_date:end_date]
+
+
+class PooledDataset(object):
+    def __init__(self, path: str, mode: str = "r"):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        self.columns = meta["columns"]
+        self.symbols = meta["symbols"]
+        self.n_rows = meta["n_rows"]
+        self._open(mode)
+
+    def _open(self, mode: str):
+        rows = self.n_rows
+        for name, (fname, dtype) in DATASET_FILES.items():
+            shape = (rows, len(self.columns)) if name == "X" else (rows,)
+            ## np.memmap can't map an empty file
+            arr = np.memmap(os.path.join(self.path, fname), dtype=dtype, mode=mode, shape=shape) \
+                if rows > 0 else np.zeros(shape, dtype=dtype)
+            setattr(self, name, arr)
+
+    def __len__(self):
+        return self.n_rows
+
+    def _slice(self, idx) -> tuple:
+        return np.asarray(self.X[idx]), np.asarray(self.y[idx])
+
+    def index(self, start_date=None, end_date=None, symbols=None) -> np.ndarray:
+        """ rows between the dates (inclusive) and of the given symbols """
+        mask = np.ones(self.n_rows, dtype=bool)
+        dates = self.date[:self.n_rows]
+        if start_date is not None:
+            mask &= dates >= pd.Timestamp(start_date).value
+        if end_date is not None:
+            mask &= dates <= pd.Timestamp(end_date).value
+        if symbols is not None:
+            codes = [self.symbols.index(s) for s in symbols if s in self.symbols]
+            mask &= np.isin(self.symbol[:self.n_rows], codes)
+        return np.flatnonzero(mask)
+
+    def batches(self, batch_size: int = 65536, idx: np.ndarray = None, shuffle: bool = False, seed=None):
+        """
+        yields (X, y) mini-batches of the rows in idx (all rows by default),
+        read from the memory maps batch by batch
+        """
+        if idx is None and not shuffle:
+            for start in range(0, self.n_rows, batch_size):
+                yield self._slice(slice(start, min(start + batch_size, self.n_rows)))
+            return
+        idx = np.arange(self.n_rows) if idx is None else np.asarray(idx)
+        if shuffle:
+            idx = np.random.default_rng(seed).permutation(idx)
+        for start in range(0, len(idx), batch_size):
+            ## sorted reads touch the file front to back
+            yield self._slice(np.sort(idx[start:start + batch_size]))
+
+    def partial_fit(self, estimator, batch_size: int = 65536, epochs: int = 1, idx: np.ndarray = None,
+                    shuffle: bool = True, seed=None, **fit_params):
+        """
+        trains an estimator with partial_fit (eg. SGDRegressor, SGDClassifier,
+        MLPRegressor) over mini-batches. Classifiers need classes= on the first call,
+        which is taken from y if not given.
+        """
+        if not hasattr(estimator, "partial_fit"):
+            raise Exception(f"{type(estimator).__name__} has no partial_fit(), use load() and fit() instead")
+        from sklearn.base import is_classifier
+        if is_classifier(estimator):
+            fit_params.setdefault("classes", np.unique(np.asarray(self.y[:self.n_rows])))
+        for epoch in range(epochs):
+            for X, y in self.batches(batch_size, idx, shuffle, None if seed is None else seed + epoch):
+                estimator.partial_fit(X, y, **fit_params)
+        return estimator
+
+    def load(self, idx: np.ndarray = None) -> tuple:
+        """ (X, y) of the rows in idx in memory, for estimators without partial_fit """
+        return self._slice(slice(0, self.n_rows) if idx is None else np.sort(np.asarray(idx)))
+
+
+class DatasetWriter(object):
+    """ appends feature / target chunks to the files of a new dataset """
+
+    def __init__(self, path: str, columns, capacity: int = 1 << 16):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.columns = list(columns)
+        self.symbols = []
+        self.n_rows = 0
+        self.capacity = max(int(capacity), 1)
+        for _, (fname, _) in DATASET_FILES.items():
+            open(os.path.join(path, fname), "wb").close()
+        self._resize(self.capacity)
+
+    def _resize(self, rows: int):
+        """ grows or cuts the files to rows; extending a file doesn't copy what is in it """
+        for name, (fname, dtype) in DATASET_FILES.items():
+            width = len(self.columns) if name == "X" else 1
+            os.truncate(os.path.join(self.path, fname), rows * width * np.dtype(dtype).itemsize)
+        self.capacity = rows
+        self._maps = dict((name, np.memmap(os.path.join(self.path, fname), dtype=dtype, mode="r+",
+                                           shape=(rows, len(self.columns)) if name == "X" else (rows,)))
+                          for name, (fname, dtype) in DATASET_FILES.items()) if rows > 0 else {}
+
+    def append(self, symbol, X: np.ndarray, y: np.ndarray, dates: np.ndarray):
+        n = len(y)
+        if n == 0:
+            return
+        if self.n_rows + n > self.capacity:
+            self.flush()
+            self._resize(max(2 * self.capacity, self.n_rows + n))
+        if symbol not in self.symbols:
+            self.symbols.append(symbol)
+        rows = slice(self.n_rows, self.n_rows + n)
+        self._maps["X"][rows] = X
+        self._maps["y"][rows] = y
+        self._maps["symbol"][rows] = self.symbols.index(symbol)
+        self._maps["date"][rows] = dates
+        self.n_rows += n
+
+    def flush(self):
+        for arr in self._maps.values():
+            arr.flush()
+
+    def close(self) -> PooledDataset:
+        self.flush()
+        self._maps = {}
+        self._resize(self.n_rows)
+        self._maps = {}
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump({"columns": self.columns, "symbols": self.symbols, "n_rows": self.n_rows}, f)
+        return PooledDataset(self.path)
+
+
+def build_dataset(processor, frames, path: str, capacity: int = 1 << 16) -> PooledDataset:
+    """
+    processor - BaseStatisticalData (or subclass); process_data(df) gives a symbol's (X, y)
+    frames - iterable of (symbol, bars DataFrame), eg. csv_frames(...)
+    Only one symbol's features are in memory at a time. process_data works on
+    the frames in place, so pass frames that aren't used elsewhere.
+    """
+    writer = None
+    for symbol, df in frames:
+        X, y = processor.process_data(df)
+        if writer is None:
+            writer = DatasetWriter(path, X.columns, capacity)
+        elif list(X.columns) != writer.columns:
+            raise Exception(f"{symbol}: feature columns {list(X.columns)} differ from {writer.columns}")
+        writer.append(symbol, X.to_numpy(dtype=np.float32), y.to_numpy(dtype=np.float32),
+                      pd.DatetimeIndex(X.index).values.astype("datetime64[ns]").astype(np.int64))
+    if writer is None:
+        raise Exception("No data to build the dataset from")
+    return writer.close()
@@ -0,0 +1,286 @@
+"""
+Statistical arbitrage on cointegrated pairs.
+
+PairScanner tracks, for every pair of symbols over a rolling window of log
+closes, the correlation of their returns and an Engle-Granger test: the
+hedge ratio of y on x, the Dickey-Fuller t-stat of the spread and its
+half-life of mean reversion. Everything comes from window sums kept as
+(symbol x symbol) matrices, so a new bar is a handful of rank-1 updates
+instead of refitting ~S^2 / 2 regressions, and the statistics are evaluated
+in row blocks to bound memory. scan_pairs computes the same statistics from
+scratch over a price history, one row block per worker process.
+
+PairsStrategy trades the best pairs: it rescans every rescan_every bars,
+keeps up to max_pairs pairs not sharing a symbol, and emits both legs of a
+pair together: short the spread (SELL y, BUY x) when its z-score is above
+entry_z, long it below -entry_z, and exit both legs once |z| < exit_z.
+Each leg is sized by the portfolio as usual, not by the hedge ratio.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from trading_common.event import SignalEvent
+from trading_common.strategy.naive import Strategy
+from trading_common.utilities.enum import OrderPosition
+
+PAIR_COLUMNS = ["y", "x", "corr", "beta", "alpha", "tstat", "half_life", "spread_std"]
+
+
+def _pair_stats(n: int, rows: np.ndarray, B, C, Ct, D, N, sl, sd, b_diag, c_diag, d_diag) -> dict:
+    """
+    statistics of y = rows against x = every symbol from the window sums
+    B, C, Ct, D, N - row blocks of sum(l l'), sum(l d'), sum(d l'), sum(d d') and the
+        joint valid counts, where l is the previous log close and d its change
+    sl, sd, b_diag, c_diag, d_diag - per symbol sums and diagonals
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ly, lx = sl[rows, None], sl[None, :]
+        dy, dx = sd[rows, None], sd[None, :]
+        syy = b_diag[rows, None] - ly ** 2 / n
+        sxx = b_diag[None, :] - lx ** 2 / n
+        sxy = B - ly * lx / n
+        beta = sxy / sxx
+        alpha = (ly - beta * lx) / n
+        ## Dickey-Fuller regression of the spread change on the lagged spread
+        s_ed = c_diag[rows, None] - beta * C - beta * Ct + beta ** 2 * c_diag[None, :] - alpha * (dy - beta * dx)
+        s_ee = syy - beta * sxy
+        s_dd = d_diag[rows, None] - 2 * beta * D + beta ** 2 * d_diag[None, :]
+        gamma = s_ed / s_ee
+        sigma2 = (s_dd - gamma * s_ed) / (n - 1)
+        tstat = gamma / np.sqrt(sigma2 / s_ee)
+        half_life = np.where((gamma < 0) & (gamma > -1), -np.log(2) / np.log1p(gamma), np.inf)
+        cov_d = D - dy * dx / n
+        corr = cov_d / np.sqrt((d_diag[rows, None] - dy ** 2 / n) * (d_diag[None, :] - dx ** 2 / n))
+        spread_std = np.sqrt(s_ee / n)
+    ## each pair once (y before x) and only with a full window for both
+    valid = (N == n) & (np.arange(len(sl))[None, :] > rows[:, None])
+    return {"valid": valid, "corr": corr, "beta": beta, "alpha": alpha, "tstat": tstat,
+            "half_life": half_life, "spread_std": spread_std}
+
+
+def _select(stats: dict, rows: np.ndarray, symbol_list, min_corr: float, max_tstat: float,
+            max_half_life: float) -> pd.DataFrame:
+    mask = stats["valid"] & (stats["corr"] >= min_corr) & (stats["tstat"] <= max_tstat) \
+        & (stats["half_life"] <= max_half_life)
+    i, j = np.nonzero(mask)
+    pairs = pd.DataFrame(dict((name, stats[name][i, j]) for name in PAIR_COLUMNS[2:]))
+    pairs.insert(0, "x", [symbol_list[k] for k in j])
+    pairs.insert(0, "y", [symbol_list[k] for k in rows[i]])
+    return pairs
+
+
+def _window_sums(log_prices: np.ndarray) -> tuple:
+    """ (l, d, v) observation matrices of a (W + 1 x S) window of log closes, NaN as 0 and not valid """
+    lag, now = log_prices[:-1], log_prices[1:]
+    valid = ~np.isnan(lag) & ~np.isnan(now)
+    return np.where(valid, lag, 0.0), np.where(valid, now - lag, 0.0), valid.astype(np.float64)
+
+
+def _scan_block(log_prices: np.ndarray, rows: np.ndarray, symbol_list, min_corr, max_tstat,
+                max_half_life) -> pd.DataFrame:
+    l, d, v = _window_sums(log_prices)
+    stats = _pair_stats(len(l), rows, l[:, rows].T @ l, l[:, rows].T @ d, d[:, rows].T @ l, d[:, rows].T @ d,
+                        v[:, rows].T @ v, l.sum(axis=0), d.sum(axis=0), (l * l).sum(axis=0),
+                        (l * d).sum(axis=0), (d * d).sum(axis=0))
+    return _select(stats, rows, symbol_list, min_corr, max_tstat, max_half_life)
+
+
+def scan_pairs(closes: pd.DataFrame, window: int = 252, min_corr: float = 0.0, max_tstat: float = np.inf,
+               max_half_life: float = np.inf, block: int = 256, max_workers: int = None) -> pd.DataFrame:
+    """
+    Pair statistics over the last `window` bars of closes (a date x symbol
+    DataFrame), for pairs passing the filters, most cointegrated first.
+    Row blocks of `block` symbols are spread over a process pool.
+    """
+    symbol_list = list(closes.columns)
+    log_prices = np.log(closes.to_numpy(dtype=np.float64)[-(window + 1):])
+    blocks = [np.arange(start, min(start + block, len(symbol_list))) for start in range(0, len(symbol_list), block)]
+    args = [(log_prices, rows, symbol_list, min_corr, max_tstat, max_half_life) for rows in blocks]
+    if max_workers == 1 or len(args) == 1:
+        results = [_scan_block(*a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(_scan_block, *zip(*args)))
+    return pd.concat(results, ignore_index=True).sort_values("tstat").reset_index(drop=True)
+
+
+class PairScanner(object):
+    """
+    Rolling window sums of every pair, updated with each bar's log closes.
+    Sums are rebuilt from the buffered window every `recompute_every` bars
+    to keep rounding from accumulating.
+    """
+
+    def __init__(self, symbol_list, window: int = 252, block: int = 256, recompute_every: int = None):
+        self.symbol_list = list(symbol_list)
+        self.symbol_idx = dict((s, i) for i, s in enumerate(self.symbol_list))
+        self.window = window
+        self.block = block
+        self.recompute_every = recompute_every if recompute_every is not None else window
+        n = len(self.symbol_list)
+        ## ring buffer of the last window + 1 log closes
+        self.prices = np.full((window + 1, n), np.nan)
+        self.count = 0
+        self._reset_sums()
+
+    def _reset_sums(self):
+        n = len(self.symbol_list)
+        self.B, self.C, self.D, self.N = (np.zeros((n, n)) for _ in range(4))
+        self.sl, self.sd, self.b_diag, self.c_diag, self.d_diag = (np.zeros(n) for _ in range(5))
+
+    def _add(self, lag, now, sign: float):
+        valid = ~np.isnan(lag) & ~np.isnan(now)
+        l = np.where(valid, lag, 0.0)
+        d = np.where(valid, now - lag, 0.0)
+        v = valid.astype(np.float64)
+        self.B += sign * np.outer(l, l)
+        self.C += sign * np.outer(l, d)
+        self.D += sign * np.outer(d, d)
+        self.N += sign * np.outer(v, v)
+        self.sl += sign * l
+        self.sd += sign * d
+        self.b_diag += sign * l * l
+        self.c_diag += sign * l * d
+        self.d_diag += sign * d * d
+
+    def _ordered(self) -> np.ndarray:
+        """ buffered log closes, oldest first """
+        k = min(self.count, self.window + 1)
+        idx = (self.count - k + np.arange(k)) % (self.window + 1)
+        return self.prices[idx]
+
+    def _recompute(self):
+        self._reset_sums()
+        l, d, v = _window_sums(self._ordered())
+        self.B, self.C, self.D, self.N = l.T @ l, l.T @ d, d.T @ d, v.T @ v
+        self.sl, self.sd = l.sum(axis=0), d.sum(axis=0)
+        self.b_diag, self.c_diag, self.d_diag = (l * l).sum(axis=0), (l * d).sum(axis=0), (d * d).sum(axis=0)
+
+    @property
+    def ready(self) -> bool:
+        return self.count > self.window
+
+    def update(self, closes: np.ndarray):
+        """ adds a bar of closes ordered like symbol_list, NaN where there is none """
+        log_close = np.log(np.asarray(closes, dtype=np.float64))
+        slot = self.count % (self.window + 1)
+        if self.count > 0:
+            prev = self.prices[(self.count - 1) % (self.window + 1)]
+            if self.count > self.window:
+                ## the oldest observation leaves the window
+                oldest = self.prices[slot]
+                self._add(oldest, self.prices[(slot + 1) % (self.window + 1)], -1.0)
+            self._add(prev, log_close, 1.0)
+        self.prices[slot] = log_close
+        self.count += 1
+        if self.count % self.recompute_every == 0:
+            self._recompute()
+
+    def stats(self, rows: np.ndarray) -> dict:
+        n = min(self.count - 1, self.window)
+        return _pair_stats(n, rows, self.B[rows], self.C[rows], self.C[:, rows].T, self.D[rows], self.N[rows],
+                           self.sl, self.sd, self.b_diag, self.c_diag, self.d_diag)
+
+    def pairs(self, min_corr: float = 0.0, max_tstat: float = np.inf, max_half_life: float = np.inf) -> pd.DataFrame:
+        """ statistics of the pairs passing the filters, most cointegrated first """
+        results = []
+        for start in range(0, len(self.symbol_list), self.block):
+            rows = np.arange(start, min(start + self.block, len(self.symbol_list)))
+            results.append(_select(self.stats(rows), rows, self.symbol_list, min_corr, max_tstat, max_half_life))
+        return pd.concat(results, ignore_index=True).sort_values("tstat").reset_index(drop=True)
+
+    def zscore(self, y, x, beta: float, alpha: float, spread_std: float) -> float:
+        """ z-score of the latest spread y - alpha - beta * x """
+        latest = self.prices[(self.count - 1) % (self.window + 1)]
+        spread = latest[self.symbol_idx[y]] - alpha - beta * latest[self.symbol_idx[x]]
+        return spread / spread_std if spread_std > 0 else np.nan
+
+
+class PairsStrategy(Strategy):
+    def __init__(self, bars, events, window: int = 252, entry_z: float = 2.0, exit_z: float = 0.5,
+                 max_pairs: int = 10, min_corr: float = 0.5, max_tstat: float = -3.5,
+                 max_half_life: float = 60, rescan_every: int = 21):
+        super().__init__(bars, events)
+        self.scanner = PairScanner(bars.symbol_list, window)
+        self.entry_z = entry_z
+        self.exit_z = exit_z
+        self.max_pairs = max_pairs
+        self.min_corr = min_corr
+        self.max_tstat = max_tstat
+        self.max_half_life = max_half_life
+        self.rescan_every = rescan_every
+        ## (y, x) -> {"beta", "alpha", "spread_std", "position"}; position 1 long spread, -1 short
+        self.pairs = {}
+        self.bars_seen = 0
+
+    def _latest_closes(self) -> np.ndarray:
+        if hasattr(self.bars, "latest_field"):
+            return self.bars.latest_field("close")
+        closes = np.full(len(self.bars.symbol_list), np.nan)
+        for idx, symbol in enumerate(self.bars.symbol_list):
+            bar = self.bars.get_latest_bars(symbol, 1)
+            if len(bar['close']) > 0:
+                closes[idx] = bar['close'][-1]
+        return closes
+
+    def _legs(self, y, x, spread_position: int, dt, closes) -> list:
+        """ signals opening (spread_position 1 / -1) or closing (0) a pair """
+        py, px = closes[self.scanner.symbol_idx[y]], closes[self.scanner.symbol_idx[x]]
+        if spread_position == 0:
+            held = self.pairs[(y, x)]["position"]
+            return [SignalEvent(y, dt, OrderPosition.EXIT_LONG if held > 0 else OrderPosition.EXIT_SHORT, py),
+                    SignalEvent(x, dt, OrderPosition.EXIT_SHORT if held > 0 else OrderPosition.EXIT_LONG, px)]
+        if spread_position > 0:
+            return [SignalEvent(y, dt, OrderPosition.BUY, py), SignalEvent(x, dt, OrderPosition.SELL, px)]
+        return [SignalEvent(y, dt, OrderPosition.SELL, py), SignalEvent(x, dt, OrderPosition.BUY, px)]
+
+    def _rescan(self, dt, closes) -> list:
+        signals = []
+        found = self.scanner.pairs(self.min_corr, self.max_tstat, self.max_half_life)
+        keep = {}
+        used = set()
+        ## open pairs stay if still cointegrated, with refreshed hedge ratios
+        found_idx = dict(((r.y, r.x), r) for r in found.itertuples(index=False))
+        for key, pair in self.pairs.items():
+            if key in found_idx:
+                r = found_idx[key]
+                keep[key] = {"beta": r.beta, "alpha": r.alpha, "spread_std": r.spread_std, "position": pair["position"]}
+                used.update(key)
+            elif pair["position"] != 0:
+                ## no new pair on these symbols this bar, the exit would flatten its entry
+                signals.extend(self._legs(key[0], key[1], 0, dt, closes))
+                used.update(key)
+        for r in found.itertuples(index=False):
+            if len(keep) >= self.max_pairs:
+                break
+            if (r.y, r.x) in keep or r.y in used or r.x in used:
+                continue
+            keep[(r.y, r.x)] = {"beta": r.beta, "alpha": r.alpha, "spread_std": r.spread_std, "position": 0}
+            used.update((r.y, r.x))
+        self.pairs = keep
+        return signals
+
+    def calculate_signals(self, event):
+        closes = self._latest_closes()
+        self.scanner.update(closes)
+        self.bars_seen += 1
+        if not self.scanner.ready:
+            return []
+        dt = self.bars.latest_datetime() if hasattr(self.bars, "latest_datetime") else \
+            self.bars.get_latest_bars(self.bars.symbol_list[0], 1)['datetime'][-1]
+        signals = []
+        if self.bars_seen % self.rescan_every == 0 or len(self.pairs) == 0:
+            signals.extend(self._rescan(dt, closes))
+        for (y, x), pair in self.pairs.items():
+            z = self.scanner.zscore(y, x, pair["beta"], pair["alpha"], pair["spread_std"])
+            if np.isnan(z):
+                continue
+            if pair["position"] == 0 and abs(z) > self.entry_z:
+                pair["position"] = -1 if z > 0 else 1
+                signals.extend(self._legs(y, x, pair["position"], dt, closes))
+            elif pair["position"] != 0 and abs(z) < self.exit_z:
+                signals.extend(self._legs(y, x, 0, dt, closes))
+                pair["position"] = 0
+        return signals
@@ -0,0 +1,188 @@
+"""
+Signal recording and portfolio-only replay.
+
+Portfolio / broker experiments (sizing, mode, expires, portfolio strategy)
+don't change a strategy's signals, so they can be computed once:
+
+    strategy = SignalRecorder(MultipleAllStrategy([BoundedTA(bars, events, ...), ...]))
+    backtest(...)                                   # the expensive run
+    strategy.recording.export("signals.parquet")
+
+    strategy = ReplayStrategy(bars, events, SignalRecording.load("signals.parquet"))
+
+ReplayStrategy emits the recorded SignalEvents of each bar in their
+original order without computing anything, so the replayed run only does
+the portfolio and broker bookkeeping. It has to run over the same bars
+(data source, symbols and start date) as the recorded one.
+Recordings with at most one signal per symbol and bar also convert to a
+signal matrix for backtest.kernel.run_kernel.
+"""
+import numpy as np
+import pandas as pd
+
+from backtest.kernel import NO_SIGNAL, SIGNAL_POSITIONS
+from trading_common.event import SignalEvent
+from trading_common.strategy.naive import Strategy
+
+## column name -> dtype of the recording buffers
+SIGNAL_COLUMNS = {
+    "bar": np.int32,  # bars since the start of the run
+    "timestamp": np.int64,  # epoch ns (UTC) of the signal's datetime
+    "symbol": np.int32,  # index into symbol_list
+    "signal": np.int8,  # backtest.kernel signal code
+    "price": np.float64,
+}
+SIGNAL_CODES = dict((position, code) for code, position in SIGNAL_POSITIONS.items())
+
+
+class SignalRecording(object):
+    """
+    signal stream of a run in preallocated column arrays that double when full.
+    tz is the time zone of the signal datetimes, None if they are naive
+    """
+
+    def __init__(self, symbol_list, capacity: int = 4096, tz=None):
+        self.symbol_list = list(symbol_list)
+        self.symbol_idx = dict((s, idx) for idx, s in enumerate(self.symbol_list))
+        self.tz = tz
+        self.size = 0
+        self.columns = dict((name, np.zeros(capacity, dtype=dtype)) for name, dtype in SIGNAL_COLUMNS.items())
+
+    def __len__(self):
+        return self.size
+
+    def _grow(self):
+        for name, col in self.columns.items():
+            new_col = np.zeros(2 * len(col), dtype=col.dtype)
+            new_col[:self.size] = col[:self.size]
+            self.columns[name] = new_col
+
+    def record(self, bar: int, signal: SignalEvent):
+        if self.size == len(self.columns["bar"]):
+            self._grow()
+        if signal.symbol not in self.symbol_idx:
+            self.symbol_idx[signal.symbol] = len(self.symbol_list)
+            self.symbol_list.append(signal.symbol)
+        ts = pd.Timestamp(signal.datetime)
+        tz = None if ts.tz is None else str(ts.tz)
+        if self.size == 0:
+            self.tz = tz
+        elif tz != self.tz:
+            raise Exception(f"Signal datetimes in {tz} and {self.tz} can't be recorded together")
+        i = self.size
+        self.columns["bar"][i] = bar
+        self.columns["timestamp"][i] = ts.value
+        self.columns["symbol"][i] = self.symbol_idx[signal.symbol]
+        self.columns["signal"][i] = SIGNAL_CODES[signal.signal_type]
+        self.columns["price"][i] = np.nan if signal.price is None else signal.price
+        self.size += 1
+
+    def to_frame(self) -> pd.DataFrame:
+        df = pd.DataFrame(dict((name, col[:self.size]) for name, col in self.columns.items()))
+        df["timestamp"] = pd.to_datetime(df["timestamp"])
+        if self.tz is not None:
+            df["timestamp"] = df["timestamp"].dt.tz_localize("UTC").dt.tz_convert(self.tz)
+        df["symbol"] = pd.Categorical.from_codes(df["symbol"], categories=self.symbol_list)
+        return df
+
+    def export(self, fp: str):
+        """ writes the recording to fp as Parquet, or Arrow IPC if fp ends with .arrow / .feather """
+        import pyarrow as pa
+        import pyarrow.feather as feather
+        import pyarrow.parquet as pq
+        table = pa.Table.from_pandas(self.to_frame(), preserve_index=False)
+        if fp.endswith((".arrow", ".feather")):
+            feather.write_feather(table, fp)
+        else:
+            pq.write_table(table, fp)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame):
+        symbols = df["symbol"].astype("category")
+        timestamps = pd.to_datetime(df["timestamp"])
+        tz = None if timestamps.dt.tz is None else str(timestamps.dt.tz)
+        recording = cls(symbols.cat.categories, capacity=max(len(df), 1), tz=tz)
+        recording.size = len(df)
+        for name, dtype in SIGNAL_COLUMNS.items():
+            if name == "symbol":
+                values = symbols.cat.codes
+            elif name == "timestamp":
+                ## .values of tz-aware datetimes are in UTC
+                values = timestamps.values.view(np.int64)
+            else:
+                values = df[name]
+            recording.columns[name][:len(df)] = np.asarray(values, dtype=dtype)
+        return recording
+
+    @classmethod
+    def load(cls, fp: str):
+        if fp.endswith((".arrow", ".feather")):
+            return cls.from_frame(pd.read_feather(fp))
+        return cls.from_frame(pd.read_parquet(fp))
+
+    def bar_offsets(self, n_bars: int = None) -> np.ndarray:
+        """ offsets[t]:offsets[t + 1] are the rows of bar t """
+        bars = self.columns["bar"][:self.size]
+        n_bars = n_bars if n_bars is not None else (int(bars.max()) + 1 if self.size > 0 else 0)
+        return np.searchsorted(bars, np.arange(n_bars + 1), side="left")
+
+    def to_signal_matrix(self, n_times: int, symbol_list) -> tuple:
+        """
+        (signals, prices) (time x symbol) matrices for backtest.kernel.run_kernel.
+        Raises if a symbol has more than one signal on a bar.
+        """
+        idx = dict((s, i) for i, s in enumerate(symbol_list))
+        signals = np.full((n_times, len(symbol_list)), NO_SIGNAL, dtype=np.int8)
+        prices = np.full((n_times, len(symbol_list)), np.nan)
+        bars = self.columns["bar"][:self.size]
+        cols = np.array([idx[self.symbol_list[s]] for s in self.columns["symbol"][:self.size]], dtype=np.int64)
+        if len(np.unique(bars.astype(np.int64) * len(symbol_list) + cols)) != self.size:
+            raise Exception("More than one signal per symbol and bar, replay it with ReplayStrategy instead")
+        signals[bars, cols] = self.columns["signal"][:self.size]
+        prices[bars, cols] = self.columns["price"][:self.size]
+        return signals, prices
+
+
+class SignalRecorder(Strategy):
+    """ runs a strategy and records every signal it emits """
+
+    def __init__(self, strategy, recording: SignalRecording = None):
+        super().__init__(strategy.bars, strategy.events)
+        self.strategy = strategy
+        self.recording = recording if recording is not None else SignalRecording(strategy.bars.symbol_list)
+        self.bar = 0
+
+    def calculate_signals(self, event):
+        signal_list = self.strategy.calculate_signals(event)
+        if signal_list is not None:
+            for signal in signal_list:
+                if signal is not None:
+                    self.recording.record(self.bar, signal)
+        self.bar += 1
+        return signal_list
+
+
+class ReplayStrategy(Strategy):
+    """ emits the recorded signals of every bar instead of computing them """
+
+    def __init__(self, bars, events, recording: SignalRecording):
+        super().__init__(bars, events)
+        self.recording = recording
+        self.offsets = recording.bar_offsets()
+        self.bar = 0
+
+    def calculate_signals(self, event):
+        if self.bar + 1 >= len(self.offsets):
+            self.bar += 1
+            return []
+        cols = self.recording.columns
+        start, end = self.offsets[self.bar], self.offsets[self.bar + 1]
+        self.bar += 1
+        return [SignalEvent(self.recording.symbol_list[cols["symbol"][i]], self._datetime(cols["timestamp"][i]),
+                            SIGNAL_POSITIONS[cols["signal"][i]], cols["price"][i])
+                for i in range(start, end)]
+
+    def _datetime(self, ts: int) -> pd.Timestamp:
+        if self.recording.tz is None:
+            return pd.Timestamp(ts)
+        return pd.Timestamp(ts, tz="UTC").tz_convert(self.recording.tz)
@@ -0,0 +1,175 @@
+"""
+Hyperparameter search for the statistical strategies, on a PooledDataset
+(backtest.strategy.dataset) built once from a BaseStatisticalData processor.
+
+    report = grid_search(dataset, RandomForestClassifier,
+                         {"n_estimators": [100, 300], "max_depth": [3, 5, None]},
+                         n_splits=5, horizon=14, embargo=5)
+
+Folds are purged and embargoed time-series splits over the dataset's dates:
+training rows whose target window (horizon bars) reaches into the test
+dates are dropped, and so are the embargo bars right after them. With
+walk_forward=True a fold only trains on dates before its test dates.
+
+Every (candidate, fold) runs in a process pool. Workers open the dataset's
+memory maps themselves instead of having the features pickled to them, but
+each one loads its fold's training rows into memory to fit, so peak memory
+is about max_workers times the training set: lower max_workers for large
+datasets. Opened datasets and folds are cached per process, keyed by the
+path and meta.json's mtime and row count, so a dataset rebuilt at the same
+path is read again.
+
+The report has, per candidate, the mean and std over the folds of the
+predictive metrics (mse / r2 / ic for regressors, accuracy / f1 for
+classifiers) and, when realized `returns` are given, of a signal backtest:
+every date, an equal weight position of sign(prediction) in each symbol,
+earning those returns. A backtest(params) callable adds metrics from a full run.
+"""
+import functools
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from backtest.robustness import return_metrics
+from backtest.strategy.dataset import PooledDataset
+
+
+def param_grid(grid: dict) -> list:
+    """ every combination of {name: [values]} """
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+
+def purged_splits(dates: np.ndarray, n_splits: int = 5, horizon: int = 0, embargo: int = 0,
+                  walk_forward: bool = False) -> list:
+    """
+    (train, test) row indices of n_splits folds over contiguous blocks of dates
+    horizon - bars a row's target looks ahead; training rows within horizon bars
+        before a test block are purged
+    embargo - bars after a test block left out of training
+    """
+    unique = np.unique(dates)
+    if len(unique) < n_splits:
+        raise Exception(f"{len(unique)} dates can't be split in {n_splits} folds")
+    pos = np.searchsorted(unique, dates)
+    folds = []
+    for block in np.array_split(np.arange(len(unique)), n_splits):
+        first, last = block[0], block[-1]
+        test = (pos >= first) & (pos <= last)
+        train = pos < first - horizon
+        if not walk_forward:
+            train |= pos > last + embargo
+        if walk_forward and not train.any():
+            continue
+        folds.append((np.flatnonzero(train), np.flatnonzero(test)))
+    return folds
+
+
+def _version(path: str) -> tuple:
+    """ (mtime, n_rows) of a dataset's meta.json, part of the cache keys below """
+    meta = os.path.join(path, "meta.json")
+    with open(meta) as f:
+        n_rows = json.load(f)["n_rows"]
+    return os.stat(meta).st_mtime_ns, n_rows
+
+
+@functools.lru_cache(maxsize=8)
+def _open(path: str, version: tuple) -> PooledDataset:
+    return PooledDataset(path)
+
+
+@functools.lru_cache(maxsize=8)
+def _folds(path: str, version: tuple, n_splits: int, horizon: int, embargo: int, walk_forward: bool) -> list:
+    dataset = _open(path, version)
+    return purged_splits(np.asarray(dataset.date[:dataset.n_rows]), n_splits, horizon, embargo, walk_forward)
+
+
+def _signal_backtest(pred: np.ndarray, returns: np.ndarray, dates: np.ndarray, periods: int) -> dict:
+    """ equal weight sign(pred) positions across symbols, one period per date """
+    pnl = pd.Series(np.sign(pred) * returns).groupby(dates).mean().to_numpy()
+    metrics = return_metrics(pnl[None, :], periods)
+    return dict((f"bt_{name}", float(value[0])) for name, value in metrics.items())
+
+
+def _predictive_metrics(estimator, y: np.ndarray, pred: np.ndarray) -> dict:
+    from sklearn.base import is_classifier
+    from sklearn import metrics
+
+    if is_classifier(estimator):
+        return {
+            "accuracy": metrics.accuracy_score(y, pred),
+            "f1": metrics.f1_score(y, pred, average="macro"),
+        }
+    ic = np.corrcoef(pred, y)[0, 1] if np.std(pred) > 0 and np.std(y) > 0 else np.nan
+    return {"mse": metrics.mean_squared_error(y, pred), "r2": metrics.r2_score(y, pred), "ic": ic}
+
+
+def _evaluate(path: str, version: tuple, estimator_cls, params: dict, fold: int, split: tuple,
+              returns_path: str, periods: int) -> dict:
+    dataset = _open(path, version)
+    train, test = _folds(path, version, *split)[fold]
+    estimator = estimator_cls(**params)
+    X, y = dataset.load(train)
+    estimator.fit(X, y)
+    X, y = dataset.load(test)
+    pred = estimator.predict(X)
+    result = {"fold": fold, "train_rows": len(train), "test_rows": len(test)}
+    result.update(_predictive_metrics(estimator, y, pred))
+    if returns_path is not None:
+        returns = np.load(returns_path, mmap_mode="r")[test]
+        result.update(_signal_backtest(pred, returns, np.asarray(dataset.date[test]), periods))
+    return result
+
+
+def grid_search(dataset, estimator_cls, grid, n_splits: int = 5, horizon: int = 0, embargo: int = 0,
+                walk_forward: bool = False, returns=None, backtest=None, score: str = None,
+                periods: int = 252, max_workers: int = None) -> pd.DataFrame:
+    """
+    dataset - PooledDataset or its path
+    estimator_cls - sklearn style class, called with each candidate's params
+    grid - {name: [values]} or a list of param dicts
+    returns - realized returns per dataset row for the signal backtest, an
+        array (saved next to the dataset as returns.npy) or the path of a .npy.
+        No bt_ metrics without it, targets aren't necessarily returns
+    backtest - optional callable(params) -> dict of metrics of a full backtest
+    score - column to sort candidates by, descending (ic_mean for regressors,
+        f1_mean for classifiers by default)
+    Returns one row per candidate: params, then <metric>_mean / <metric>_std over folds.
+    """
+    from sklearn.base import is_classifier
+
+    path = dataset.path if isinstance(dataset, PooledDataset) else dataset
+    candidates = param_grid(grid) if isinstance(grid, dict) else list(grid)
+    split = (n_splits, horizon, embargo, walk_forward)
+    version = _version(path)
+    n_folds = len(_folds(path, version, *split))
+    classifier = is_classifier(estimator_cls())
+    if isinstance(returns, np.ndarray):
+        np.save(os.path.join(path, "returns.npy"), returns)
+        returns = os.path.join(path, "returns.npy")
+    tasks = [(path, version, estimator_cls, params, fold, split, returns, periods)
+             for params in candidates for fold in range(n_folds)]
+    if max_workers == 1:
+        results = [_evaluate(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(_evaluate, *zip(*tasks)))
+
+    rows = []
+    for i, params in enumerate(candidates):
+        folds = pd.DataFrame(results[i * n_folds:(i + 1) * n_folds]).drop(columns=["fold"])
+        row = dict(params)
+        for col in folds.columns:
+            row[f"{col}_mean"] = folds[col].mean()
+            row[f"{col}_std"] = folds[col].std()
+        if backtest is not None:
+            row.update(backtest(params))
+        rows.append(row)
+    report = pd.DataFrame(rows)
+    if score is None:
+        score = "f1_mean" if classifier else "ic_mean"
+    return report.sort_values(score, ascending=False).reset_index(drop=True)
@@ -1,8 +1,6 @@
-from trading_common.data.dataHandler import HistoricCSVDataHandler
 import queue
 import os
 import copy
-import matplotlib.pyplot as plt
 
 from backtest.broker import SimulatedBroker
 from backtest.portfolio.portfolio import PercentagePortFolio, Portfolio
@@ -16,20 +14,38 @@ def backtest(symbol_list,
              strategy, port, broker,
              start_date=None,
              plot_trade_prices: bool = False,
-             loop_live: bool = False):
+             loop_live: bool = False,
+             checkpoint=None,
+             plot: bool = True,
+             pruner=None,
+             cache=None):
+    """
+    checkpoint - optional backtest.utilities.checkpoint.Checkpointer. The run
+        resumes from its snapshot if one of the same configuration exists, saves
+        new ones as it goes and deletes the snapshot once it finishes.
+    plot - run and plot the benchmarks. Turn off for headless / batch runs.
+    pruner - optional backtest.utilities.pruning.Pruner, stops hopeless backtests
+        early. Pruned runs are not plotted.
+    cache - optional backtest.utilities.cache.RunCache. A run with the same
+        components, code and data as a cached one loads its results instead of running.
+    """
     if not loop_live and start_date is None:
         raise Exception("If backtesting, start_date is required.")
 
     if loop_live:
-        _life_loop(bars, event_queue, order_queue, strategy, port, broker)
+        _life_loop(bars, event_queue, order_queue, strategy, port, broker, checkpoint=checkpoint)
     else:
-        _backtest_loop(bars, event_queue, order_queue, strategy, port, broker)
+        _backtest_loop(bars, event_queue, order_queue, strategy, port, broker, checkpoint=checkpoint, plot=plot,
+                       pruner=pruner, cache=cache)
+        if not plot or (pruner is not None and pruner.pruned):
+            return
         benchmark_strat_bars = copy.copy(bars)
         plot_benchmark(symbol_list=symbol_list,
                        portfolio_name="benchmark_strat", benchmark_bars=benchmark_strat_bars)
         plot_benchmark(symbol_list=[benchmark_ticker],
                        portfolio_name="benchmark_index", benchmark_bars=None, start_date=start_date)
 
+        import matplotlib.pyplot as plt  # plotting is only loaded for finished backtests
         plt.legend()
         plt.show()
 
@@ -40,6 +56,7 @@ def plot_benchmark(symbol_list, portfolio_name, benchmark_bars=None, freq="daily
     if benchmark_bars is None and start_date is None:
         raise Exception("If benchmark_bars is None, start_date cannot be None")
     elif benchmark_bars is None and start_date is not None:
+        from trading_common.data.dataHandler import HistoricCSVDataHandler
         # create new benchmark_bars with index only
         benchmark_bars = HistoricCSVDataHandler(event_queue,
                                                 csv_dir=os.path.join(os.path.dirname(
@@ -0,0 +1,260 @@
+"""
+Memoization of whole backtests.
+
+    cache = RunCache("cache/runs", max_bytes=2 ** 30)
+    backtest(..., cache=cache)
+
+A run is keyed by a fingerprint of
+    - the configuration: the attribute state of the freshly built strategy,
+      portfolio, broker and every component hanging off them (parameters,
+      sub strategies, rebalance, ...), as checkpoint.py sees them
+    - the code: the source files of the classes of those components and of
+      the functions / classes they reference (eg. talib indicators by name);
+      for python functions also their bytecode, constants, defaults, closure
+      cells and the globals they read, so lambdas, partials and functions
+      defined in a notebook are told apart
+    - the data: the data handler's class, symbols and dates, and the content
+      hash of its csv files ({csv_dir}/{symbol}.csv) or of its bar arrays
+On a hit the final state of the components (holdings, journal, equity
+curve, ...) is loaded instead of running. Entries are zlib-compressed
+pickles; the least recently used ones are deleted once the directory
+grows past max_bytes.
+"""
+import enum
+import functools
+import hashlib
+import inspect
+import logging
+import os
+import pickle
+import types
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from backtest.utilities.checkpoint import _components, _skip
+
+CACHE_VERSION = 2
+## file digests, keyed by (path, size, mtime) so unchanged files are only hashed once per process
+_file_digests = {}
+
+
+def file_digest(fp: str) -> str:
+    st = os.stat(fp)
+    key = (fp, st.st_size, st.st_mtime_ns)
+    if key not in _file_digests:
+        h = hashlib.sha1()
+        with open(fp, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        _file_digests[key] = h.hexdigest()
+    return _file_digests[key]
+
+
+def _code_digest(obj) -> str:
+    """ digest of the source files defining obj (a class with its bases, or a function) """
+    classes = inspect.getmro(obj) if isinstance(obj, type) else (obj,)
+    files = set()
+    for cls in classes:
+        try:
+            files.add(inspect.getsourcefile(cls))
+        except TypeError:  # builtins and C extensions
+            continue
+    return ",".join(file_digest(fp) for fp in sorted(f for f in files if f is not None and os.path.exists(f)))
+
+
+class Fingerprint(object):
+    def __init__(self):
+        self.h = hashlib.sha1()
+        self._seen = set()
+
+    def update(self, value, component_ids=frozenset()):
+        h = self.h
+        if value is None or isinstance(value, (bool, int, float, str, bytes)):
+            h.update(f"{type(value).__name__}:{value!r};".encode())
+        elif isinstance(value, enum.Enum):
+            h.update(f"enum:{type(value).__qualname__}.{value.name};".encode())
+        elif isinstance(value, np.ndarray):
+            h.update(f"array:{value.dtype}:{value.shape};".encode())
+            h.update(np.ascontiguousarray(value).tobytes() if value.dtype != object else repr(value.tolist()).encode())
+        elif isinstance(value, (np.generic, pd.Timestamp, pd.Timedelta)):
+            h.update(f"{type(value).__name__}:{value!r};".encode())
+        elif isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+            h.update(f"{type(value).__name__}:{getattr(value, 'columns', None)!r};".encode())
+            h.update(pd.util.hash_pandas_object(value).to_numpy().tobytes())
+        elif isinstance(value, dict):
+            h.update(b"dict{")
+            for k in sorted(value, key=repr):
+                self.update(k, component_ids)
+                self.update(value[k], component_ids)
+            h.update(b"}")
+        elif isinstance(value, (list, tuple)):
+            h.update(f"{type(value).__name__}[".encode())
+            for v in value:
+                self.update(v, component_ids)
+            h.update(b"]")
+        elif isinstance(value, (set, frozenset)):
+            h.update(b"set{")
+            for v in sorted(value, key=repr):
+                self.update(v, component_ids)
+            h.update(b"}")
+        elif isinstance(value, functools.partial):
+            h.update(b"partial(")
+            self.update(value.func, component_ids)
+            self.update(value.args, component_ids)
+            self.update(value.keywords, component_ids)
+            h.update(b")")
+        elif isinstance(value, types.MethodType):
+            h.update(b"method(")
+            self.update(value.__func__, component_ids)
+            self.update(value.__self__, component_ids)
+            h.update(b")")
+        elif isinstance(value, types.FunctionType):
+            self._function(value, component_ids)
+        elif isinstance(value, type) or callable(value) and hasattr(value, "__qualname__"):
+            h.update(f"code:{getattr(value, '__module__', '')}.{value.__qualname__}:{_code_digest(value)};".encode())
+        elif hasattr(value, "__dict__"):
+            h.update(f"object:{type(value).__module__}.{type(value).__qualname__}:{_code_digest(type(value))}(".encode())
+            if id(value) not in self._seen:
+                self._seen.add(id(value))
+                for k, v in sorted(vars(value).items()):
+                    if not _skip(v, component_ids):
+                        self.update(k)
+                        self.update(v, component_ids)
+            h.update(b")")
+        else:
+            ## no reliable value, eg. locks or handles
+            h.update(f"opaque:{type(value).__qualname__};".encode())
+
+    def _code(self, code):
+        self.h.update(f"bytecode:{code.co_name}:".encode())
+        self.h.update(code.co_code)
+        for const in code.co_consts:
+            if inspect.iscode(const):
+                self._code(const)
+            else:
+                self.update(const)
+        self.update(code.co_names)
+
+    def _function(self, fn, component_ids):
+        """ a python function by what it runs, not only its name """
+        h = self.h
+        h.update(f"function:{fn.__module__}.{fn.__qualname__}:{_code_digest(fn)}(".encode())
+        if id(fn) not in self._seen:
+            self._seen.add(id(fn))
+            self._code(fn.__code__)
+            self.update(fn.__defaults__, component_ids)
+            self.update(fn.__kwdefaults__, component_ids)
+            for cell in fn.__closure__ or ():
+                try:
+                    self.update(cell.cell_contents, component_ids)
+                except ValueError:  # not assigned yet
+                    h.update(b"empty;")
+            ## the module level values it reads, modules only by name
+            for name in fn.__code__.co_names:
+                if name in fn.__globals__:
+                    value = fn.__globals__[name]
+                    self.update(value.__name__ if inspect.ismodule(value) else value, component_ids)
+        h.update(b")")
+
+    def hexdigest(self) -> str:
+        return self.h.hexdigest()
+
+
+def data_fingerprint(bars, fp: Fingerprint):
+    fp.update(f"{type(bars).__module__}.{type(bars).__qualname__}:{_code_digest(type(bars))}")
+    fp.update([str(getattr(bars, "start_date", None)), str(getattr(bars, "end_date", None))])
+    fp.update(list(bars.symbol_list))
+    csv_dir = getattr(bars, "csv_dir", None)
+    if csv_dir is not None:
+        fp.update([file_digest(os.path.join(csv_dir, f"{s}.csv")) for s in bars.symbol_list])
+    elif hasattr(bars, "arrays"):
+        fp.update(bars.arrays())
+    else:
+        raise Exception(f"Can't fingerprint the data of {type(bars).__name__}")
+
+
+class RunCache(object):
+    def __init__(self, path: str = "cache/runs", max_bytes: int = 2 ** 30):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+    def _roots(self, strategy, port, broker) -> dict:
+        return {"portfolio": port, "strategy": strategy, "broker": broker}
+
+    def key(self, bars, strategy, port, broker) -> str:
+        """ fingerprint of a run, to be taken before it starts. None if it can't be fingerprinted """
+        fp = Fingerprint()
+        fp.update(CACHE_VERSION)
+        components = _components(self._roots(strategy, port, broker), bars)
+        component_ids = {id(c) for c in components.values()}
+        try:
+            data_fingerprint(bars, fp)
+            for path in sorted(components):
+                fp.update(path)
+                fp.update(components[path], component_ids)
+        except Exception as e:
+            logging.info(f"Run is not cached: {e}")
+            return None
+        return fp.hexdigest()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, f"{key}.pkl.z")
+
+    def load(self, key: str, bars, strategy, port, broker) -> bool:
+        """ restores the final state of a cached run into fresh components. False on a miss """
+        fp = self._file(key)
+        if not os.path.exists(fp):
+            return False
+        with open(fp, "rb") as f:
+            entry = pickle.loads(zlib.decompress(f.read()))
+        components = _components(self._roots(strategy, port, broker), bars)
+        if set(components) != set(entry):
+            return False
+        for path, state in entry.items():
+            vars(components[path]).update(state)
+        os.utime(fp)  # most recently used
+        logging.info(f"Loaded cached run {key}")
+        return True
+
+    def save(self, key: str, bars, strategy, port, broker):
+        components = _components(self._roots(strategy, port, broker), bars)
+        component_ids = {id(c) for c in components.values()}
+        entry = {
+            path: {k: v for k, v in vars(c).items() if not _skip(v, component_ids)}
+            for path, c in components.items()
+        }
+        try:
+            data = zlib.compress(pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL))
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            logging.info(f"Run {key} is not cached: {e}")
+            return
+        tmp_path = self._file(key) + f".{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._file(key))
+        self.evict()
+
+    def evict(self):
+        """ deletes the least recently used entries until the cache fits in max_bytes """
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith(".pkl.z"):
+                st = os.stat(os.path.join(self.path, name))
+                entries.append((st.st_mtime, st.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.path, name))
+            except FileNotFoundError:  # evicted by another process
+                pass
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.path):
+            if name.endswith(".pkl.z"):
+                os.remove(os.path.join(self.path, name))
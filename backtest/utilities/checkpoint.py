@@ -0,0 +1,201 @@
+import logging
+import os
+import pickle
+import queue
+import random
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from trading_common.data.dataHandler import DataHandler
+
+CHECKPOINT_VERSION = 2
+
+
+def _is_component(value, bars) -> bool:
+    """ engine components are the objects holding a reference to the data handler """
+    if not hasattr(value, "__dict__") or isinstance(value, type):
+        return False
+    return any(v is bars for v in vars(value).values())
+
+
+def _components(roots: dict, bars) -> dict:
+    """
+    path -> component for every component reachable from roots through
+    attributes, lists, tuples and dict values, eg. "strategy.strategies[1]".
+    """
+    found = {}
+    seen = set()
+    stack = list(roots.items())
+    while stack:
+        path, obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        found[path] = obj
+        for name, value in vars(obj).items():
+            if isinstance(value, (list, tuple)):
+                children = [(f"{path}.{name}[{i}]", v) for i, v in enumerate(value)]
+            elif isinstance(value, dict):
+                children = [(f"{path}.{name}[{k!r}]", v) for k, v in value.items()]
+            else:
+                children = [(f"{path}.{name}", value)]
+            stack.extend((p, v) for p, v in children if _is_component(v, bars))
+    return found
+
+
+def _skip(value, component_ids) -> bool:
+    return isinstance(value, (DataHandler, queue.Queue, type(threading.Lock()))) or id(value) in component_ids
+
+
+def config_hash(bars, strategy, port) -> str:
+    """
+    fingerprint of freshly built components (their parameters and code, see
+    backtest.utilities.cache) and of which data they run on: the data
+    handler's class, symbols and dates, not the bars, which live sessions keep adding to
+    """
+    from backtest.utilities.cache import Fingerprint
+
+    fp = Fingerprint()
+    fp.update([type(bars).__qualname__, list(bars.symbol_list),
+               str(getattr(bars, "start_date", None)), str(getattr(bars, "end_date", None))])
+    components = _components({"portfolio": port, "strategy": strategy}, bars)
+    component_ids = {id(c) for c in components.values()}
+    for path in sorted(components):
+        fp.update(path)
+        fp.update(components[path], component_ids)
+    return fp.hexdigest()
+
+
+def _drain(q: queue.Queue) -> list:
+    items = []
+    while True:
+        try:
+            items.append(q.get(block=False))
+        except queue.Empty:
+            return items
+
+
+class Checkpointer(object):
+    """
+    Snapshots engine state to a zlib-compressed pickle and restores it.
+
+    Saved: number of bars consumed (the data handler cursor), the attribute
+    state of the portfolio, strategy and every component hanging off them
+    (portfolio strategy, rebalance, sub strategies, ...), pending orders in
+    order_queue, and the python / numpy random states. References to the
+    data handler, queues and other components are left out and rewired on
+    restore, so objects shared between components (eg. current_holdings)
+    stay shared.
+
+    begin() takes the config_hash of the components before the run starts;
+    snapshots carry it and are only restored into components with the same
+    one. The loops call clear() once a run finishes.
+
+    path - snapshot file, written atomically
+    every_n_bars - save every n bars, for backtests
+    every_seconds - save at most this often, for live sessions
+    """
+
+    def __init__(self, path: str, every_n_bars: int = None, every_seconds: float = None):
+        self.path = path
+        self.every_n_bars = every_n_bars
+        self.every_seconds = every_seconds
+        self._last_save = time.monotonic()
+        self.config_hash = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def begin(self, bars, strategy, port) -> bool:
+        """
+        takes the config hash of a run that hasn't started. True if there is a
+        snapshot of the same configuration to restore
+        """
+        self.config_hash = config_hash(bars, strategy, port)
+        if not self.exists():
+            return False
+        if self.load()["config_hash"] != self.config_hash:
+            logging.info(f"Checkpoint {self.path} is of another configuration, starting over")
+            return False
+        return True
+
+    def clear(self):
+        """ deletes the snapshot, once the run it belongs to is done """
+        if self.exists():
+            os.remove(self.path)
+
+    def due(self, bars_seen: int) -> bool:
+        if self.every_n_bars is not None and bars_seen > 0 and bars_seen % self.every_n_bars == 0:
+            return True
+        return self.every_seconds is not None and time.monotonic() - self._last_save >= self.every_seconds
+
+    def step(self, bars_seen, bars, order_queue, strategy, port):
+        if self.due(bars_seen):
+            self.save(bars_seen, bars, order_queue, strategy, port)
+
+    def save(self, bars_seen, bars, order_queue, strategy, port):
+        if self.config_hash is None:
+            raise Exception("Checkpointer.begin() has to be called before the run starts")
+        components = _components({"portfolio": port, "strategy": strategy}, bars)
+        component_ids = {id(c) for c in components.values()}
+        pending_orders = _drain(order_queue)
+        for order in pending_orders:
+            order_queue.put(order)
+        snapshot = {
+            "version": CHECKPOINT_VERSION,
+            "config_hash": self.config_hash,
+            "bars_seen": bars_seen,
+            "components": {
+                path: {k: v for k, v in vars(c).items() if not _skip(v, component_ids)}
+                for path, c in components.items()
+            },
+            "pending_orders": pending_orders,
+            "random_state": random.getstate(),
+            "np_random_state": np.random.get_state(),
+        }
+        data = zlib.compress(pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL))
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+        self._last_save = time.monotonic()
+        logging.info(f"Checkpoint saved at bar {bars_seen}: {self.path}")
+
+    def load(self) -> dict:
+        with open(self.path, "rb") as f:
+            snapshot = pickle.loads(zlib.decompress(f.read()))
+        if snapshot["version"] != CHECKPOINT_VERSION:
+            raise Exception(f"Checkpoint version {snapshot['version']} is not supported")
+        return snapshot
+
+    def restore(self, bars, event_queue, order_queue, strategy, port, fast_forward: bool = True) -> int:
+        """
+        Restores a snapshot into freshly constructed components, built with the
+        same arguments as the checkpointed run (or raises). Returns the number of bars consumed.
+        fast_forward - replay the data handler to the saved cursor (backtests).
+            Live sessions pass False as their data handler is always at "now".
+        """
+        snapshot = self.load()
+        components = _components({"portfolio": port, "strategy": strategy}, bars)
+        if set(components) != set(snapshot["components"]):
+            raise Exception("Checkpoint does not match the components of this run")
+        if self.config_hash is None:
+            self.config_hash = config_hash(bars, strategy, port)
+        if snapshot["config_hash"] != self.config_hash:
+            raise Exception("Checkpoint is of a run with another configuration")
+        if fast_forward:
+            for _ in range(snapshot["bars_seen"]):
+                bars.update_bars()
+            _drain(event_queue)
+        for path, state in snapshot["components"].items():
+            vars(components[path]).update(state)
+        _drain(order_queue)
+        for order in snapshot["pending_orders"]:
+            order_queue.put(order)
+        random.setstate(snapshot["random_state"])
+        np.random.set_state(snapshot["np_random_state"])
+        logging.info(f"Resumed from checkpoint at bar {snapshot['bars_seen']}: {self.path}")
+        return snapshot["bars_seen"]
@@ -0,0 +1,173 @@
+import threading
+import time
+from collections import defaultdict, deque
+from urllib.parse import urlparse
+
+import numpy as np
+import requests
+from urllib3.util.retry import Retry
+
+
+class _InFlight(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class LatencyStats(object):
+    """ call count, errors and the latest `window` latencies of an endpoint, updated from any thread """
+
+    def __init__(self, window: int = 1000):
+        self.count = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float = None, error: bool = False, cache_hit: bool = False):
+        with self._lock:
+            if cache_hit:
+                self.cache_hits += 1
+                return
+            if latency is not None:
+                self.count += 1
+                self.latencies.append(latency)
+            if error:
+                self.errors += 1
+
+    def summary(self) -> dict:
+        with self._lock:
+            lat = np.array(self.latencies) * 1000 if self.latencies else np.zeros(1)
+            return {
+                "count": self.count,
+                "errors": self.errors,
+                "cache_hits": self.cache_hits,
+                "mean_ms": float(lat.mean()),
+                "p50_ms": float(np.percentile(lat, 50)),
+                "p95_ms": float(np.percentile(lat, 95)),
+            }
+
+
+class HttpClient(object):
+    """
+    Shared HTTP client for brokers and data scripts.
+
+    - one keep-alive requests.Session with a connection pool per host
+    - GET responses cached for `ttl` seconds when a ttl is given
+    - identical GETs in flight at the same time share a single request
+    - per-endpoint latency metrics, see latency_report()
+    - failed connections retried up to max_retries times; requests that may
+      have reached the server only for idempotent methods, so an order POST
+      is never sent twice
+    """
+
+    def __init__(self, pool_maxsize: int = 32, max_retries: int = 2):
+        self.session = requests.Session()
+        retry = Retry(total=max_retries, status=0, allowed_methods=Retry.DEFAULT_ALLOWED_METHODS)
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=8, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._lock = threading.Lock()
+        self._cache = {}  # key -> (expiry, response)
+        self._in_flight = {}  # key -> _InFlight
+        self.metrics = defaultdict(LatencyStats)
+
+    @staticmethod
+    def _key(method, url, params, headers):
+        return (
+            method, url,
+            tuple(sorted(params.items())) if params else (),
+            tuple(sorted(headers.items())) if headers else (),
+        )
+
+    def _send(self, method, url, name, **kwargs) -> requests.Response:
+        with self._lock:
+            stats = self.metrics[name]
+        start = time.perf_counter()
+        try:
+            res = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            stats.record(error=True)
+            raise
+        stats.record(time.perf_counter() - start, error=not res.ok)
+        return res
+
+    def request(self, method, url, params=None, headers=None, ttl: float = None,
+                name: str = None, **kwargs) -> requests.Response:
+        """
+        name - label for latency metrics, defaults to host + path
+        ttl - seconds to cache a successful GET response for
+        """
+        if name is None:
+            parsed = urlparse(url)
+            name = parsed.netloc + parsed.path
+        if method != "GET":
+            return self._send(method, url, name, params=params, headers=headers, **kwargs)
+
+        key = self._key(method, url, params, headers)
+        leader = False
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] > time.monotonic():
+                self.metrics[name].record(cache_hit=True)
+                return cached[1]
+            call = self._in_flight.get(key)
+            if call is None:
+                call = _InFlight()
+                self._in_flight[key] = call
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.response
+
+        try:
+            call.response = self._send(method, url, name, params=params, headers=headers, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+                if ttl is not None and call.response is not None and call.response.ok:
+                    self._cache[key] = (time.monotonic() + ttl, call.response)
+            call.done.set()
+        return call.response
+
+    def get(self, url, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def delete(self, url, **kwargs) -> requests.Response:
+        return self.request("DELETE", url, **kwargs)
+
+    def get_json(self, url, **kwargs):
+        return self.get(url, **kwargs).json()
+
+    def invalidate(self, url_prefix: str = ""):
+        """ drops cached responses whose url starts with url_prefix """
+        with self._lock:
+            for key in [k for k in self._cache if k[1].startswith(url_prefix)]:
+                del self._cache[key]
+
+    def latency_report(self) -> dict:
+        return {name: stats.summary() for name, stats in self.metrics.items()}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> HttpClient:
+    """ process-wide HttpClient shared by brokers and data scripts """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+    return _client
@@ -0,0 +1,99 @@
+"""
+Startup guard for the entry point scripts.
+
+python -m backtest.utilities.import_bench [--budget SECONDS] [--top N]
+
+Imports what loop.py imports in a fresh interpreter and exits non-zero if
+backtest code pulled in a heavy dependency (broker SDKs, plotting, ML) or
+the imports took longer than the budget. Third party modules loop.py
+imports itself are loaded first, so what they drag in isn't blamed on
+backtest.
+"""
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+
+ENTRY_POINT = os.path.join(os.path.dirname(__file__), "..", "..", "loop.py")
+
+# backtest modules must only load these on first use. pyarrow isn't one of
+# them, pandas imports it at startup whenever it's installed
+LAZY_MODULES = [
+    "ibapi", "alpaca_trade_api", "requests", "selenium", "websocket",
+    "matplotlib", "seaborn", "sklearn",
+]
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+for module in {modules!r}:
+    if module.split(".")[0] != "backtest":
+        __import__(module)
+before = set(m for m in {lazy!r} if m in sys.modules)
+for module in {modules!r}:
+    if module.split(".")[0] == "backtest":
+        __import__(module)
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": elapsed,
+    "loaded": sorted(m for m in {lazy!r} if m in sys.modules and m not in before),
+}}))
+"""
+
+
+def entry_imports(path: str = ENTRY_POINT) -> list:
+    """ modules imported at the top level of an entry point script, in order """
+    with open(path, "r") as fin:
+        tree = ast.parse(fin.read(), path)
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+def measure(modules=None, lazy=LAZY_MODULES) -> dict:
+    """ modules - defaults to what loop.py imports """
+    modules = entry_imports() if modules is None else modules
+    res = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(modules=modules, lazy=lazy)],
+        capture_output=True, text=True)
+    if res.returncode != 0:
+        raise Exception(f"Import probe failed:\n{res.stderr}")
+    result = json.loads(res.stdout.strip().splitlines()[-1])
+    ## -X importtime lines: "import time: self [us] | cumulative | imported package"
+    cumulative = []
+    for line in res.stderr.splitlines():
+        parts = line.split("|")
+        if line.startswith("import time:") and len(parts) == 3 and parts[1].strip().isdigit():
+            cumulative.append((int(parts[1]), parts[2].rstrip()))
+    result["slowest"] = sorted(cumulative, reverse=True)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time guard for backtest entry points")
+    parser.add_argument("--budget", type=float, default=2.0, help="max seconds for the entry point imports")
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    args = parser.parse_args()
+
+    result = measure()
+    print(f"loop.py imports: {result['seconds']:.3f}s (budget {args.budget:.3f}s)")
+    for us, module in result["slowest"][:args.top]:
+        print(f"{us / 1e6:8.3f}s {module}")
+    failed = False
+    if result["loaded"]:
+        print(f"FAIL: eagerly imported {', '.join(result['loaded'])}")
+        failed = True
+    if result["seconds"] > args.budget:
+        print("FAIL: over the import time budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
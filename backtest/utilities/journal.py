@@ -0,0 +1,206 @@
+import numpy as np
+import pandas as pd
+
+from trading_common.event import FillEvent
+from trading_common.utilities.enum import OrderPosition, OrderType
+
+## column name -> dtype of the journal buffers
+JOURNAL_COLUMNS = {
+    "timestamp": np.int64,  # epoch ns of the fill
+    "symbol": np.int32,  # index into symbol_list
+    "side": np.int8,  # 1 buy, -1 sell
+    "quantity": np.float64,
+    "price": np.float64,
+    "commission": np.float64,
+    "order_type": np.int8,  # 0 market, 1 limit
+    "latency": np.int64,  # ns from signal to fill
+}
+
+
+class TradeJournal(object):
+    """
+    Fill journal kept in preallocated column arrays that double when full,
+    so recording a fill is a handful of array writes instead of a log line.
+    """
+
+    def __init__(self, symbol_list, capacity: int = 4096):
+        self.symbol_list = list(symbol_list)
+        self.symbol_idx = dict((s, idx) for idx, s in enumerate(self.symbol_list))
+        self.size = 0
+        self.columns = dict((name, np.zeros(capacity, dtype=dtype)) for name, dtype in JOURNAL_COLUMNS.items())
+
+    def __len__(self):
+        return self.size
+
+    def _grow(self):
+        for name, col in self.columns.items():
+            new_col = np.empty(2 * len(col), dtype=col.dtype)
+            new_col[:self.size] = col[:self.size]
+            self.columns[name] = new_col
+
+    def record(self, fill: FillEvent, fill_datetime=None):
+        """ fill_datetime - when the order filled, defaults to the order date """
+        if self.size == len(self.columns["timestamp"]):
+            self._grow()
+        order = fill.order_event
+        i = self.size
+        timestamp = pd.Timestamp(fill_datetime if fill_datetime is not None else order.date).value
+        signal_datetime = getattr(order, "signal_datetime", None)
+        self.columns["timestamp"][i] = timestamp
+        self.columns["symbol"][i] = self.symbol_idx[order.symbol]
+        self.columns["side"][i] = 1 if order.direction == OrderPosition.BUY else -1
+        self.columns["quantity"][i] = order.quantity
+        self.columns["price"][i] = order.trade_price
+        self.columns["commission"][i] = fill.commission
+        self.columns["order_type"][i] = 1 if order.order_type == OrderType.LIMIT else 0
+        self.columns["latency"][i] = timestamp - pd.Timestamp(signal_datetime).value if signal_datetime is not None else 0
+        self.size += 1
+
+    def extend(self, **columns):
+        """ appends many fills at once, one array per JOURNAL_COLUMNS entry """
+        n = len(columns["timestamp"])
+        while self.size + n > len(self.columns["timestamp"]):
+            self._grow()
+        for name, col in self.columns.items():
+            col[self.size:self.size + n] = columns[name]
+        self.size += n
+
+    def to_frame(self) -> pd.DataFrame:
+        df = pd.DataFrame(dict((name, col[:self.size]) for name, col in self.columns.items()))
+        df["timestamp"] = pd.to_datetime(df["timestamp"])
+        df["latency"] = pd.to_timedelta(df["latency"])
+        df["symbol"] = pd.Categorical.from_codes(df["symbol"], categories=self.symbol_list)
+        return df
+
+    def to_arrow(self):
+        """ pyarrow.Table of the journal. Requires pyarrow """
+        import pyarrow as pa
+        return pa.Table.from_pandas(self.to_frame(), preserve_index=False)
+
+    def export(self, fp: str):
+        """ writes the journal to fp as Parquet, or Arrow IPC if fp ends with .arrow / .feather """
+        import pyarrow.feather as feather
+        import pyarrow.parquet as pq
+        table = self.to_arrow()
+        if fp.endswith((".arrow", ".feather")):
+            feather.write_feather(table, fp)
+        else:
+            pq.write_table(table, fp)
+
+    def round_trips(self, closes: pd.DataFrame = None) -> pd.DataFrame:
+        """
+        One row per closed round trip, ie. flat -> position -> flat, per symbol.
+        A fill that reverses a position closes the trade and opens the next one,
+        with the commission split pro rata.
+        closes - optional DataFrame of close prices (datetime index, symbol columns)
+            for the maximum adverse / favourable excursion of each trade.
+        """
+        n = self.size
+        if n == 0:
+            return pd.DataFrame(columns=["symbol", "direction", "entry", "exit", "holding_period",
+                                         "entry_price", "pnl", "return", "mae", "mfe"])
+        symbol = self.columns["symbol"][:n]
+        order = np.lexsort((np.arange(n), symbol))
+        sym = symbol[order]
+        ts = self.columns["timestamp"][:n][order]
+        signed = (self.columns["side"][:n] * self.columns["quantity"][:n])[order]
+        price = self.columns["price"][:n][order]
+        commission = self.columns["commission"][:n][order]
+
+        new_symbol = np.r_[True, sym[1:] != sym[:-1]]
+        position, prev_position = self._positions(signed, new_symbol)
+        ## split reversals into the closing and the opening fill
+        reversal = prev_position * position < 0
+        if reversal.any():
+            rows = np.repeat(np.arange(n), np.where(reversal, 2, 1))
+            opening_part = np.r_[False, rows[1:] == rows[:-1]]
+            part = np.where(opening_part, position[rows],
+                            np.where(reversal[rows], -prev_position[rows], signed[rows]))
+            commission = commission[rows] * np.abs(part) / np.abs(signed[rows])
+            sym, ts, price, signed = sym[rows], ts[rows], price[rows], part
+            new_symbol = new_symbol[rows] & ~opening_part
+            position, prev_position = self._positions(signed, new_symbol)
+
+        ## a trade opens on every fill made while flat
+        trade_id = np.cumsum(prev_position == 0) - 1
+        closed = np.zeros(trade_id[-1] + 1, dtype=bool)
+        closed[trade_id[position == 0]] = True
+
+        direction = np.zeros(len(closed))
+        direction[trade_id[prev_position == 0]] = np.sign(signed[prev_position == 0])
+        opening = np.sign(signed) == direction[trade_id]
+        cash_flow = -signed * price - commission
+        pnl = np.bincount(trade_id, weights=cash_flow)
+        entry_qty = np.bincount(trade_id, weights=np.where(opening, np.abs(signed), 0.0))
+        entry_value = np.bincount(trade_id, weights=np.where(opening, np.abs(signed) * price, 0.0))
+        first = np.r_[True, trade_id[1:] != trade_id[:-1]]
+        last = np.r_[trade_id[1:] != trade_id[:-1], True]
+
+        trades = pd.DataFrame({
+            "symbol": np.array(self.symbol_list, dtype=object)[sym[first]],
+            "direction": direction,
+            "entry": pd.to_datetime(ts[first]),
+            "exit": pd.to_datetime(ts[last]),
+            "entry_price": entry_value / entry_qty,
+            "pnl": pnl,
+        })
+        trades["holding_period"] = trades["exit"] - trades["entry"]
+        trades["return"] = trades["pnl"] / entry_value
+        trades["mae"] = np.nan
+        trades["mfe"] = np.nan
+        trades = trades[closed].reset_index(drop=True)
+        if closes is not None and len(trades) > 0:
+            self._excursions(trades, closes)
+        return trades
+
+    @staticmethod
+    def _positions(signed, new_symbol):
+        """ running position per symbol after and before each fill """
+        cum = np.cumsum(signed)
+        group_start = np.maximum.accumulate(np.where(new_symbol, np.arange(len(signed)), 0))
+        position = cum - (cum - signed)[group_start]
+        prev_position = np.where(new_symbol, 0.0, np.r_[0.0, position[:-1]])
+        return position, prev_position
+
+    @staticmethod
+    def _excursions(trades: pd.DataFrame, closes: pd.DataFrame):
+        """ fills mae / mfe (as returns vs entry price) from each symbol's closes """
+        for symbol, idx in trades.groupby("symbol").groups.items():
+            if symbol not in closes:
+                continue
+            series = closes[symbol].dropna()
+            values = series.to_numpy(dtype=np.float64)
+            if len(values) == 0:
+                continue
+            t = trades.loc[idx]
+            start = np.searchsorted(series.index.values, t["entry"].values)
+            end = np.searchsorted(series.index.values, t["exit"].values, side="right")
+            start = np.minimum(start, len(values) - 1)
+            end = np.maximum(end, start + 1)
+            ## reduceat over (start, end) pairs, every other result is a trade window.
+            ## padded so that an end at the last bar is still a valid index
+            padded = np.r_[values, values[-1]]
+            bounds = np.column_stack([start, end]).ravel()
+            lows = np.minimum.reduceat(padded, bounds)[::2]
+            highs = np.maximum.reduceat(padded, bounds)[::2]
+            entry = t["entry_price"].to_numpy()
+            long = t["direction"].to_numpy() > 0
+            trades.loc[idx, "mae"] = np.where(long, lows / entry - 1, 1 - highs / entry)
+            trades.loc[idx, "mfe"] = np.where(long, highs / entry - 1, 1 - lows / entry)
+
+    def trade_stats(self, closes: pd.DataFrame = None) -> dict:
+        trades = self.round_trips(closes)
+        if len(trades) == 0:
+            return {"trades": 0}
+        wins = trades["pnl"] > 0
+        return {
+            "trades": len(trades),
+            "win_rate": wins.mean(),
+            "avg_win": trades.loc[wins, "pnl"].mean(),
+            "avg_loss": trades.loc[~wins, "pnl"].mean(),
+            "profit_factor": trades.loc[wins, "pnl"].sum() / -trades.loc[~wins, "pnl"].sum()
+                if (~wins).any() else np.inf,
+            "avg_holding_period": trades["holding_period"].mean(),
+            "avg_mae": trades["mae"].mean(),
+            "avg_mfe": trades["mfe"].mean(),
+        }
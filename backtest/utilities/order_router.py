@@ -0,0 +1,144 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from trading_common.event import FillEvent, OrderEvent
+
+# statuses returned by poll_status callables
+FILLED = "filled"
+OPEN = "open"
+DEAD = "dead"  # rejected / canceled / expired
+
+
+class RateLimiter(object):
+    """
+    Thread-safe token bucket. acquire() blocks until a request may be sent,
+    so concurrent callers together stay under `rate` requests per `per` seconds.
+    """
+
+    def __init__(self, rate: float, per: float = 1.0, burst: int = None):
+        self.rate = rate / per
+        self.capacity = burst if burst is not None else max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, cancel: threading.Event = None) -> bool:
+        """ returns False without a token if cancel is set while waiting """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if cancel is None:
+                time.sleep(wait)
+            elif cancel.wait(wait):
+                return False
+
+
+class OrderRouter(object):
+    """
+    Submits orders concurrently from a thread pool and polls their status
+    until filled, putting a FillEvent with the actual fill price and quantity
+    onto the event queue.
+
+    Broker specifics are passed in as callables:
+    submit(order_event) -> broker order id (raise to reject)
+    poll_status(order_id) -> (status, filled_qty, avg_fill_price)
+    commission(order_event) -> float
+
+    Submissions and status polls have separate budgets (rate_limiter and
+    poll_limiter), so polling many open orders never holds up new orders.
+    Together they should stay under the broker's request limit.
+    """
+
+    def __init__(self, events, submit, poll_status, commission=lambda order: 0.0,
+                 rate_limiter: RateLimiter = None, max_workers: int = 8,
+                 poll_interval: float = 1.0, poll_limiter: RateLimiter = None):
+        self.events = events
+        self._submit = submit
+        self._poll_status = poll_status
+        self._commission = commission
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter(150, 60)
+        self.poll_limiter = poll_limiter if poll_limiter is not None else RateLimiter(50, 60)
+        self.poll_interval = poll_interval
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._open = {}  # order id -> OrderEvent
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._poller = threading.Thread(target=self._poll_loop, daemon=True)
+        self._poller.start()
+
+    def route(self, event: OrderEvent):
+        """ non-blocking. Returns a Future resolving to the broker order id (None if rejected) """
+        with self._cond:
+            self._in_flight += 1
+        return self._pool.submit(self._send, event)
+
+    def route_batch(self, events) -> list:
+        return [self.route(event) for event in events]
+
+    def _send(self, event: OrderEvent):
+        order_id = None
+        try:
+            self.rate_limiter.acquire()
+            order_id = self._submit(event)
+        except Exception as e:
+            logging.info(f"Place Order Unsuccessful: {event.print_order()}\n{e}")
+        with self._cond:
+            self._in_flight -= 1
+            if order_id is not None:
+                self._open[order_id] = event
+            self._cond.notify_all()
+        return order_id
+
+    def _poll_loop(self):
+        while not self._stop.wait(self.poll_interval):
+            with self._cond:
+                open_orders = list(self._open.items())
+            for order_id, event in open_orders:
+                try:
+                    if not self.poll_limiter.acquire(cancel=self._stop):
+                        return
+                    status, filled_qty, fill_price = self._poll_status(order_id)
+                except Exception as e:
+                    logging.info(f"Order status poll failed for {order_id}: {e}")
+                    continue
+                if status == OPEN:
+                    continue
+                if status == FILLED:
+                    event.quantity = filled_qty
+                    event.trade_price = fill_price
+                    self.events.put(FillEvent(event, self._commission(event)))
+                else:
+                    logging.info(f"Order {order_id} not filled ({status}): {event.print_order()}")
+                with self._cond:
+                    del self._open[order_id]
+                    self._cond.notify_all()
+
+    def pending(self) -> int:
+        with self._cond:
+            return self._in_flight + len(self._open)
+
+    def wait(self, timeout: float = None) -> bool:
+        """ blocks until every routed order is filled or dead. Returns False on timeout """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._in_flight + len(self._open) > 0:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self):
+        """ waits for submissions in flight, then stops polling. Orders still open are no longer tracked """
+        self._pool.shutdown(wait=True)
+        self._stop.set()
+        self._poller.join()
@@ -0,0 +1,169 @@
+from abc import ABCMeta, abstractmethod
+
+import numpy as np
+
+
+class RunningMetrics(object):
+    """
+    Return and drawdown statistics of a running backtest, updated from the
+    rows appended to port.all_holdings since the last update, so following a
+    run costs O(1) per bar.
+
+    sharpe is create_sharpe_ratio of the returns so far. max_drawdown is the
+    largest drop from the peak, as a fraction of the peak total.
+    """
+
+    def __init__(self, periods: int = 252):
+        self.periods = periods
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.first_total = None
+        self.last_total = None
+        self.peak = -np.inf
+        self.max_drawdown = 0.0
+        self._seen = 0
+
+    def update(self, all_holdings):
+        for row in all_holdings[self._seen:]:
+            total = row['total']
+            if self.last_total is None:
+                self.first_total = total
+            elif self.last_total != 0:
+                ## Welford's running mean / variance of the returns
+                r = total / self.last_total - 1
+                self.n += 1
+                delta = r - self.mean
+                self.mean += delta / self.n
+                self.m2 += delta * (r - self.mean)
+            self.last_total = total
+            self.peak = max(self.peak, total)
+            if self.peak > 0:
+                self.max_drawdown = max(self.max_drawdown, 1 - total / self.peak)
+        self._seen = len(all_holdings)
+
+    @property
+    def std(self) -> float:
+        return np.sqrt(self.m2 / self.n) if self.n > 0 else np.nan
+
+    @property
+    def sharpe(self) -> float:
+        if self.n < 2 or self.m2 == 0:
+            return np.nan
+        return np.sqrt(self.periods) * self.mean / self.std
+
+    @property
+    def sharpe_se(self) -> float:
+        """ standard error of the annualized sharpe ratio (Lo, 2002) """
+        if self.n < 2 or self.m2 == 0:
+            return np.nan
+        per_period = self.mean / self.std
+        return np.sqrt(self.periods * (1 + 0.5 * per_period ** 2) / self.n)
+
+    @property
+    def total_return(self) -> float:
+        if self.first_total is None or self.first_total == 0:
+            return np.nan
+        return self.last_total / self.first_total - 1
+
+    def summary(self) -> dict:
+        return {
+            "total_return": self.total_return,
+            "sharpe": self.sharpe,
+            "sharpe_se": self.sharpe_se,
+            "max_drawdown": self.max_drawdown,
+            "periods": self.n,
+        }
+
+
+class Pruner(metaclass=ABCMeta):
+    """
+    Decides every `every` bars (after `warmup` bars) whether a backtest is
+    hopeless. _run_bars stops the run once check() returns True; pruned,
+    pruned_at and reason tell what happened.
+    """
+
+    def __init__(self, every: int = 21, warmup: int = 0, periods: int = 252):
+        self.every = every
+        self.warmup = warmup
+        self.metrics = RunningMetrics(periods)
+        self.pruned = False
+        self.pruned_at = None
+        self.reason = None
+
+    def due(self, bars_seen: int) -> bool:
+        return bars_seen >= self.warmup and bars_seen % self.every == 0
+
+    def check(self, bars_seen: int, port) -> bool:
+        self.metrics.update(port.all_holdings)
+        reason = self.prune_reason(bars_seen, self.metrics)
+        if reason:
+            self.pruned = True
+            self.pruned_at = bars_seen
+            self.reason = reason
+        return self.pruned
+
+    @abstractmethod
+    def prune_reason(self, bars_seen: int, metrics: RunningMetrics) -> str:
+        """ why the run should stop, None to keep going """
+        raise NotImplementedError("Should implement prune_reason()")
+
+
+class DrawdownPruner(Pruner):
+    """ stops runs whose drawdown from peak equity exceeds max_drawdown (a fraction, eg. 0.3) """
+
+    def __init__(self, max_drawdown: float, every: int = 21, warmup: int = 0, periods: int = 252):
+        super().__init__(every, warmup, periods)
+        self.max_drawdown = max_drawdown
+
+    def prune_reason(self, bars_seen, metrics):
+        if metrics.max_drawdown > self.max_drawdown:
+            return f"drawdown {metrics.max_drawdown:.2%} > {self.max_drawdown:.2%}"
+
+
+class SharpePruner(Pruner):
+    """
+    Stops runs whose sharpe ratio is clearly below the best one so far:
+    sharpe + z * se < best lower bound, once min_periods returns are in.
+    best - a float, or an object with best_lower_bound(z) such as
+        backtest.utilities.search.Study, read at every check
+    """
+
+    def __init__(self, best, z: float = 1.0, min_periods: int = 252, every: int = 21,
+                 warmup: int = 0, periods: int = 252):
+        super().__init__(every, warmup, periods)
+        self.best = best
+        self.z = z
+        self.min_periods = min_periods
+
+    def prune_reason(self, bars_seen, metrics):
+        if metrics.n < self.min_periods or np.isnan(metrics.sharpe):
+            return None
+        best = self.best.best_lower_bound(self.z) if hasattr(self.best, "best_lower_bound") else self.best
+        if best is None or np.isnan(best):
+            return None
+        upper = metrics.sharpe + self.z * metrics.sharpe_se
+        if upper < best:
+            return f"sharpe {metrics.sharpe:.2f} (upper {upper:.2f}) < best lower bound {best:.2f}"
+
+
+class AnyPruner(Pruner):
+    """ prunes when any of the pruners would, checked on its own schedule """
+
+    def __init__(self, pruners, periods: int = 252):
+        super().__init__(every=1, periods=periods)
+        self.pruners = list(pruners)
+
+    def due(self, bars_seen):
+        return any(p.due(bars_seen) for p in self.pruners)
+
+    def check(self, bars_seen, port):
+        self.metrics.update(port.all_holdings)
+        for p in self.pruners:
+            if p.due(bars_seen) and p.check(bars_seen, port):
+                self.pruned, self.pruned_at, self.reason = True, bars_seen, p.reason
+                break
+        return self.pruned
+
+    def prune_reason(self, bars_seen, metrics):
+        return None
@@ -0,0 +1,263 @@
+"""
+Parameter searches that only spend bars on promising configurations.
+
+build(params) returns the engine components of one run as a dict with bars,
+event_queue, order_queue, strategy, port and broker keys (and optionally
+resources, an ExitStack closed once the run is done), eg. from
+spec_builder(spec) which fills {"param": name} placeholders of a run spec
+(backtest.config) and builds it like the CLI does.
+
+Spaces map a parameter name to ("float", low, high), ("log", low, high),
+("int", low, high) or ("choice", [options]).
+
+tpe_search - Tree-structured Parzen Estimator: after n_startup random
+    trials, candidates are drawn around the best gamma fraction of trials and
+    the one most likely to be good rather than bad is run. Runs are pruned by
+    the pruners from make_pruners (eg. a drawdown limit and sharpe below the
+    best's lower bound).
+successive_halving - runs a population of configurations for min_bars,
+    keeps the best 1 / eta, runs those eta times longer and so on, so only
+    the survivors reach the end of the data.
+"""
+import contextlib
+import copy
+import logging
+import math
+
+import numpy as np
+
+from backtest.utilities.pruning import AnyPruner, RunningMetrics
+from backtest.utilities.utils import _run_bars
+
+
+class Trial(object):
+    def __init__(self, number: int, params: dict):
+        self.number = number
+        self.params = params
+        self.value = None
+        self.metrics = {}
+        self.bars_seen = 0
+        self.pruned = False
+        self.reason = None
+
+    def __repr__(self):
+        state = f"pruned at {self.bars_seen} ({self.reason})" if self.pruned else f"{self.bars_seen} bars"
+        return f"Trial({self.number}, {self.params}, value={self.value}, {state})"
+
+
+class Study(object):
+    """ trials of a search. Completed trials count for the best, pruned ones only for sampling """
+
+    def __init__(self, metric: str = "sharpe"):
+        self.metric = metric
+        self.trials = []
+
+    @property
+    def completed(self) -> list:
+        return [t for t in self.trials if not t.pruned and t.value is not None and not np.isnan(t.value)]
+
+    @property
+    def best(self) -> Trial:
+        completed = self.completed
+        return max(completed, key=lambda t: t.value) if completed else None
+
+    def best_lower_bound(self, z: float = 1.0) -> float:
+        """ lower confidence bound of the best trial's sharpe, for SharpePruner """
+        best = self.best
+        if best is None:
+            return None
+        return best.metrics["sharpe"] - z * best.metrics["sharpe_se"]
+
+
+def _fill_params(value, params: dict):
+    if isinstance(value, dict) and "param" in value:
+        return params[value["param"]]
+    if isinstance(value, dict):
+        return dict((k, _fill_params(v, params)) for k, v in value.items())
+    if isinstance(value, list):
+        return [_fill_params(v, params) for v in value]
+    return value
+
+
+def spec_builder(spec: dict):
+    """ build(params) for a run spec with {"param": name} placeholders """
+    from backtest.cli import build_run
+    from backtest.config import validate
+
+    def build(params):
+        run_spec = validate(_fill_params(copy.deepcopy(spec), params))
+        return build_run(run_spec)
+    return build
+
+
+def run_trial(build, params: dict, pruner=None, max_bars: int = None, number: int = 0,
+              metric: str = "sharpe") -> Trial:
+    """ builds and runs one configuration without plotting, stopping early if pruned """
+    trial = Trial(number, params)
+    run = build(params)
+    with run.get("resources") or contextlib.ExitStack():
+        trial.bars_seen = _run_bars(run["bars"], run["event_queue"], run["order_queue"], run["strategy"],
+                                    run["port"], run["broker"], max_bars=max_bars, pruner=pruner)
+    metrics = RunningMetrics()
+    metrics.update(run["port"].all_holdings)
+    trial.metrics = metrics.summary()
+    trial.value = trial.metrics[metric]
+    if pruner is not None and pruner.pruned:
+        trial.pruned = True
+        trial.reason = pruner.reason
+    return trial
+
+
+class TPESampler(object):
+    def __init__(self, space: dict, n_startup: int = 10, gamma: float = 0.25,
+                 n_candidates: int = 24, seed=None):
+        for name, dim in space.items():
+            if dim[0] not in ("float", "log", "int", "choice"):
+                raise Exception(f"Unknown kind {dim[0]} for parameter {name}")
+        self.space = space
+        self.n_startup = n_startup
+        self.gamma = gamma
+        self.n_candidates = n_candidates
+        self.rng = np.random.default_rng(seed)
+
+    def _bounds(self, dim):
+        low, high = dim[1], dim[2]
+        return (math.log(low), math.log(high)) if dim[0] == "log" else (float(low), float(high))
+
+    def _to_value(self, dim, x):
+        if dim[0] == "log":
+            return float(math.exp(x))
+        if dim[0] == "int":
+            return int(round(x))
+        return float(x)
+
+    def _to_internal(self, dim, value):
+        return math.log(value) if dim[0] == "log" else float(value)
+
+    def _random(self) -> dict:
+        params = {}
+        for name, dim in self.space.items():
+            if dim[0] == "choice":
+                params[name] = dim[1][self.rng.integers(len(dim[1]))]
+            else:
+                low, high = self._bounds(dim)
+                params[name] = self._to_value(dim, self.rng.uniform(low, high))
+        return params
+
+    def _parzen(self, dim, points):
+        """ (means, sigmas) of a gaussian mixture over points plus a wide prior component """
+        low, high = self._bounds(dim)
+        means = np.r_[points, (low + high) / 2]
+        sigma = (high - low) * max(len(points), 1) ** -0.2 / 2
+        sigmas = np.r_[np.full(len(points), max(sigma, (high - low) / 100)), high - low]
+        return means, sigmas
+
+    def _log_density(self, x, means, sigmas):
+        z = (x[:, None] - means[None, :]) / sigmas[None, :]
+        dens = np.exp(-0.5 * z ** 2) / (sigmas[None, :] * np.sqrt(2 * np.pi))
+        return np.log(dens.mean(axis=1) + 1e-300)
+
+    def sample(self, study: Study) -> dict:
+        observed = [t for t in study.trials if t.value is not None and not np.isnan(t.value)]
+        if len(observed) < self.n_startup:
+            return self._random()
+        ## pruned trials are ranked on the value they had when stopped
+        observed.sort(key=lambda t: t.value, reverse=True)
+        n_good = max(1, int(math.ceil(self.gamma * len(observed))))
+        good, bad = observed[:n_good], observed[n_good:]
+        score = np.zeros(self.n_candidates)
+        candidates = {}
+        for name, dim in self.space.items():
+            if dim[0] == "choice":
+                options = dim[1]
+                good_w = np.array([sum(t.params[name] == o for t in good) + 1.0 for o in options])
+                bad_w = np.array([sum(t.params[name] == o for t in bad) + 1.0 for o in options])
+                good_w, bad_w = good_w / good_w.sum(), bad_w / bad_w.sum()
+                idx = self.rng.choice(len(options), size=self.n_candidates, p=good_w)
+                candidates[name] = [options[i] for i in idx]
+                score += np.log(good_w[idx]) - np.log(bad_w[idx])
+                continue
+            low, high = self._bounds(dim)
+            g_means, g_sigmas = self._parzen(dim, np.array([self._to_internal(dim, t.params[name]) for t in good]))
+            b_means, b_sigmas = self._parzen(dim, np.array([self._to_internal(dim, t.params[name]) for t in bad]))
+            component = self.rng.integers(len(g_means), size=self.n_candidates)
+            x = np.clip(self.rng.normal(g_means[component], g_sigmas[component]), low, high)
+            candidates[name] = x
+            score += self._log_density(x, g_means, g_sigmas) - self._log_density(x, b_means, b_sigmas)
+        best = int(np.argmax(score))
+        return dict((name, candidates[name][best] if dim[0] == "choice" else self._to_value(dim, candidates[name][best]))
+                    for name, dim in self.space.items())
+
+
+def tpe_search(build, space: dict, n_trials: int, make_pruners=None, metric: str = "sharpe",
+               n_startup: int = 10, gamma: float = 0.25, seed=None, study: Study = None) -> Study:
+    """
+    make_pruners(study) - returns the pruners of a new trial, eg.
+        lambda study: [DrawdownPruner(0.3), SharpePruner(study, warmup=252)]
+    """
+    study = study if study is not None else Study(metric)
+    sampler = TPESampler(space, n_startup=n_startup, gamma=gamma, seed=seed)
+    for _ in range(n_trials):
+        params = sampler.sample(study)
+        pruner = AnyPruner(make_pruners(study)) if make_pruners is not None else None
+        trial = run_trial(build, params, pruner, number=len(study.trials), metric=metric)
+        study.trials.append(trial)
+        logging.info(trial)
+    return study
+
+
+def _rank_value(trial: Trial) -> float:
+    """ trials without a value (None or NaN) rank last """
+    return -np.inf if trial.value is None or np.isnan(trial.value) else trial.value
+
+
+def _release(run: dict):
+    if run.get("resources") is not None:
+        run["resources"].close()
+
+
+def successive_halving(build, configs: list, min_bars: int = 252, eta: int = 3, metric: str = "sharpe") -> list:
+    """
+    Runs every configuration for min_bars, keeps the best 1 / eta, runs those
+    for eta times as many bars and so on until the survivors reach the end of
+    the data. Runs keep their state between rungs. Returns the Trials, best first;
+    eliminated ones are marked pruned with the rung they stopped at.
+
+    Runs are built when first stepped and their resources released as soon as
+    they finish or are eliminated, or if the search fails.
+    """
+    trials = [Trial(i, params) for i, params in enumerate(configs)]
+    runs = {}
+    with contextlib.ExitStack() as stack:
+        alive = list(trials)
+        budget = min_bars
+        while alive:
+            for trial in alive:
+                if trial.number not in runs:
+                    run = runs[trial.number] = build(trial.params)
+                    stack.callback(_release, run)
+                run = runs[trial.number]
+                trial.bars_seen = _run_bars(run["bars"], run["event_queue"], run["order_queue"], run["strategy"],
+                                            run["port"], run["broker"], trial.bars_seen,
+                                            max_bars=budget - trial.bars_seen)
+                metrics = RunningMetrics()
+                metrics.update(run["port"].all_holdings)
+                trial.metrics = metrics.summary()
+                trial.value = trial.metrics[metric]
+            finished = [t for t in alive if not runs[t.number]["bars"].continue_backtest]
+            running = [t for t in alive if runs[t.number]["bars"].continue_backtest]
+            running.sort(key=_rank_value, reverse=True)
+            keep = max(1, len(running) // eta)
+            for trial in running[keep:]:
+                trial.pruned = True
+                trial.reason = f"successive halving at {budget} bars"
+            for trial in finished + running[keep:]:
+                _release(runs.pop(trial.number))
+            alive = running[:keep]
+            if alive:
+                logging.info(f"Successive halving: {len(alive)} runs continue past {budget} bars, "
+                             f"{len(finished)} done")
+            budget *= eta
+    ## finished runs first, then by how far they got and their value
+    trials.sort(key=lambda t: (not t.pruned, t.bars_seen, _rank_value(t)), reverse=True)
+    return trials
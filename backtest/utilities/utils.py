@@ -2,23 +2,67 @@ import time
 import queue
 import logging
 import os
+import numpy as np
 import pandas as pd
-from trading_common.plots.plot import Plot, PlotTradePrices
+from trading_common.strategy.naive import Strategy
 from trading_common.utilities.constants import backtest_basepath
+from backtest.utilities.checkpoint import Checkpointer
 
 NY = "America/New_York"
 
 
-def _backtest_loop(bars, event_queue, order_queue, strategy, port, broker, loop_live: bool = False) -> Plot:
-    start = time.time()
-    while True:
+def _scan_symbols(bars, port):
+    """
+    symbols a per-symbol strategy has to look at this bar, None for all of them.
+    Point-in-time universes narrow it to today's members, plus the symbols
+    still held so they can be exited. Streaming handlers narrow it to the
+    symbols that got a new bar (updated_symbols)
+    """
+    symbols = None
+    active = getattr(bars, "active_symbols", None)
+    if active is not None and len(active) != len(bars.symbol_list):
+        symbols = active
+        ledger = getattr(port, "ledger", None)
+        held = set(np.asarray(port.symbol_list)[ledger.quantity != 0]) if ledger is not None else set()
+        if held:
+            members = set(active) | held
+            symbols = [s for s in bars.symbol_list if s in members]
+    updated = getattr(bars, "updated_symbols", None)
+    if updated is not None and len(updated) != len(bars.symbol_list):
+        symbols = [s for s in (bars.symbol_list if symbols is None else symbols) if s in updated]
+    return symbols
+
+
+def _calculate_signals(strategy, bars, port, event) -> list:
+    """
+    signals of a MARKET event. Strategies using the default per-symbol loop
+    (Strategy.calculate_signals over _calculate_signal) skip the symbols
+    _scan_symbols leaves out, in symbol_list order like the full loop
+    """
+    symbols = None
+    if hasattr(strategy, "_calculate_signal") and type(strategy).calculate_signals is Strategy.calculate_signals:
+        symbols = _scan_symbols(bars, port)
+    if symbols is None:
+        return strategy.calculate_signals(event) or []
+    return [strategy._calculate_signal(s) for s in symbols]
+
+
+def _run_bars(bars, event_queue, order_queue, strategy, port, broker, bars_seen: int = 0,
+              max_bars: int = None, checkpoint: Checkpointer = None, pruner=None) -> int:
+    """
+    Steps a backtest until the data runs out, max_bars more bars are done or
+    the pruner (backtest.utilities.pruning) stops it. Returns the bars seen.
+    The components keep their state, so calling it again carries on the run.
+    """
+    stop_at = bars_seen + max_bars if max_bars is not None else None
+    while bars.continue_backtest == True:
+        if stop_at is not None and bars_seen >= stop_at:
+            return bars_seen
         # Update the bars (specific backtest code, as opposed to live trading)
-        if bars.continue_backtest == True:
-            bars.update_bars()
-        else:
-            while not event_queue.empty():
-                event_queue.get()
-            break
+        if checkpoint is not None:
+            checkpoint.step(bars_seen, bars, order_queue, strategy, port)
+        bars.update_bars()
+        bars_seen += 1
         while True:
             try:
                 event = event_queue.get(block=False)
@@ -28,7 +72,7 @@ def _backtest_loop(bars, event_queue, order_queue, strategy, port, broker, loop_
                 if event is not None:
                     if event.type == 'MARKET':
                         port.update_timeindex(event)
-                        signal_list = strategy.calculate_signals(event)
+                        signal_list = _calculate_signals(strategy, bars, port, event)
                         for signal in signal_list:
                             if signal is not None:
                                 event_queue.put(signal)
@@ -45,16 +89,76 @@ def _backtest_loop(bars, event_queue, order_queue, strategy, port, broker, loop_
                     elif event.type == 'FILL':
                         port.update_fill(event)
 
-    print(f"Backtest finished in {time.time() - start}. Getting summary stats")
-    port.create_equity_curve_df()
+        if pruner is not None and pruner.due(bars_seen) and pruner.check(bars_seen, port):
+            logging.info(f"Pruned at bar {bars_seen}: {pruner.reason}")
+            break
+    while not event_queue.empty():
+        event_queue.get()
+    return bars_seen
+
+
+def _backtest_loop(bars, event_queue, order_queue, strategy, port, broker, loop_live: bool = False,
+                   checkpoint: Checkpointer = None, plot: bool = True, pruner=None, cache=None):
+    start = time.time()
+    ## the run is keyed on the components before they start
+    key = cache.key(bars, strategy, port, broker) if cache is not None else None
+    if key is not None and cache.load(key, bars, strategy, port, broker):
+        print(f"Loaded cached backtest in {time.time() - start}")
+    else:
+        bars_seen = 0
+        if checkpoint is not None and checkpoint.begin(bars, strategy, port):
+            bars_seen = checkpoint.restore(bars, event_queue, order_queue, strategy, port)
+        _run_bars(bars, event_queue, order_queue, strategy, port, broker, bars_seen,
+                  checkpoint=checkpoint, pruner=pruner)
+        if checkpoint is not None:
+            checkpoint.clear()
+
+        print(f"Backtest finished in {time.time() - start}. Getting summary stats")
+        port.create_equity_curve_df()
+        if key is not None and not (pruner is not None and pruner.pruned):
+            cache.save(key, bars, strategy, port, broker)
     logging.log(32, port.output_summary_stats())
 
+    if not plot or (pruner is not None and pruner.pruned):
+        return None
+    from trading_common.plots.plot import Plot  # matplotlib is only needed once the run is done
     plotter = Plot(port)
     plotter.plot()
     return plotter
 
 
-def _life_loop(bars, event_queue, order_queue, strategy, port, broker) -> Plot:
+def _dispatch_events(now, bars, event_queue, order_queue, strategy, port, broker):
+    """ handles the queued events of a live cycle until the queue is empty """
+    while True:
+        try:
+            event = event_queue.get(block=False)
+        except queue.Empty:
+            break
+        else:
+            if event is not None:
+                if event.type == 'MARKET':
+                    logging.info(f"{now}: MarketEvent")
+                    port.update_timeindex(event)
+                    for signal in _calculate_signals(strategy, bars, port, event):
+                        if signal is not None:
+                            event_queue.put(signal)
+                    while not order_queue.empty():
+                        event_queue.put(order_queue.get())
+
+                elif event.type == 'SIGNAL':
+                    port.update_signal(event)
+
+                elif event.type == 'ORDER':
+                    if broker.execute_order(event):
+                        logging.info(event.print_order())
+
+                elif event.type == 'FILL':
+                    port.update_fill(event)
+
+
+def _life_loop(bars, event_queue, order_queue, strategy, port, broker, checkpoint: Checkpointer = None):
+    if checkpoint is not None and checkpoint.begin(bars, strategy, port):
+        checkpoint.restore(bars, event_queue, order_queue, strategy, port, fast_forward=False)
     while True:
         # Update the bars (specific backtest code, as opposed to live trading)
         now = pd.Timestamp.now(tz=NY)
@@ -68,35 +172,22 @@ def _life_loop(bars, event_queue, order_queue, strategy, port, broker) -> Plot:
                     os.mkdir(results_dir)
 
                 port.equity_curve.to_csv(os.path.join(
-                    results_dir, f"{port.name}.json"))
+                    results_dir, f"{port.name}.csv"))
+                port.journal.export(os.path.join(
+                    results_dir, f"{port.name}_trades.parquet"))
+                if checkpoint is not None:
+                    checkpoint.clear()
                 break
 
             bars.update_bars()
-            while True:
-                try:
-                    event = event_queue.get(block=False)
-                except queue.Empty:
-                    break
-                else:
-                    if event is not None:
-                        if event.type == 'MARKET':
-                            logging.info(f"{now}: MarketEvent")
-                            port.update_timeindex(event)
-                            if (signal_list := strategy.calculate_signals(event)) is not None:
-                                for signal in signal_list:
-                                    event_queue.put(signal)
-                            while not order_queue.empty():
-                                event_queue.put(order_queue.get())
-
-                        elif event.type == 'SIGNAL':
-                            port.update_signal(event)
-
-                        elif event.type == 'ORDER':
-                            if broker.execute_order(event):
-                                logging.info(event.print_order())
-
-                        elif event.type == 'FILL':
-                            port.update_fill(event)
+            _dispatch_events(now, bars, event_queue, order_queue, strategy, port, broker)
+
+            # orders are routed asynchronously by live brokers, handle their fills
+            # (and whatever the portfolio queues in response) like any other event
+            broker.wait_for_fills(timeout=5 * 60)
+            _dispatch_events(now, bars, event_queue, order_queue, strategy, port, broker)
+            if checkpoint is not None:
+                checkpoint.save(0, bars, order_queue, strategy, port)
 
             # write the day's portfolio status before sleeping
             logging.info(f"{pd.Timestamp.now(tz=NY)}: sleeping")
@@ -1,8 +1,9 @@
 import os
 import json
 
-from backtest.utilities.utils import load_credentials, parse_args, remove_bs
-import requests
+from trading_common.utilities.utils import load_credentials, parse_args, remove_bs
+from backtest.data.metadata import MetadataService
+from backtest.utilities.http_client import get_client
 
 BASE_URL = "https://financialmodelingprep.com/api/v3/"
 with open(f"{os.path.dirname(__file__)}/dow_stock_list.txt", "r") as fin:
@@ -22,39 +23,17 @@ def parseFmpScreenerRes(res_json: list):
     return final_stocks
 
 
-def getindustryByStock():
-    industry_by_stock = {}
-    for stock in snp500[200:400]:
-        res = requests.get(
-            f"https://financialmodelingprep.com/api/v3/profile/{stock}?apikey={os.environ['FMP_API']}")
-        if res.ok:
-            # print(res.json())
-            try:
-                res = res.json()[0]
-                if res["industry"] in industry_by_stock.keys():
-                    industry_by_stock[res["industry"]].add(stock)
-                else:
-                    industry_by_stock[res["industry"]] = {stock}  # set
-            except Exception as e:
-                print(res.json())
-                print(e)
-
-    # convert dict of set to dict of list
-    for k in industry_by_stock.keys():
-        industry_by_stock[k] = list(industry_by_stock[k])
-
-    curr_data = {}
-    with open("industry_by_symbols.json", "r+") as f:
-        curr_data = json.load(f)
-
+def getindustryByStock(symbol_list=None):
+    """
+    Writes industry -> symbols for every profile in the metadata cache.
+    Profiles are only downloaded for symbols that are missing or stale.
+    """
+    service = MetadataService()
+    service.refresh(snp500 if symbol_list is None else symbol_list)
+    industry_by_stock = service.group_by("industry")
     with open("industry_by_symbols.json", "w") as f:
-        # combine curr_data and industry_by_stock
-        for k in curr_data.keys():
-            if k in industry_by_stock.keys():
-                industry_by_stock[k] += curr_data[k]
-            else:
-                industry_by_stock[k] = curr_data[k]
         json.dump(industry_by_stock, f)
+    return industry_by_stock
 
 
 def getScreenedStocks(marketCapMin=None):
@@ -62,7 +41,7 @@ def getScreenedStocks(marketCapMin=None):
     if marketCapMin is not None:
         base_url += f"&marketCapMoreThan={marketCapMin}"
     final_url = base_url + f"&apikey={os.environ['FMP_API']}"
-    res = requests.get(final_url)
+    res = get_client().get(final_url, ttl=60 * 60, name="fmp.screener")
     if res.ok:
         return res.json()
 
@@ -1,9 +1,9 @@
-import requests
 import pandas as pd
 import os
 from datetime import datetime
 
 from trading_common.utilities.utils import parse_args, load_credentials
+from backtest.utilities.http_client import get_client
 
 args = parse_args()
 load_credentials(args.credentials)
@@ -40,7 +40,7 @@ def get_av_csv(symbol, csv_dir, key, full=False, interval=None,):
 
         filepath = csv_dir + f"/{symbol}.csv"
 
-    parsed_data = requests.get(url).json()
+    parsed_data = get_client().get_json(url, name="alphavantage.daily")
     df = pd.DataFrame.from_dict(
         parsed_data['Time Series (Daily)'], orient='index')
     df = df.iloc[::-1]  # reverse from start to end instead of end to start
@@ -61,7 +61,7 @@ def get_tiingo_eod(ticker, full: bool, key):
 
     url = f"https://api.tiingo.com/tiingo/daily/{ticker}/prices?startDate={start_date}&endDate={end_date}&resampleFreq=daily&token={key}"
 
-    requestResponse = requests.get(url, headers=headers)
+    requestResponse = get_client().get(url, headers=headers, name="tiingo.daily")
     if requestResponse.ok:
         json_df = requestResponse.json()
         try:
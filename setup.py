@@ -1,3 +1,4 @@
 from setuptools import setup, find_packages
 
-setup(name='backtest', version='1.0', packages=find_packages())
\ No newline at end of file
+setup(name='backtest', version='1.0', packages=find_packages(),
+      entry_points={"console_scripts": ["backtest=backtest.cli:main"]})
@@ -0,0 +1,80 @@
+import os
+import queue
+
+import numpy as np
+import pandas as pd
+import pytest
+
+
+def write_universe(csv_dir, n_symbols: int = 5, n_days: int = 80, seed: int = 0, start="2021-01-04",
+                   late: dict = None, gaps: dict = None) -> list:
+    """
+    Random walk daily bars as {csv_dir}/{symbol}.csv.
+    late - symbol index -> number of days before its first bar
+    gaps - symbol index -> list of day numbers without a bar
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start, periods=n_days)
+    symbols = [f"S{i}" for i in range(n_symbols)]
+    os.makedirs(csv_dir, exist_ok=True)
+    for i, symbol in enumerate(symbols):
+        close = 50 * np.exp(np.cumsum(rng.normal(0, 0.02, n_days))) * (1 + i / 10)
+        spread = close * rng.uniform(0.001, 0.02, n_days)
+        df = pd.DataFrame({
+            "open": close * (1 + rng.normal(0, 0.005, n_days)), "high": close + spread,
+            "low": close - spread, "close": close, "volume": rng.integers(1000, 100000, n_days).astype(float),
+        }, index=dates.strftime("%Y-%m-%d"))
+        keep = np.ones(n_days, dtype=bool)
+        keep[:(late or {}).get(i, 0)] = False
+        keep[(gaps or {}).get(i, [])] = False
+        df[keep].to_csv(os.path.join(csv_dir, f"{symbol}.csv"))
+    return symbols
+
+
+@pytest.fixture
+def universe(tmp_path):
+    """ (csv_dir, symbols) of a small universe, one symbol listing late and one with missing bars """
+    csv_dir = str(tmp_path / "csv")
+    return csv_dir, write_universe(csv_dir, late={3: 10}, gaps={4: [20, 21, 35]})
+
+
+@pytest.fixture
+def shared_store(universe):
+    from backtest.data.shared import SharedBarStore
+
+    store = SharedBarStore.from_csv(*universe)
+    yield store
+    store.close()
+    store.unlink()
+
+
+def random_signals(bars, seed: int = 0, p_signal: float = 0.3) -> np.ndarray:
+    """ (time x symbol) kernel signal codes, none where a symbol has no bar """
+    from backtest import kernel
+
+    close = bars.arrays()["close"]
+    rng = np.random.default_rng(seed)
+    codes = rng.choice(list(kernel.SIGNAL_POSITIONS), size=close.shape).astype(np.int8)
+    codes[(rng.random(close.shape) > p_signal) | np.isnan(close)] = kernel.NO_SIGNAL
+    return codes
+
+
+def build_engine(store, signals, start_date="2021-01-04", perc: float = 0.2, mode: str = "asset",
+                 portfolio_strategy=None, order_type=None, expires: int = 1) -> dict:
+    """ components of a PercentagePortFolio backtest trading a signal matrix on a SharedBarStore """
+    from trading_common.utilities.enum import OrderType
+
+    from backtest import kernel
+    from backtest.broker import SimulatedBroker
+    from backtest.data.shared import SharedDataHandler
+    from backtest.portfolio.portfolio import PercentagePortFolio
+    from backtest.portfolio.strategy import DefaultOrder
+
+    event_queue, order_queue = queue.LifoQueue(), queue.Queue()
+    bars = SharedDataHandler(event_queue, store, start_date=start_date)
+    port = PercentagePortFolio(bars, event_queue, order_queue, perc, "test", mode=mode,
+                               portfolio_strategy=portfolio_strategy or DefaultOrder,
+                               order_type=order_type or OrderType.MARKET, expires=expires)
+    strategy = kernel.ArraySignalStrategy(bars, event_queue, signals(bars) if callable(signals) else signals)
+    return dict(bars=bars, event_queue=event_queue, order_queue=order_queue, strategy=strategy,
+                port=port, broker=SimulatedBroker(bars, port, event_queue, order_queue))
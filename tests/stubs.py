@@ -0,0 +1,237 @@
+"""
+Local stand-ins for the network services the live components talk to.
+Each server runs on 127.0.0.1 in a daemon thread; use it as a context manager.
+"""
+import base64
+import hashlib
+import json
+import socketserver
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class _Server(object):
+    server_cls = socketserver.ThreadingTCPServer
+    handler = None
+
+    def __enter__(self):
+        self.server = self.server_cls(("127.0.0.1", 0), self.handler)
+        self.server.daemon_threads = True
+        self.server.stub = self
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _recv_exact(sock, n: int) -> bytes:
+    data = b""
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise ConnectionError("client went away")
+        data += chunk
+    return data
+
+
+class _WebsocketHandler(socketserver.BaseRequestHandler):
+    def handshake(self):
+        request = b""
+        while b"\r\n\r\n" not in request:
+            request += self.request.recv(1024)
+        headers = dict(line.split(": ", 1) for line in request.decode().split("\r\n")[1:] if ": " in line)
+        accept = base64.b64encode(hashlib.sha1((headers["Sec-WebSocket-Key"] + WS_GUID).encode()).digest())
+        self.request.sendall(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                             b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+
+    def send(self, payload, opcode: int = 1):
+        data = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        if len(data) < 126:
+            header = struct.pack("!BB", 0x80 | opcode, len(data))
+        else:
+            header = struct.pack("!BBH", 0x80 | opcode, 126, len(data))
+        self.request.sendall(header + data)
+
+    def recv(self):
+        first, second = _recv_exact(self.request, 2)
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", _recv_exact(self.request, 2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", _recv_exact(self.request, 8))[0]
+        mask = _recv_exact(self.request, 4) if second & 0x80 else b"\0\0\0\0"
+        data = bytes(b ^ mask[i % 4] for i, b in enumerate(_recv_exact(self.request, length)))
+        return json.loads(data) if first & 0x0F == 1 else None
+
+    def handle(self):
+        stub = self.server.stub
+        self.handshake()
+        self.send([{"T": "success", "msg": "connected"}])
+        auth = self.recv()
+        if auth.get("key") != stub.key:
+            self.send([{"T": "error", "code": 402, "msg": "auth failed"}])
+            return
+        self.send([{"T": "success", "msg": "authenticated"}])
+        stub.subscriptions.append(self.recv())
+        for batch in stub.script:
+            self.send(batch)
+        self.send(struct.pack("!H", 1000), opcode=8)
+
+
+class StubAlpacaStream(_Server):
+    """
+    Speaks enough of the Alpaca v2 market data protocol: connected / auth /
+    subscribe, then sends each list of messages in script and closes.
+    """
+    handler = _WebsocketHandler
+
+    def __init__(self, script, key="key"):
+        self.script = script
+        self.key = key
+        self.subscriptions = []
+
+    @property
+    def url(self) -> str:
+        return f"ws://127.0.0.1:{self.port}"
+
+
+class _BrokerHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        return
+
+    def _reply(self, code: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        stub = self.server.stub
+        order = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with stub.lock:
+            stub.submitting += 1
+            stub.max_concurrent = max(stub.max_concurrent, stub.submitting)
+        time.sleep(stub.latency)
+        with stub.lock:
+            stub.submitting -= 1
+            if order["symbol"] in stub.reject:
+                return self._reply(422, {"code": 40310000, "message": "rejected"})
+            order_id = str(len(stub.orders) + 1)
+            stub.orders[order_id] = dict(order, polls=0)
+        self._reply(200, {"id": order_id, "status": "new"})
+
+    def do_GET(self):
+        stub = self.server.stub
+        order_id = self.path.rsplit("/", 1)[-1]
+        with stub.lock:
+            order = stub.orders.get(order_id)
+            if order is None:
+                return self._reply(404, {"message": "order not found"})
+            order["polls"] += 1
+            filled = order["polls"] >= stub.fill_after
+        self._reply(200, {
+            "id": order_id,
+            "status": "filled" if filled else "new",
+            "filled_qty": str(order["qty"]) if filled else "0",
+            "filled_avg_price": str(stub.prices[order["symbol"]]) if filled else None,
+        })
+
+
+class MockBrokerServer(_Server):
+    """
+    Alpaca style REST orders endpoint: POST /v2/orders and GET /v2/orders/{id}.
+    An order fills at prices[symbol] on its fill_after-th status poll; symbols
+    in reject get a 422. Each submission takes `latency` seconds.
+    """
+    server_cls = ThreadingHTTPServer
+    handler = _BrokerHandler
+
+    def __init__(self, prices: dict, fill_after: int = 2, reject=(), latency: float = 0.05):
+        self.prices = prices
+        self.fill_after = fill_after
+        self.reject = set(reject)
+        self.latency = latency
+        self.orders = {}
+        self.lock = threading.Lock()
+        self.submitting = 0
+        self.max_concurrent = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v2"
+
+
+class _TWSHandler(socketserver.BaseRequestHandler):
+    def read_msg(self) -> list:
+        size = struct.unpack("!I", _recv_exact(self.request, 4))[0]
+        return _recv_exact(self.request, size).decode().split("\0")[:-1]
+
+    def send(self, *fields):
+        text = "".join(f"{field}\0" for field in fields).encode()
+        self.request.sendall(struct.pack("!I", len(text)) + text)
+
+    def order_status(self, order_id, status, filled, remaining, price):
+        ## ORDER_STATUS without the version field (server version >= 131)
+        self.send(3, order_id, status, filled, remaining, price, 0, 0, price, 0, "", 0.0)
+
+    def handle(self):
+        stub = self.server.stub
+        _recv_exact(self.request, 4)  # "API\0"
+        self.read_msg()  # supported client versions
+        self.send(stub.server_version, "20240102 10:00:00 EST")
+        self.read_msg()  # startApi
+        self.send(9, 1, stub.next_order_id)  # NEXT_VALID_ID
+        while True:
+            try:
+                fields = self.read_msg()
+            except ConnectionError:
+                return
+            with stub.lock:
+                stub.received.append((time.monotonic(), fields[0]))
+            if fields[0] != "3":  # PLACE_ORDER
+                continue
+            order_id, symbol = int(fields[1]), fields[3]
+            action = next(i for i in range(4, len(fields)) if fields[i] in ("BUY", "SELL"))
+            quantity = float(fields[action + 1])
+            with stub.lock:
+                stub.orders[order_id] = (symbol, fields[action], quantity)
+            if symbol in stub.reject:
+                self.send(4, 2, order_id, 201, "Order rejected")  # ERR_MSG
+            elif symbol in stub.cancel:
+                filled = stub.cancel[symbol]
+                self.order_status(order_id, "Cancelled", filled, quantity - filled, stub.prices.get(symbol, 0.0))
+            elif symbol in stub.prices:
+                self.order_status(order_id, "Submitted", 0, quantity, 0.0)
+                ## TWS repeats the final status, it must only fill once
+                for _ in range(2):
+                    self.order_status(order_id, "Filled", quantity, 0, stub.prices[symbol])
+
+
+class FakeTWS(_Server):
+    """
+    Answers the TWS API handshake (server version, nextValidId) and placed
+    orders: symbols in prices fill there, in reject get error 201, in cancel
+    are cancelled after filling cancel[symbol]; others get no answer.
+    received has (time, message id) of every message after the handshake.
+    """
+    handler = _TWSHandler
+
+    def __init__(self, prices: dict, reject=(), cancel: dict = None, next_order_id: int = 100,
+                 server_version: int = 151):
+        self.prices = prices
+        self.reject = set(reject)
+        self.cancel = cancel if cancel is not None else {}
+        self.next_order_id = next_order_id
+        self.server_version = server_version
+        self.orders = {}
+        self.received = []
+        self.lock = threading.Lock()
@@ -0,0 +1,97 @@
+import os
+from functools import partial
+
+from backtest.utilities.cache import Fingerprint, RunCache
+from backtest.utilities.utils import _backtest_loop
+from tests.conftest import build_engine, random_signals
+
+COMPONENTS = ("bars", "event_queue", "order_queue", "strategy", "port", "broker")
+
+
+def _run(engine, cache):
+    _backtest_loop(*(engine[k] for k in COMPONENTS), plot=False, cache=cache)
+    return engine
+
+
+def _key(cache, engine):
+    """ key of a run that hasn't started """
+    return cache.key(engine["bars"], engine["strategy"], engine["port"], engine["broker"])
+
+
+def _cached_key(cache, engine):
+    key = _key(cache, engine)
+    _run(engine, cache)
+    return key
+
+
+def test_hit_restores_the_finished_run(shared_store, tmp_path):
+    cache = RunCache(str(tmp_path / "cache"))
+    build = partial(build_engine, shared_store, random_signals)
+    first = _run(build(), cache)
+    assert len(os.listdir(cache.path)) == 1
+
+    second = build()
+    key = _key(cache, second)
+    assert key == _key(cache, build())
+    _run(second, cache)
+    ## loaded, not run: the data handler never moved
+    assert first["bars"].position() > 0 and second["bars"].position() == -1
+    assert second["port"].equity_curve.equals(first["port"].equity_curve)
+    assert second["port"].journal.to_frame().equals(first["port"].journal.to_frame())
+    assert second["port"].current_holdings is second["port"].portfolio_strategy.current_holdings
+
+
+def test_misses_on_other_config_or_data(shared_store, tmp_path):
+    cache = RunCache(str(tmp_path / "cache"))
+    key = _cached_key(cache, build_engine(shared_store, random_signals))
+    assert _key(cache, build_engine(shared_store, random_signals)) == key
+    assert _key(cache, build_engine(shared_store, random_signals, perc=0.3)) != key
+    assert _key(cache, build_engine(shared_store, partial(random_signals, seed=1))) != key
+    assert _key(cache, build_engine(shared_store, random_signals, start_date="2021-02-01")) != key
+    other = build_engine(shared_store, random_signals, perc=0.3)
+    assert not cache.load(_key(cache, other), *(other[k] for k in ("bars", "strategy", "port", "broker")))
+
+
+def test_least_recently_used_entries_are_evicted(shared_store, tmp_path):
+    cache = RunCache(str(tmp_path / "cache"))
+    keys = [_cached_key(cache, build_engine(shared_store, partial(random_signals, seed=seed)))
+            for seed in range(3)]
+    sizes = dict((name, os.path.getsize(os.path.join(cache.path, name))) for name in os.listdir(cache.path))
+    ## using the oldest entry makes the second one the least recently used
+    engine = build_engine(shared_store, random_signals)
+    assert cache.load(keys[0], *(engine[k] for k in ("bars", "strategy", "port", "broker")))
+    cache.max_bytes = sum(sizes.values()) - 1
+    cache.evict()
+    assert sorted(os.listdir(cache.path)) == sorted(f"{key}.pkl.z" for key in (keys[0], keys[2]))
+
+
+def _digest(value) -> str:
+    fp = Fingerprint()
+    fp.update(value)
+    return fp.hexdigest()
+
+
+def _weight(scores, power):
+    return scores ** power
+
+
+def test_callables_are_told_apart_by_behavior():
+    assert _digest(partial(_weight, power=1)) == _digest(partial(_weight, power=1))
+    assert _digest(partial(_weight, power=1)) != _digest(partial(_weight, power=2))
+    first, second = (lambda s: s), (lambda s: s * 2)
+    assert _digest(first) != _digest(second)
+
+    power = 1
+
+    def closure(scores):
+        return scores ** power
+    before = _digest(closure)
+    power = 2
+    assert _digest(closure) != before
+
+    ## no source file to hash, as in a notebook
+    namespace = {}
+    exec("def weighting(scores):\n    return scores", namespace)
+    before = _digest(namespace["weighting"])
+    exec("def weighting(scores):\n    return -scores", namespace)
+    assert _digest(namespace["weighting"]) != before
@@ -0,0 +1,82 @@
+from functools import partial
+
+import pytest
+from trading_common.utilities.enum import OrderType
+
+from backtest.utilities.checkpoint import Checkpointer
+from backtest.utilities.utils import _backtest_loop, _run_bars
+from tests.conftest import build_engine, random_signals
+
+COMPONENTS = ("bars", "event_queue", "order_queue", "strategy", "port", "broker")
+
+
+def _run(engine, **kwargs):
+    return _run_bars(*(engine[k] for k in COMPONENTS), **kwargs)
+
+
+def test_restore_resumes_the_run(shared_store, tmp_path):
+    build = partial(build_engine, shared_store, partial(random_signals, seed=1),
+                    order_type=OrderType.LIMIT, expires=3)
+    full = build()
+    _run(full)
+    full["port"].create_equity_curve_df()
+    assert len(full["port"].journal) > 0
+
+    ## stopped after 25 bars, the last snapshot is from bar 20
+    checkpoint = Checkpointer(str(tmp_path / "run.ckpt"), every_n_bars=10)
+    interrupted = build()
+    assert not checkpoint.begin(interrupted["bars"], interrupted["strategy"], interrupted["port"])
+    _run(interrupted, max_bars=25, checkpoint=checkpoint)
+    assert checkpoint.exists()
+
+    resumed = build()
+    checkpoint = Checkpointer(checkpoint.path, every_n_bars=10)
+    assert checkpoint.begin(resumed["bars"], resumed["strategy"], resumed["port"])
+    bars_seen = checkpoint.restore(resumed["bars"], resumed["event_queue"], resumed["order_queue"],
+                                   resumed["strategy"], resumed["port"])
+    assert bars_seen == 20
+    ## limit orders waiting in the order queue at the snapshot are put back
+    assert not resumed["order_queue"].empty()
+    assert resumed["port"].current_holdings is resumed["port"].portfolio_strategy.current_holdings
+    _run(resumed, bars_seen=bars_seen)
+    resumed["port"].create_equity_curve_df()
+
+    assert full["port"].equity_curve.equals(resumed["port"].equity_curve)
+    assert full["port"].journal.to_frame().equals(resumed["port"].journal.to_frame())
+
+
+def test_restore_rejects_other_components(shared_store, tmp_path):
+    checkpoint = Checkpointer(str(tmp_path / "run.ckpt"))
+    engine = build_engine(shared_store, random_signals)
+    checkpoint.begin(engine["bars"], engine["strategy"], engine["port"])
+    checkpoint.save(0, engine["bars"], engine["order_queue"], engine["strategy"], engine["port"])
+    other = build_engine(shared_store, random_signals)
+    other["strategy"].extra = type("Component", (), {})()
+    other["strategy"].extra.bars = other["bars"]
+    with pytest.raises(Exception, match="does not match"):
+        checkpoint.restore(other["bars"], other["event_queue"], other["order_queue"],
+                           other["strategy"], other["port"])
+
+
+def test_other_parameters_start_over(shared_store, tmp_path):
+    path = str(tmp_path / "run.ckpt")
+    engine = build_engine(shared_store, random_signals)
+    checkpoint = Checkpointer(path, every_n_bars=10)
+    checkpoint.begin(engine["bars"], engine["strategy"], engine["port"])
+    _run(engine, max_bars=25, checkpoint=checkpoint)
+
+    other = build_engine(shared_store, random_signals, perc=0.3, expires=3)
+    checkpoint = Checkpointer(path, every_n_bars=10)
+    assert not checkpoint.begin(other["bars"], other["strategy"], other["port"])
+    with pytest.raises(Exception, match="another configuration"):
+        checkpoint.restore(other["bars"], other["event_queue"], other["order_queue"],
+                           other["strategy"], other["port"])
+
+    ## run from the start with its own parameters, then the snapshot is gone
+    fresh = build_engine(shared_store, random_signals, perc=0.3, expires=3)
+    _run(fresh)
+    fresh["port"].create_equity_curve_df()
+    _backtest_loop(*(other[k] for k in COMPONENTS), checkpoint=checkpoint, plot=False)
+    assert other["port"].perc == 0.3 and other["port"].expires == 3
+    assert other["port"].equity_curve.equals(fresh["port"].equity_curve)
+    assert not checkpoint.exists()
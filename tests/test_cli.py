@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest.cli import build_run
+from backtest.config import validate
+from backtest.data.shared import SharedDataHandler
+from backtest.utilities.utils import _backtest_loop
+
+
+def _spec(csv_dir, symbols, **data):
+    return validate({
+        "name": "cli", "universe": {"symbols": symbols}, "dates": {"start": "2021-01-04"},
+        "data": dict({"source": "csv", "csv_dir": csv_dir}, **data),
+        "strategy": {"class": "BuyAndHoldStrategy"},
+        "portfolio": {"class": "PercentagePortFolio", "kwargs": {"percentage": 0.1, "mode": "asset",
+                      "order_type": {"ref": "trading_common.utilities.enum.OrderType.MARKET"}}},
+    })
+
+
+def test_fill_policy_of_a_single_run_is_applied(universe):
+    csv_dir, symbols = universe
+    run = build_run(_spec(csv_dir, symbols, fill="none"))
+    with run["resources"]:
+        bars = run["bars"]
+        assert isinstance(bars, SharedDataHandler)
+        ## S4 has no bar on day 20, and with fill none no price either
+        for _ in range(21):
+            bars.update_bars()
+        assert np.isnan(bars.latest_field("close")[symbols.index("S4")])
+        store = bars.store
+    assert store.timestamps is None
+
+    run = build_run(_spec(csv_dir, symbols, fill="ffill"))
+    with run["resources"]:
+        for _ in range(21):
+            run["bars"].update_bars()
+        assert not np.isnan(run["bars"].latest_field("close")).any()
+
+
+def test_fill_policy_needs_plain_csv_options(universe):
+    csv_dir, symbols = universe
+    with pytest.raises(Exception, match="data.fill"):
+        build_run(_spec(csv_dir, symbols, fill="none", end_date="2021-02-01"))
+
+
+def test_gaps_are_marked_at_the_last_price(universe):
+    csv_dir, symbols = universe
+    run = build_run(_spec(csv_dir, symbols, fill="none"))
+    with run["resources"]:
+        _backtest_loop(*(run[k] for k in ("bars", "event_queue", "order_queue", "strategy", "port", "broker")),
+                       plot=False)
+        close = run["bars"].arrays()["close"][:, symbols.index("S4")]
+    holdings = pd.DataFrame(run["port"].all_holdings[1:])
+    quantity = run["port"].current_holdings["S4"]["quantity"]
+    assert quantity > 0 and np.isnan(close[[20, 21, 35]]).all()
+    ## bought on day 1, held through the days without a bar at the close before them
+    assert np.allclose(holdings["S4"].iloc[[20, 21, 35]], quantity * close[[19, 19, 34]])
+    assert np.allclose(holdings["S4"].iloc[2:], quantity * pd.Series(close).ffill().iloc[2:])
+
+
+def test_runs_of_one_index_spec_share_a_config_hash(universe, tmp_path):
+    from backtest.cli import _prepare
+    from backtest.data.universe import UniverseIndex
+
+    csv_dir, symbols = universe
+    index = str(tmp_path / "index.csv")
+    UniverseIndex.from_csv_dir(csv_dir, symbols).to_csv(index)
+
+    def spec(start, end, **options):
+        return dict({"name": f"{start}-{end}", "universe": {"index": index},
+                     "dates": {"start": start, "end": end}, "data": {"source": "csv", "csv_dir": csv_dir},
+                     "strategy": {"class": "BuyAndHoldStrategy"}, "portfolio": {"class": "PercentagePortFolio"},
+                     "results": {"dir": str(tmp_path / "results")}}, **options)
+
+    ## S3 only lists on day 10, so the two periods resolve to different symbols
+    first, second = _prepare([spec("2021-01-04", "2021-01-08"),
+                              spec("2021-02-01", "2021-03-01", cache={"path": str(tmp_path / "cache")},
+                                   signals={"record": str(tmp_path / "signals.parquet")})])
+    assert first["universe"]["symbols"] != second["universe"]["symbols"]
+    assert first["results"]["config_hash"] == second["results"]["config_hash"]
@@ -0,0 +1,106 @@
+import os
+import queue
+
+import numpy as np
+import pytest
+
+from backtest.data.compact import CompactBarStore, CompactDataHandler
+from backtest.data.shared import SharedBarStore, SharedDataHandler
+from backtest.data.store import BAR_FIELDS
+
+
+@pytest.mark.parametrize("fill", ["ffill", "none"])
+def test_compact_handler_replays_like_the_shared_one(universe, fill):
+    csv_dir, symbols = universe
+    with SharedBarStore.from_csv(csv_dir, symbols, fill=fill) as shared, \
+            CompactBarStore.from_csv(csv_dir, symbols, fill=fill, price_dtype=np.float64,
+                                     memory_budget=0) as compact:
+        ## every symbol is spilled and read back through memory maps
+        assert compact.memory_report()["spilled"].all()
+        a = SharedDataHandler(queue.Queue(), shared, start_date="2021-01-11")
+        b = CompactDataHandler(queue.Queue(), compact, start_date="2021-01-11")
+        for name, arr in a.arrays().items():
+            assert np.array_equal(arr, b.arrays()[name], equal_nan=True), name
+        while a.continue_backtest:
+            a.update_bars()
+            b.update_bars()
+            if not a.continue_backtest:
+                break
+            assert a.latest_datetime() == b.latest_datetime()
+            for field in BAR_FIELDS:
+                assert np.array_equal(a.latest_field(field), b.latest_field(field), equal_nan=True), field
+            assert np.array_equal(a.bar_mask(), b.bar_mask())
+            assert np.array_equal(a.valid_mask(), b.valid_mask())
+            for field in ("close", "volume"):
+                assert np.array_equal(a.latest_window(7, field), b.latest_window(7, field), equal_nan=True)
+            for symbol in symbols:
+                bars_a, bars_b = a.get_latest_bars(symbol, 3), b.get_latest_bars(symbol, 3)
+                assert all(np.array_equal(bars_a[k], bars_b[k], equal_nan=True) for k in bars_a)
+
+
+def test_cross_sections_read_the_close_column(universe):
+    csv_dir, symbols = universe
+    with CompactBarStore.from_csv(csv_dir, symbols) as store:
+        bars = CompactDataHandler(queue.Queue(), store)
+        for _ in range(21):
+            bars.update_bars()
+        expected = np.array([store.field(s, 20, 21, "close")[0] for s in symbols])
+
+        def per_symbol(*args):
+            raise AssertionError("read per symbol")
+        store.field = store.is_real = per_symbol
+        assert np.array_equal(bars.latest_field("close"), expected, equal_nan=True)
+        assert bars.bar_mask().tolist() == [True] * 4 + [False]  # S4 has no bar on day 20
+        assert bars.latest_window(3).shape == (len(symbols), 3)
+
+
+def test_spill_dir_is_removed_when_the_run_ends(universe):
+    from backtest.cli import build_run
+    from backtest.config import validate
+
+    csv_dir, symbols = universe
+    spec = validate({
+        "universe": {"symbols": symbols}, "dates": {"start": "2021-01-04"},
+        "data": {"source": "compact", "csv_dir": csv_dir, "memory_budget": 0},
+        "strategy": {"class": "BuyAndHoldStrategy"}, "portfolio": {"class": "PercentagePortFolio",
+                                                                   "kwargs": {"percentage": 0.1}},
+    })
+    run = build_run(spec)
+    spill_dir = run["bars"].store.spill_dir
+    assert os.path.isdir(spill_dir)
+    run["resources"].close()
+    assert not os.path.exists(spill_dir)
+
+
+def test_columns_count_against_the_budget(universe):
+    csv_dir, symbols = universe
+    with CompactBarStore.from_csv(csv_dir, symbols) as store:
+        bars_bytes = store.resident_bytes()
+        close, real = store.columns()
+        columns_bytes = close.nbytes + real.nbytes
+        assert store.resident_bytes() == bars_bytes + columns_bytes
+        assert store.memory_report()["column_bytes"].sum() == columns_bytes
+
+        ## room for the columns and two symbols: the three least recently used are spilled
+        symbol_bytes = store.memory_report()["price_bytes"] + store.memory_report()["volume_bytes"] \
+            + store.memory_report()["mask_bytes"]
+        store.set_memory_budget(columns_bytes + symbol_bytes[symbols[-2:]].sum())
+        assert store.memory_report()["spilled"].tolist() == [True] * 3 + [False] * 2
+        assert not store.columns_spilled
+        ## then the columns too
+        store.set_memory_budget(0)
+        assert store.columns_spilled and store.memory_report()["spilled"].all()
+        assert isinstance(store.columns()[0], np.memmap)
+        assert store.resident_bytes() == 0
+        spill_files = sorted(os.listdir(store.spill_dir))
+
+        ## a bigger budget loads them back, and spill files aren't written again
+        store.set_memory_budget(columns_bytes + symbol_bytes[symbols[0]])
+        assert not store.columns_spilled and not isinstance(store.columns()[0], np.memmap)
+        assert store.memory_report()["spilled"].tolist() == [True] * 4 + [False]
+        ## reading a symbol brings it back once it fits
+        store.set_memory_budget(None)
+        store.rows(symbols[0], 0, 5)
+        assert not store.memory_report().loc[symbols[0], "spilled"]
+        assert sorted(os.listdir(store.spill_dir)) == spill_files
+        assert store.resident_bytes() == bars_bytes + columns_bytes
@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+from backtest.config import build_value, load_spec, validate
+
+
+class Leaf(object):
+    def __init__(self, bars, events, period, scale=1.0):
+        self.bars, self.events, self.period, self.scale = bars, events, period, scale
+
+
+class Composite(object):
+    def __init__(self, strategies):
+        self.strategies = strategies
+
+
+class MultipleAllStrategy(Composite):
+    pass
+
+
+def _leaf(period):
+    return {"class": "tests.test_config.Leaf", "args": [period]}
+
+
+def test_prefix_args_go_to_injected_components_only():
+    spec = {"class": "tests.test_config.Composite", "inject": False, "args": [[_leaf(10), _leaf(20)]]}
+    strategy = build_value(spec, ("bars", "events"))
+    assert [(s.bars, s.events, s.period) for s in strategy.strategies] == [("bars", "events", 10),
+                                                                           ("bars", "events", 20)]
+    leaf = build_value(dict(_leaf(5), kwargs={"scale": 2.0}), ("bars", "events"))
+    assert (leaf.bars, leaf.period, leaf.scale) == ("bars", 5, 2.0)
+
+
+def test_composites_default_to_no_prefix():
+    strategy = build_value({"class": "tests.test_config.MultipleAllStrategy", "args": [[_leaf(10)]]},
+                           ("bars", "events"))
+    assert strategy.strategies[0].bars == "bars"
+    with pytest.raises(TypeError):
+        build_value({"class": "tests.test_config.MultipleAllStrategy", "inject": True, "args": [[]]},
+                    ("bars", "events"))
+
+
+def test_validate_checks_inject():
+    spec = {"universe": {"symbols": ["A"]}, "dates": {"start": "2021-01-04"},
+            "strategy": dict(_leaf(10), inject="no"), "portfolio": {"class": "tests.test_config.Leaf"}}
+    with pytest.raises(Exception, match="strategy.inject"):
+        validate(spec)
+
+
+def test_loop_spec_builds_the_composite_without_prefix():
+    spec = load_spec(os.path.join(os.path.dirname(__file__), "..", "configs", "loop.yaml"))
+    assert spec["strategy"]["inject"] is False
+    assert all("inject" not in s for s in spec["strategy"]["args"][0])
+
+
+def test_validate_checks_checkpoint():
+    spec = {"universe": {"symbols": ["A"]}, "dates": {"start": "2021-01-04"},
+            "strategy": _leaf(10), "portfolio": {"class": "tests.test_config.Leaf"}}
+    assert validate(dict(spec, checkpoint={"path": "run.ckpt", "every_n_bars": 10}))["checkpoint"]["path"] == "run.ckpt"
+    for checkpoint, match in [({"every_n_bars": 10}, "needs a 'path'"),
+                              ({"path": "run.ckpt", "every": 10}, "unknown keys"),
+                              ({"path": "run.ckpt", "every_n_bars": 0}, "every_n_bars"),
+                              ({"path": "run.ckpt", "every_seconds": "1h"}, "every_seconds")]:
+        with pytest.raises(Exception, match=match):
+            validate(dict(spec, checkpoint=checkpoint))
@@ -0,0 +1,136 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest.strategy.dataset import DATASET_FILES, DatasetWriter, PooledDataset, build_dataset, csv_frames
+
+
+def _file_rows(path, n_columns: int = 2) -> dict:
+    """ rows each dataset file has room for """
+    return dict((name, os.path.getsize(os.path.join(path, fname))
+                 // (np.dtype(dtype).itemsize * (n_columns if name == "X" else 1)))
+                for name, (fname, dtype) in DATASET_FILES.items())
+
+
+def test_writer_grows_by_doubling_and_cuts_to_size(tmp_path):
+    path = str(tmp_path / "ds")
+    writer = DatasetWriter(path, ["a", "b"], capacity=4)
+    chunks = [("S0", 3), ("S1", 0), ("S1", 5), ("S0", 10)]
+    capacities = []
+    start = 0
+    for symbol, n in chunks:
+        rows = np.arange(start, start + n)
+        writer.append(symbol, np.c_[rows, -rows], rows, rows * 10)
+        start += n
+        capacities.append(writer.capacity)
+    ## 3 rows fit, 8 need double the room, 18 more than double
+    assert capacities == [4, 4, 8, 18]
+    assert set(_file_rows(path).values()) == {18}
+
+    dataset = writer.close()
+    assert set(_file_rows(path).values()) == {18}
+    assert len(dataset) == 18 and dataset.symbols == ["S0", "S1"]
+    X, y = dataset.load()
+    assert np.array_equal(y, np.arange(18)) and np.array_equal(X, np.c_[np.arange(18), -np.arange(18)])
+    assert np.array_equal(dataset.symbol, np.r_[[0] * 3, [1] * 5, [0] * 10])
+    assert np.array_equal(dataset.date, np.arange(18) * 10)
+
+    ## cut down when fewer rows were written than allocated
+    path = str(tmp_path / "small")
+    writer = DatasetWriter(path, ["a", "b"], capacity=100)
+    writer.append("S0", np.ones((7, 2)), np.ones(7), np.arange(7))
+    assert set(_file_rows(path).values()) == {100}
+    assert len(writer.close()) == 7
+    assert set(_file_rows(path).values()) == {7}
+    assert len(PooledDataset(path).load()[1]) == 7
+
+    ## and an empty dataset still opens
+    empty = DatasetWriter(str(tmp_path / "empty"), ["a", "b"]).close()
+    assert len(empty) == 0 and empty.load()[0].shape == (0, 2)
+
+
+class _Lags(object):
+    """ process_data like BaseStatisticalData's: lagged closes and a forward return target, in place """
+
+    def __init__(self, lag: int = 3, shift: int = 2):
+        self.lag = lag
+        self.shift = shift
+
+    def process_data(self, df):
+        for i in range(1, self.lag + 1):
+            df.loc[:, f"lag_{i}"] = df["close"].shift(i)
+        df.loc[:, "target"] = df["close"].shift(-self.shift) / df["close"] - 1
+        df.drop(["open", "high", "low"], axis=1, inplace=True)
+        df = df.dropna()
+        return df.drop("target", axis=1), df["target"]
+
+
+def _statistical_data(lag, shift):
+    pytest.importorskip("talib")
+    from backtest.strategy.stat_data import BaseStatisticalData
+
+    return BaseStatisticalData(None, shift, lag)
+
+
+@pytest.mark.parametrize("processor", [_Lags, _statistical_data])
+def test_build_dataset_matches_process_data(universe, tmp_path, processor):
+    csv_dir, symbols = universe
+    dataset = build_dataset(processor(3, 2), csv_frames(csv_dir, symbols), str(tmp_path / "ds"), capacity=16)
+    assert dataset.symbols == symbols
+    for symbol, df in csv_frames(csv_dir, symbols):
+        X, y = processor(3, 2).process_data(df)
+        assert dataset.columns == list(X.columns)
+        rows = dataset.index(symbols=[symbol])
+        X_rows, y_rows = dataset.load(rows)
+        assert np.allclose(X_rows, X.to_numpy(dtype=np.float32))
+        assert np.allclose(y_rows, y.to_numpy(dtype=np.float32))
+        assert np.array_equal(dataset.date[rows], pd.DatetimeIndex(X.index).values.astype(np.int64))
+    ## per symbol rows of a date range
+    rows = dataset.index("2021-02-01", "2021-02-05", symbols=["S1"])
+    assert len(rows) == 5 and (dataset.symbol[rows] == 1).all()
+
+
+class _Seen(object):
+    """ estimator recording the rows it was trained on, y holds the row number """
+
+    def __init__(self):
+        self.rows = []
+
+    def partial_fit(self, X, y, **fit_params):
+        assert np.array_equal(X[:, 0], y)
+        self.rows.append(y.astype(np.int64))
+
+
+@pytest.fixture
+def numbered(tmp_path):
+    writer = DatasetWriter(str(tmp_path / "ds"), ["row"], capacity=8)
+    for s in range(3):
+        rows = np.arange(s * 33, (s + 1) * 33)
+        writer.append(f"S{s}", rows[:, None], rows, rows)
+    return writer.close()
+
+
+def test_batches_cover_every_row(numbered):
+    for kwargs in ({}, {"shuffle": True, "seed": 0}, {"idx": np.arange(90, 10, -1)}):
+        batches = list(numbered.batches(batch_size=10, **kwargs))
+        assert all(len(y) <= 10 for _, y in batches)
+        seen = np.concatenate([y for _, y in batches]).astype(np.int64)
+        expected = np.arange(99) if "idx" not in kwargs else np.arange(11, 91)
+        assert np.array_equal(np.sort(seen), expected)
+    ## shuffled batches differ from epoch to epoch
+    first = next(numbered.batches(batch_size=10, shuffle=True, seed=0))[1]
+    assert not np.array_equal(first, next(numbered.batches(batch_size=10, shuffle=True, seed=1))[1])
+
+
+def test_partial_fit_sees_every_row_once_per_epoch(numbered):
+    estimator = numbered.partial_fit(_Seen(), batch_size=16, epochs=2, seed=0)
+    assert len(estimator.rows) == 2 * 7
+    for epoch in (estimator.rows[:7], estimator.rows[7:]):
+        assert np.array_equal(np.sort(np.concatenate(epoch)), np.arange(99))
+    ## only the rows asked for
+    estimator = numbered.partial_fit(_Seen(), batch_size=16, idx=numbered.index(symbols=["S2"]))
+    assert np.array_equal(np.sort(np.concatenate(estimator.rows)), np.arange(66, 99))
+    with pytest.raises(Exception, match="partial_fit"):
+        numbered.partial_fit(object())
@@ -0,0 +1,53 @@
+import socketserver
+import threading
+
+import pytest
+import requests
+
+from backtest.utilities.http_client import HttpClient
+
+
+class _DropHandler(socketserver.BaseRequestHandler):
+    """ reads the request and closes the connection without answering """
+
+    def handle(self):
+        self.request.recv(65536)
+        with self.server.lock:
+            self.server.requests += 1
+
+
+@pytest.fixture
+def dropping_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _DropHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_post_is_not_retried(dropping_server):
+    client = HttpClient(max_retries=2)
+    url = f"http://127.0.0.1:{dropping_server.server_address[1]}/orders"
+    with pytest.raises(requests.ConnectionError):
+        client.post(url, json={"symbol": "AAPL", "qty": 1})
+    assert dropping_server.requests == 1
+    with pytest.raises(requests.ConnectionError):
+        client.get(url)
+    assert dropping_server.requests == 1 + 3
+    assert client.metrics["127.0.0.1:%d/orders" % dropping_server.server_address[1]].errors == 2
+
+
+def test_stats_from_many_threads():
+    client = HttpClient()
+    stats = client.metrics["endpoint"]
+    threads = [threading.Thread(target=lambda: [stats.record(0.001, error=i % 2 == 0) for i in range(1000)])
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    summary = stats.summary()
+    assert (summary["count"], summary["errors"]) == (8000, 4000)
@@ -0,0 +1,83 @@
+import queue
+
+import pandas as pd
+import pytest
+
+from trading_common.event import OrderEvent
+from trading_common.utilities.enum import OrderPosition, OrderType
+from tests.stubs import FakeTWS
+
+pytest.importorskip("ibapi")
+from backtest.brokers.ib_broker import IBBroker  # noqa: E402
+
+
+def _order(symbol, quantity, direction=OrderPosition.BUY):
+    order = OrderEvent(symbol, pd.Timestamp("2024-01-02"), quantity, direction, 1.0)
+    order.order_type = OrderType.MARKET
+    return order
+
+
+@pytest.fixture
+def tws():
+    prices = dict((f"S{i}", 10.0 + i) for i in range(60))
+    with FakeTWS(prices, reject=["BAD"], cancel={"HALF": 5}) as server:
+        yield server
+
+
+def _fills(events) -> dict:
+    fills = {}
+    while not events.empty():
+        fill = events.get()
+        assert fill.order_event.symbol not in fills
+        fills[fill.order_event.symbol] = fill.order_event
+    return fills
+
+
+def test_orders_fill_from_callbacks(tws):
+    events = queue.Queue()
+    broker = IBBroker(events, port=tws.port, client_id=1, timeout=5)
+    try:
+        assert broker.execute_order(_order("S1", 10))
+        assert broker.execute_order(_order("S2", 20, OrderPosition.SELL))
+        assert broker.execute_order(_order("BAD", 10))
+        assert broker.execute_order(_order("HALF", 10))
+        assert broker.wait_for_fills(timeout=5)
+    finally:
+        broker.disconnect()
+
+    assert sorted(tws.orders) == [100, 101, 102, 103]
+    assert tws.orders[101] == ("S2", "SELL", 20)
+    fills = _fills(events)
+    assert sorted(fills) == ["HALF", "S1", "S2"]
+    assert (fills["S1"].quantity, fills["S1"].trade_price) == (10, 11.0)
+    assert (fills["S2"].quantity, fills["S2"].trade_price) == (20, 12.0)
+    assert fills["HALF"].quantity == 5
+    assert not broker._pending
+
+
+def test_error_with_error_time(tws):
+    """ newer ibapi releases pass errorTime before errorCode """
+    events = queue.Queue()
+    broker = IBBroker(events, port=tws.port, client_id=1, timeout=5)
+    try:
+        broker.execute_order(_order("SILENT", 10))
+        assert not broker.wait_for_fills(timeout=0.2)
+        broker.error(100, 1704186000000, 202, "Order Canceled", "")
+        assert broker.wait_for_fills(timeout=1)
+    finally:
+        broker.disconnect()
+    assert events.empty()
+
+
+def test_throttle_stays_under_tws_limit(tws):
+    events = queue.Queue()
+    broker = IBBroker(events, port=tws.port, client_id=1, timeout=5)
+    try:
+        for i in range(60):
+            broker.execute_order(_order(f"S{i}", 1))
+        assert broker.wait_for_fills(timeout=10)
+    finally:
+        broker.disconnect()
+    assert len(_fills(events)) == 60
+    times = sorted(t for t, _ in tws.received)
+    assert max(sum(1 for u in times[i:] if u - t < 1.0) for i, t in enumerate(times)) <= 50
@@ -0,0 +1,76 @@
+import pandas as pd
+import pytest
+from trading_common.event import FillEvent, OrderEvent
+from trading_common.utilities.enum import OrderPosition, OrderType
+
+from backtest.utilities.journal import TradeJournal
+
+
+def _record(journal, symbol, day, quantity, price, commission=0.0, signal_day=None):
+    order = OrderEvent(symbol, pd.Timestamp(f"2021-01-{day:02d}"), abs(quantity),
+                       OrderPosition.BUY if quantity > 0 else OrderPosition.SELL)
+    order.trade_price = price
+    order.order_type = OrderType.MARKET
+    if signal_day is not None:
+        order.signal_datetime = pd.Timestamp(f"2021-01-{signal_day:02d}")
+    journal.record(FillEvent(order, commission))
+
+
+def test_round_trips_per_symbol():
+    journal = TradeJournal(["A", "B"])
+    _record(journal, "A", 4, 10, 100.0, commission=1.0)
+    _record(journal, "B", 4, -5, 50.0)
+    _record(journal, "A", 5, 10, 110.0)
+    _record(journal, "A", 6, -20, 120.0, commission=1.0)
+    _record(journal, "B", 7, 5, 40.0)
+    _record(journal, "A", 8, 3, 100.0)  # still open
+
+    trades = journal.round_trips()
+    assert list(trades["symbol"]) == ["A", "B"]
+    a, b = trades.iloc[0], trades.iloc[1]
+    assert a["direction"] == 1 and a["entry_price"] == 105.0
+    assert a["pnl"] == pytest.approx(20 * 120 - 10 * 100 - 10 * 110 - 2)
+    assert a["holding_period"] == pd.Timedelta(days=2)
+    assert b["direction"] == -1 and b["pnl"] == pytest.approx(50.0)
+    assert b["return"] == pytest.approx(50.0 / 250.0)
+
+
+def test_reversal_closes_and_opens_a_trade():
+    journal = TradeJournal(["A"])
+    _record(journal, "A", 4, 10, 100.0)
+    _record(journal, "A", 5, -15, 110.0, commission=3.0)
+    _record(journal, "A", 6, 5, 90.0)
+
+    trades = journal.round_trips()
+    assert list(trades["direction"]) == [1, -1]
+    ## the commission is split 10:5 between the closing and the opening part
+    assert trades["pnl"].tolist() == pytest.approx([100.0 - 2.0, 100.0 - 1.0])
+    assert trades["entry_price"].tolist() == [100.0, 110.0]
+    assert list(trades["entry"].dt.day) == [4, 5]
+    assert list(trades["exit"].dt.day) == [5, 6]
+
+
+def test_latency_from_signal_to_fill():
+    journal = TradeJournal(["A"])
+    _record(journal, "A", 4, 10, 100.0, signal_day=1)
+    order = OrderEvent("A", pd.Timestamp("2021-01-05"), 10, OrderPosition.SELL)
+    order.trade_price, order.order_type = 100.0, OrderType.LIMIT
+    order.signal_datetime = pd.Timestamp("2021-01-04")
+    ## a limit order's date moves on when it is queued, the fill time is what counts
+    journal.record(FillEvent(order, 0.0), pd.Timestamp("2021-01-07"))
+
+    df = journal.to_frame()
+    assert list(df["latency"]) == [pd.Timedelta(days=3), pd.Timedelta(days=3)]
+    assert df["timestamp"].iloc[1] == pd.Timestamp("2021-01-07")
+
+
+def test_excursions_from_closes():
+    journal = TradeJournal(["A"])
+    _record(journal, "A", 4, 10, 100.0)
+    _record(journal, "A", 6, -10, 104.0)
+    closes = pd.DataFrame({"A": [100.0, 95.0, 104.0, 120.0]},
+                          index=pd.to_datetime(["2021-01-04", "2021-01-05", "2021-01-06", "2021-01-07"]))
+    trades = journal.round_trips(closes)
+    assert trades["mae"].iloc[0] == pytest.approx(-0.05)
+    assert trades["mfe"].iloc[0] == pytest.approx(0.04)
+    assert TradeJournal(["A"]).trade_stats() == {"trades": 0}
@@ -0,0 +1,55 @@
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pytest
+from trading_common.utilities.enum import OrderType
+
+from backtest import kernel
+from backtest.portfolio.strategy import DefaultOrder, LongOnly, ProgressiveOrder
+from backtest.utilities.utils import _backtest_loop
+from tests.conftest import build_engine, random_signals
+
+CONFIGS = {
+    "limit": dict(portfolio_strategy=LongOnly, order_type=OrderType.LIMIT, expires=3),
+    "limit_cash": dict(portfolio_strategy=DefaultOrder, order_type=OrderType.LIMIT, expires=5,
+                       mode="cash", perc=0.5),
+    "market_cash_constrained": dict(portfolio_strategy=ProgressiveOrder, order_type=OrderType.MARKET, perc=0.6),
+    "market": dict(portfolio_strategy=DefaultOrder, order_type=OrderType.MARKET),
+}
+
+
+@pytest.mark.parametrize("name", list(CONFIGS))
+@pytest.mark.parametrize("seed", [0, 1])
+def test_kernel_matches_the_event_loop(shared_store, name, seed):
+    build = partial(build_engine, shared_store, partial(random_signals, seed=seed), **CONFIGS[name])
+    loop = build()
+    broker = loop["broker"]
+    checks = []
+    enough_credits = broker._enough_credits
+
+    def _counted(order, snapshot):
+        checks.append(enough_credits(order, snapshot))
+        return checks[-1]
+    broker._enough_credits = _counted
+    _backtest_loop(*(loop[k] for k in ("bars", "event_queue", "order_queue", "strategy", "port", "broker")),
+                   plot=False)
+
+    fast = build()
+    kernel.run_kernel(fast["bars"], fast["port"], fast["strategy"].signals)
+
+    a, b = loop["port"], fast["port"]
+    assert len(a.journal) > 0
+    ## totals are summed in a different order, the rest is exact
+    pd.testing.assert_frame_equal(a.equity_curve, b.equity_curve, check_exact=False, rtol=1e-12)
+    assert a.journal.to_frame().equals(b.journal.to_frame())
+    assert a.journal.round_trips().equals(b.journal.round_trips())
+    assert a.current_holdings["cash"] == b.current_holdings["cash"]
+    assert np.array_equal(a.ledger.quantity, b.ledger.quantity)
+
+    trades = a.journal.to_frame()
+    if CONFIGS[name]["order_type"] == OrderType.LIMIT:
+        ## limit orders are re-queued once and fill a bar after their signal
+        assert (trades["latency"] > np.timedelta64(0)).all()
+    if name == "market_cash_constrained":
+        assert not all(checks)
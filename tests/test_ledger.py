@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from backtest.portfolio.ledger import PositionLedger
+
+
+def test_fifo_lots_and_realized_pnl():
+    ledger = PositionLedger(["A", "B"])
+    assert ledger.on_fill("A", 10, 100.0) == 0.0
+    assert ledger.on_fill("A", 10, 110.0, commission=1.0) == -1.0
+    assert ledger.avg_cost_of(0) == 105.0
+    ## sells close the oldest lot first
+    assert ledger.on_fill("A", -15, 120.0) == pytest.approx(10 * 20 + 5 * 10)
+    assert ledger.quantity[0] == 5 and ledger.avg_cost_of(0) == 110.0
+    assert ledger.realized_pnl[0] == pytest.approx(249.0) and ledger.commission[0] == 1.0
+    assert ledger.avg_cost_of(1) is None
+    assert np.isnan(ledger.avg_cost[1])
+
+
+def test_reversal_opens_a_lot_at_the_fill_price():
+    ledger = PositionLedger(["A"])
+    ledger.on_fill("A", 10, 100.0)
+    assert ledger.on_fill("A", -15, 90.0) == pytest.approx(-100.0)
+    assert ledger.quantity[0] == -5 and ledger.avg_cost_of(0) == 90.0
+    assert ledger.on_fill("A", 5, 80.0) == pytest.approx(50.0)
+    assert ledger.avg_cost_of(0) is None and ledger.cost_basis[0] == 0.0
+    assert len(ledger.lots[0]) == 0
+
+
+def test_unrealized_pnl_skips_missing_prices():
+    ledger = PositionLedger(["A", "B", "C"])
+    ledger.on_fill("A", 10, 100.0)
+    ledger.on_fill("B", -4, 50.0)
+    pnl = ledger.unrealized_pnl(np.array([105.0, np.nan, 1.0]))
+    assert np.allclose(pnl, [50.0, 0.0, 0.0])
+    assert np.allclose(ledger.avg_cost, [100.0, 50.0, np.nan], equal_nan=True)
@@ -0,0 +1,58 @@
+import pytest
+import requests
+
+from backtest.data.metadata import MetadataService
+from backtest.utilities.order_router import RateLimiter
+
+
+class _Response(object):
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.ok = status_code == 200
+        self.body = body
+        self.text = str(body)
+
+    def json(self):
+        return self.body
+
+
+class _FakeFMP(object):
+    """ stands in for the HttpClient: profiles of known symbols, a network error for DOWN """
+
+    def __init__(self, profiles):
+        self.profiles = profiles
+
+    def get(self, url, params=None, name=None):
+        symbol = url.rsplit("/", 1)[-1]
+        if symbol == "DOWN":
+            raise requests.ConnectionError("connection reset")
+        if symbol not in self.profiles:
+            return _Response(404, {"Error Message": "not found"})
+        return _Response(200, [self.profiles[symbol]])
+
+
+@pytest.fixture
+def service(tmp_path):
+    service = MetadataService(str(tmp_path / "metadata.db"), api_key="key", rate_limiter=RateLimiter(1000, 1))
+    service.http = _FakeFMP({
+        "AAPL": {"sector": "Technology", "industry": "Consumer Electronics", "mktCap": 3e12, "country": "US"},
+        "XOM": {"sector": "Energy", "industry": "Oil & Gas", "mktCap": 4e11, "country": "US"},
+    })
+    return service
+
+
+def test_refresh_keeps_profiles_when_some_fail(service):
+    assert service.refresh(["AAPL", "DOWN", "XOM", "NOPE"]) == 2
+    assert sorted(service.failed) == ["DOWN", "NOPE"]
+    assert "connection reset" in service.failed["DOWN"]
+    assert service.sector("AAPL") == "Technology"
+    assert service.market_cap("XOM") == 4e11
+    ## only what failed is fetched again
+    assert service.stale_symbols(["AAPL", "DOWN", "XOM"]) == ["DOWN"]
+    assert service.group_by("sector") == {"Energy": ["XOM"], "Technology": ["AAPL"]}
+
+
+def test_unknown_field_is_rejected(service):
+    service.refresh(["AAPL"])
+    with pytest.raises(Exception, match="Unknown profile field"):
+        service._field("AAPL", "sector FROM profiles; DROP TABLE profiles; --")
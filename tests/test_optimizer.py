@@ -0,0 +1,33 @@
+import numpy as np
+
+from backtest.portfolio.optimizer import EWCovariance, max_sharpe, optimize
+
+
+def test_long_only_never_returns_short_weights():
+    cov = np.array([[0.0453, 0.0316, -0.0412], [0.0316, 0.0439, -0.0625], [-0.0412, -0.0625, 0.3103]])
+    ## the only asset with a positive return is dropped first, then every weight left is negative
+    w = max_sharpe(np.array([-0.0633, -0.0312, 0.0021]), cov)
+    assert (w == 0).all()
+    for method in ("min_variance", "max_sharpe", "mean_variance", "risk_parity"):
+        w = optimize(method, np.array([0.01, -0.02, 0.03]), np.diag([0.04, 0.09, 0.01]) + 0.005)
+        assert (w >= 0).all() and np.isclose(w.sum(), 1), method
+
+
+def test_ew_covariance_keeps_missing_assets():
+    rng = np.random.default_rng(0)
+    full = EWCovariance(3, halflife=10, min_periods=1)
+    gappy = EWCovariance(3, halflife=10, min_periods=1)
+    for _ in range(50):
+        returns = rng.normal(0, 0.01, 3)
+        full.update(returns)
+        gappy.update(returns)
+    before = gappy.cov.copy()
+    returns = rng.normal(0, 0.01, 3)
+    returns[2] = np.nan
+    gappy.update(returns)
+    ## nothing learned about the missing asset, the pair that was observed is updated
+    assert gappy.cov[2, 2] == before[2, 2]
+    assert (gappy.cov[2, :2] == before[2, :2]).all() and (gappy.cov[:2, 2] == before[:2, 2]).all()
+    full.update(np.r_[returns[:2], full.mean[2]])
+    assert np.allclose(gappy.cov[:2, :2], full.cov[:2, :2])
+    assert gappy.count.tolist() == [51, 51, 50]
@@ -0,0 +1,102 @@
+import queue
+import time
+
+import pandas as pd
+
+from trading_common.event import OrderEvent
+from trading_common.utilities.enum import OrderPosition, OrderType
+from backtest.utilities.http_client import HttpClient
+from backtest.utilities.order_router import DEAD, FILLED, OPEN, OrderRouter, RateLimiter
+from tests.stubs import MockBrokerServer
+
+
+def _router(server, events, **kwargs):
+    """ OrderRouter talking to the mock the way AlpacaBroker talks to Alpaca """
+    http = HttpClient()
+
+    def submit(event):
+        res = http.post(f"{server.url}/orders", json={
+            "symbol": event.symbol, "qty": event.quantity,
+            "side": "buy" if event.direction == OrderPosition.BUY else "sell", "type": "market"})
+        if not res.ok:
+            raise Exception(f"{res.status_code}\n{res.text}")
+        return res.json()["id"]
+
+    def poll_status(order_id):
+        order = http.get_json(f"{server.url}/orders/{order_id}")
+        if order["status"] == "filled":
+            return FILLED, float(order["filled_qty"]), float(order["filled_avg_price"])
+        elif order["status"] in ("canceled", "expired", "rejected"):
+            return DEAD, 0, None
+        return OPEN, 0, None
+
+    kwargs.setdefault("poll_interval", 0.02)
+    return OrderRouter(events, submit, poll_status, commission=lambda order: 1.0, **kwargs)
+
+
+def _order(symbol, quantity=10, direction=OrderPosition.BUY):
+    order = OrderEvent(symbol, pd.Timestamp("2024-01-02"), quantity, direction, 1.0)
+    order.order_type = OrderType.MARKET
+    return order
+
+
+def test_fills_carry_the_broker_prices():
+    prices = dict((f"S{i}", 10.0 + i) for i in range(20))
+    events = queue.Queue()
+    with MockBrokerServer(prices, reject=["S3"]) as server:
+        router = _router(server, events, max_workers=8, rate_limiter=RateLimiter(1000, 1))
+        futures = router.route_batch([_order(symbol, i + 1) for i, symbol in enumerate(prices)])
+        assert router.wait(timeout=10)
+        router.close()
+
+    assert futures[3].result() is None
+    assert router.pending() == 0
+    ## orders were submitted concurrently, not one at a time
+    assert server.max_concurrent > 1
+    fills = {}
+    while not events.empty():
+        fill = events.get()
+        fills[fill.order_event.symbol] = fill
+    assert sorted(fills) == sorted(s for s in prices if s != "S3")
+    for i, (symbol, price) in enumerate(prices.items()):
+        if symbol in fills:
+            assert fills[symbol].order_event.trade_price == price
+            assert fills[symbol].order_event.quantity == i + 1
+            assert fills[symbol].commission == 1.0
+
+
+def test_polling_does_not_hold_up_submissions():
+    prices = dict((f"S{i}", 10.0) for i in range(10))
+    events = queue.Queue()
+    with MockBrokerServer(prices, fill_after=1, latency=0.0) as server:
+        ## a poll budget of one request, used up by the first poll
+        router = _router(server, events, rate_limiter=RateLimiter(1000, 1),
+                         poll_limiter=RateLimiter(1, 60, burst=1))
+        router.route(_order("S0"))
+        deadline = time.monotonic() + 5
+        while events.empty() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        start = time.monotonic()
+        router.route_batch([_order(symbol) for symbol in list(prices)[1:]])
+        while len(server.orders) < len(prices) and time.monotonic() - start < 5:
+            time.sleep(0.01)
+        elapsed = time.monotonic() - start
+        submitted = len(server.orders)
+    assert events.get(block=False).order_event.symbol == "S0"
+    assert submitted == len(prices)
+    assert elapsed < 2
+
+
+def test_close_stops_polling():
+    prices = {"S0": 10.0}
+    events = queue.Queue()
+    with MockBrokerServer(prices, fill_after=1000, latency=0.0) as server:
+        ## the poll budget runs out after the first poll, close doesn't wait for the next token
+        router = _router(server, events, rate_limiter=RateLimiter(1000, 1),
+                         poll_limiter=RateLimiter(1, 60, burst=1))
+        router.route(_order("S0")).result()
+        start = time.monotonic()
+        router.close()
+        assert time.monotonic() - start < 2
+    assert not router._poller.is_alive()
+    assert events.empty()
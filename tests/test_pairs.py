@@ -0,0 +1,59 @@
+import queue
+
+import numpy as np
+import pandas as pd
+from trading_common.utilities.enum import OrderPosition
+
+from backtest.data.shared import SharedDataHandler
+from backtest.strategy.pairs import PAIR_COLUMNS, PairScanner, PairsStrategy, scan_pairs
+
+
+def _cointegrated(n_days: int = 120, n_pairs: int = 3, seed: int = 0) -> pd.DataFrame:
+    """ closes of n_pairs random walks, each with a mean reverting partner """
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for k in range(n_pairs):
+        x = np.cumsum(rng.normal(0, 0.02, n_days))
+        spread = np.zeros(n_days)
+        for t in range(1, n_days):
+            spread[t] = 0.7 * spread[t - 1] + rng.normal(0, 0.01)
+        columns[f"X{k}"] = 40 * np.exp(x)
+        columns[f"Y{k}"] = 60 * np.exp(1.3 * x + spread)
+    return pd.DataFrame(columns, index=pd.bdate_range("2021-01-04", periods=n_days))
+
+
+def test_incremental_scanner_matches_scan_pairs():
+    closes = _cointegrated()
+    closes.iloc[30:33, 2] = np.nan
+    scanner = PairScanner(closes.columns, window=40, block=4, recompute_every=1000)
+    for t in range(len(closes)):
+        scanner.update(closes.iloc[t].to_numpy())
+        if scanner.ready and t % 25 == 0:
+            ## the sums are only rolled, never rebuilt, in this loop
+            expected = scan_pairs(closes.iloc[:t + 1], window=40, block=3, max_workers=1)
+            got = scanner.pairs()
+            assert list(got.columns) == PAIR_COLUMNS and len(got) > 0
+            pd.testing.assert_frame_equal(got, expected, rtol=1e-6)
+
+    ## the cointegrated partners come first
+    best = scan_pairs(closes, window=40, max_tstat=-3.5, max_workers=1)
+    assert set(zip(best["y"], best["x"])) <= {("X0", "Y0"), ("X1", "Y1"), ("X2", "Y2")}
+    assert len(best) > 0
+
+
+def test_rescan_doesnt_reuse_exiting_symbols(shared_store):
+    events = queue.LifoQueue()
+    bars = SharedDataHandler(events, shared_store, start_date="2021-01-04")
+    bars.update_bars()
+    strategy = PairsStrategy(bars, events, window=20, max_pairs=2)
+    pair = {"beta": 1.0, "alpha": 0.0, "spread_std": 0.1}
+    strategy.pairs = {("S0", "S1"): dict(pair, position=1)}
+    ## S0 / S1 are no longer cointegrated, S0 / S2 and S3 / S4 now are
+    found = pd.DataFrame([["S0", "S2", 0.9, 1.0, 0.0, -5.0, 3.0, 0.1],
+                          ["S3", "S4", 0.9, 1.0, 0.0, -4.0, 3.0, 0.1]], columns=PAIR_COLUMNS)
+    strategy.scanner.pairs = lambda *args: found
+
+    signals = strategy._rescan(bars.latest_datetime(), bars.latest_field("close"))
+    assert [(s.symbol, s.signal_type) for s in signals] == [
+        ("S0", OrderPosition.EXIT_LONG), ("S1", OrderPosition.EXIT_SHORT)]
+    assert list(strategy.pairs) == [("S3", "S4")]
@@ -0,0 +1,129 @@
+import queue
+
+import numpy as np
+import pandas as pd
+from trading_common.event import FillEvent, SignalEvent
+from trading_common.utilities.enum import OrderPosition, OrderType
+
+from backtest import kernel
+from backtest.broker import SimulatedBroker
+from backtest.data.shared import SharedDataHandler
+from backtest.data.universe import UniverseIndex
+from backtest.portfolio.portfolio import NaivePortfolio, OptimizedPortfolio
+from backtest.portfolio.strategy import ProgressiveOrder
+from backtest.utilities.utils import _backtest_loop
+
+
+def _step(bars, port, events, n=1):
+    for _ in range(n):
+        bars.update_bars()
+        port.update_timeindex(events.get())
+
+
+def _signal(bars, port, symbol, signal_type=OrderPosition.BUY):
+    close = bars.latest_field("close")[bars.symbol_list.index(symbol)]
+    return port.generate_order(SignalEvent(symbol, bars.latest_datetime(), signal_type, close))
+
+
+def _fill(port, order, price):
+    order.trade_price = price
+    port.update_fill(FillEvent(order, 0.0))
+
+
+def test_optimized_portfolio_tops_up_and_trims(shared_store):
+    events, order_queue = queue.LifoQueue(), queue.Queue()
+    bars = SharedDataHandler(events, shared_store, start_date="2021-01-04")
+    port = OptimizedPortfolio(bars, events, order_queue, "opt", min_periods=20, order_type=OrderType.MARKET)
+    _step(bars, port, events, 30)
+    close = bars.latest_field("close")
+
+    ## the only candidate gets all the equity
+    order = _signal(bars, port, "S0")
+    assert order.direction == OrderPosition.BUY
+    assert order.quantity == int(port.initial_capital / close[0])
+    _fill(port, order, close[0])
+    assert _signal(bars, port, "S0") is None
+
+    ## a second candidate shrinks the weight of S0, its next BUY sells the excess
+    order = _signal(bars, port, "S1")
+    assert order.direction == OrderPosition.BUY and order.quantity > 0
+    _fill(port, order, close[1])
+    weight = port.target_weights[0]
+    assert 0 < weight < 1
+    held = port.current_holdings["S0"]["quantity"]
+    order = _signal(bars, port, "S0")
+    assert order.direction == OrderPosition.SELL
+    assert order.quantity == held - int(weight * port.all_holdings[-1]["total"] / close[0])
+    _fill(port, order, close[0])
+
+    ## dropping S1 from the candidates tops S0 up again, an exit closes S1
+    order = _signal(bars, port, "S1", OrderPosition.EXIT_LONG)
+    assert order.quantity == port.current_holdings["S1"]["quantity"]
+    _fill(port, order, close[1])
+    order = _signal(bars, port, "S0")
+    assert order.direction == OrderPosition.BUY
+    assert np.isclose(port.target_weights[0], 1)
+
+
+def test_inactive_symbols_can_only_exit(shared_store):
+    ## S0 leaves the universe after January 20th, S1 joins on the 25th
+    universe = UniverseIndex.from_frame(pd.DataFrame({
+        "symbol": ["S0", "S1", "S2"], "start": ["2021-01-04", "2021-01-25", "2021-01-04"],
+        "end": ["2021-01-20", None, None]}))
+
+    def build():
+        events, order_queue = queue.LifoQueue(), queue.Queue()
+        bars = SharedDataHandler(events, shared_store, start_date="2021-01-04", universe=universe)
+        port = NaivePortfolio(bars, events, order_queue, 10, "pit", order_type=OrderType.MARKET,
+                              portfolio_strategy=ProgressiveOrder)
+        return bars, events, order_queue, port
+
+    bars, events, order_queue, port = build()
+    signals = np.zeros((len(bars.arrays()["close"]), 3), dtype=np.int8)
+    signals[2, 0] = kernel.BUY
+    signals[15, 0] = kernel.BUY  # adding to S0 after it left
+    signals[16, 0] = kernel.EXIT_LONG
+    signals[17, 0] = kernel.SELL  # opening a short after it left
+    signals[5, 1] = kernel.BUY  # before S1 joined
+    signals[15, 1] = kernel.BUY
+    strategy = kernel.ArraySignalStrategy(bars, events, signals)
+    _backtest_loop(bars, events, order_queue, strategy, port, SimulatedBroker(bars, port, events, order_queue),
+                   plot=False)
+
+    trades = port.journal.to_frame()
+    assert list(zip(trades["symbol"], trades["side"], trades["quantity"])) == [
+        ("S0", 1, 10), ("S1", 1, 10), ("S0", -1, 10)]
+    assert port.current_holdings["S0"]["quantity"] == 0
+
+    ## the kernel applies the same rule to its active mask
+    bars, events, order_queue, port = build()
+    kernel.run_kernel(bars, port, signals)
+    assert port.journal.to_frame().equals(trades)
+
+
+def test_per_symbol_strategies_only_see_members_and_holdings(shared_store):
+    from backtest.strategy.naive import BuyAndHoldStrategy
+
+    class Seen(BuyAndHoldStrategy):
+        def _calculate_signal(self, symbol):
+            self.seen.setdefault(symbol, []).append(self.bars.latest_datetime())
+            return super()._calculate_signal(symbol)
+
+    ## S3 only lists on the 18th, after it left, so it is never bought
+    universe = UniverseIndex.from_frame(pd.DataFrame({
+        "symbol": ["S0", "S1", "S2", "S3"], "start": ["2021-01-04", "2021-01-25", "2021-01-04", "2021-01-04"],
+        "end": ["2021-01-20", None, None, "2021-01-08"]}))
+    events, order_queue = queue.LifoQueue(), queue.Queue()
+    bars = SharedDataHandler(events, shared_store, start_date="2021-01-04", universe=universe)
+    port = NaivePortfolio(bars, events, order_queue, 10, "pit", order_type=OrderType.MARKET)
+    strategy = Seen(bars, events)
+    strategy.seen = {}
+    _backtest_loop(bars, events, order_queue, strategy, port, SimulatedBroker(bars, port, events, order_queue),
+                   plot=False)
+
+    assert min(strategy.seen["S1"]) == pd.Timestamp("2021-01-25")
+    assert len(strategy.seen["S2"]) == len(bars.arrays()["close"])
+    ## S0 left the universe but is still held, so it can still be exited
+    assert port.current_holdings["S0"]["quantity"] == 10
+    assert len(strategy.seen["S0"]) == len(bars.arrays()["close"])
+    assert max(strategy.seen["S3"]) == pd.Timestamp("2021-01-08")
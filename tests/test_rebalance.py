@@ -0,0 +1,87 @@
+import queue
+from functools import partial
+
+import numpy as np
+import pytest
+
+from trading_common.utilities.enum import OrderPosition, OrderType
+from backtest.data.shared import SharedDataHandler
+from backtest.portfolio.portfolio import PercentagePortFolio
+from backtest.portfolio.rebalance import TargetWeightRebalance
+from backtest.portfolio.weights import nan_cov, risk_parity
+
+
+def _risk_contributions(w, cov):
+    rc = w * (cov @ w)
+    return rc / rc.sum()
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_risk_parity_equalizes_contributions(seed):
+    rng = np.random.default_rng(seed)
+    ## mixed signs of correlation, where a multiplicative fixed point can break down
+    returns = rng.normal(size=(250, 30)) @ rng.normal(size=(30, 30)) * 0.01
+    cov = np.cov(returns, rowvar=False)
+    assert (np.corrcoef(returns, rowvar=False) < 0).any()
+    w = risk_parity(cov)
+    assert np.isclose(w.sum(), 1) and (w > 0).all()
+    assert np.allclose(_risk_contributions(w, cov), 1 / 30, rtol=1e-6)
+
+
+def test_risk_parity_diagonal_and_unusable_assets():
+    cov = np.diag([0.04, 0.01, 0.0])
+    w = risk_parity(cov)
+    ## inverse vol when uncorrelated, nothing for an asset without variance
+    assert np.allclose(w, [1 / 3, 2 / 3, 0])
+
+
+def test_risk_parity_logs_when_not_converged(caplog):
+    rng = np.random.default_rng(0)
+    cov = np.cov(rng.normal(size=(250, 10)) @ rng.normal(size=(10, 10)), rowvar=False)
+    with caplog.at_level("INFO"):
+        risk_parity(cov, iterations=1)
+    assert "did not converge" in caplog.text
+
+
+def test_nan_cov_is_pairwise_complete():
+    returns = np.array([[0.01, 0.02, np.nan], [np.nan, 0.01, np.nan], [-0.01, -0.02, np.nan],
+                        [0.02, 0.01, 0.03]])
+    cov = nan_cov(returns)
+    assert np.allclose(cov[:2, :2][0], np.cov(returns[[0, 2, 3], :2], rowvar=False)[0])
+    assert np.isclose(cov[1, 1], np.var(returns[:, 1], ddof=1))
+    ## a single return: no variance and no covariances
+    assert np.isnan(cov[2, 2]) and (cov[2, :2] == 0).all() and (cov[:2, 2] == 0).all()
+    ## the asset without history is left out, the others keep their full window
+    w = risk_parity(cov)
+    assert w[2] == 0 and np.isclose(w.sum(), 1) and (w[:2] > 0).all()
+
+
+def test_target_weights_go_through_the_portfolio(shared_store):
+    events, order_queue = queue.LifoQueue(), queue.Queue()
+    bars = SharedDataHandler(events, shared_store, start_date="2021-01-25")
+    port = PercentagePortFolio(bars, events, order_queue, 0.1, "tw", order_type=OrderType.LIMIT, expires=3,
+                               rebalance=partial(TargetWeightRebalance, weighting="equal", lookback=5))
+    ## January has too few bars for the lookback, February 1st rebalances
+    while order_queue.empty():
+        bars.update_bars()
+        port.update_timeindex(events.get())
+    assert bars.latest_datetime().strftime("%Y-%m-%d") == "2021-02-01"
+
+    ## limit orders wait in the order queue with the portfolio's expiry, nothing skips it
+    assert events.empty()
+    orders = []
+    while not order_queue.empty():
+        orders.append(order_queue.get())
+    assert sorted(o.symbol for o in orders) == sorted(bars.symbol_list)
+    for order in orders:
+        assert order.direction == OrderPosition.BUY
+        assert order.order_type == OrderType.LIMIT
+        assert (order.expires - order.date).days == 3
+    close = bars.latest_field("close")
+    value = np.array([o.quantity * close[bars.symbol_list.index(o.symbol)] for o in orders])
+    assert np.allclose(value, port.initial_capital / len(orders), atol=close.max())
+
+    ## once a period
+    bars.update_bars()
+    port.update_timeindex(events.get())
+    assert order_queue.empty() and events.empty()
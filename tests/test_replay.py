@@ -0,0 +1,48 @@
+import pandas as pd
+import pytest
+
+from trading_common.event import SignalEvent
+from trading_common.utilities.enum import OrderPosition
+from backtest.strategy.replay import ReplayStrategy, SignalRecorder, SignalRecording
+from backtest.utilities.utils import _backtest_loop
+from tests.conftest import build_engine, random_signals
+
+pytest.importorskip("pyarrow")
+
+
+def _run(engine):
+    _backtest_loop(*(engine[k] for k in ("bars", "event_queue", "order_queue", "strategy", "port", "broker")),
+                   plot=False)
+    return engine["port"]
+
+
+@pytest.mark.parametrize("ext", ["parquet", "arrow"])
+def test_replay_of_an_exported_recording_trades_the_same(shared_store, tmp_path, ext):
+    recorded = build_engine(shared_store, random_signals)
+    recorded["strategy"] = recorder = SignalRecorder(recorded["strategy"])
+    port = _run(recorded)
+    assert len(recorder.recording) > 0
+    fp = str(tmp_path / f"signals.{ext}")
+    recorder.recording.export(fp)
+
+    replayed = build_engine(shared_store, random_signals(recorded["bars"], seed=1))
+    replayed["strategy"] = ReplayStrategy(replayed["bars"], replayed["event_queue"], SignalRecording.load(fp))
+    replay_port = _run(replayed)
+    pd.testing.assert_frame_equal(replay_port.equity_curve, port.equity_curve)
+    pd.testing.assert_frame_equal(replay_port.journal.to_frame(), port.journal.to_frame())
+
+
+def test_time_zone_survives_the_round_trip(tmp_path):
+    recording = SignalRecording(["AAPL"])
+    dt = pd.Timestamp("2024-01-03 09:30", tz="America/New_York")
+    recording.record(0, SignalEvent("AAPL", dt, OrderPosition.BUY, 10.0))
+    recording.record(1, SignalEvent("AAPL", dt + pd.Timedelta("1D"), OrderPosition.SELL, 11.0))
+    with pytest.raises(Exception, match="can't be recorded together"):
+        recording.record(2, SignalEvent("AAPL", pd.Timestamp("2024-01-05"), OrderPosition.BUY, 10.0))
+    fp = str(tmp_path / "signals.parquet")
+    recording.export(fp)
+
+    strategy = ReplayStrategy(None, None, SignalRecording.load(fp))
+    signals = strategy.calculate_signals(None) + strategy.calculate_signals(None)
+    assert [s.datetime for s in signals] == [dt, dt + pd.Timedelta("1D")]
+    assert str(signals[0].datetime.tz) == "America/New_York"
@@ -0,0 +1,56 @@
+import pandas as pd
+import pytest
+
+from backtest.results import ResultsStore, config_hash
+from backtest.utilities.utils import _backtest_loop
+from tests.conftest import build_engine, random_signals
+
+pytest.importorskip("pyarrow")
+
+
+def _finished_port(store, seed):
+    engine = build_engine(store, lambda bars: random_signals(bars, seed=seed))
+    _backtest_loop(*(engine[k] for k in ("bars", "event_queue", "order_queue", "strategy", "port", "broker")),
+                   plot=False)
+    return engine["port"]
+
+
+def _spec(name, period):
+    return {"name": name, "dates": {"start": "2021-01-04"},
+            "strategy": {"class": "BoundedTA", "args": [period]}, "portfolio": {"class": "PercentagePortFolio"}}
+
+
+def test_round_trip(shared_store, tmp_path):
+    ports = [_finished_port(shared_store, seed) for seed in range(3)]
+    with ResultsStore(str(tmp_path / "results"), batch_size=2) as store:
+        run_ids = [store.save(port, _spec(f"run{i}", 10 + i)) for i, port in enumerate(ports)]
+        assert store.equity_curve(run_ids[0]).equals(ports[0].equity_curve)
+        trades = store.trades(run_ids[1])
+        pd.testing.assert_frame_equal(trades, ports[1].journal.to_frame(), check_categorical=False)
+
+        runs = store.query()
+        assert sorted(runs.index) == sorted(run_ids)
+        row = runs.loc[run_ids[2]]
+        assert row["family"] == "BoundedTA" and row["n_trades"] == len(ports[2].journal)
+        assert row["start_date"] == str(ports[2].equity_curve.index[0].date())
+
+        best = store.top(3, family="BoundedTA")
+        assert list(best["sharpe"]) == sorted(runs["sharpe"], reverse=True)
+        assert list(store.compare(config_hash(_spec("renamed", 11))).index) == [run_ids[1]]
+        with pytest.raises(Exception, match="metric"):
+            store.top(metric="volume")
+
+    ## the index survives reopening
+    with ResultsStore(str(tmp_path / "results")) as store:
+        assert len(store.query()) == 3
+
+
+def test_batched_rows_are_flushed_before_queries(shared_store, tmp_path):
+    from backtest.results import run_record
+
+    port = _finished_port(shared_store, 0)
+    root = str(tmp_path / "results")
+    with ResultsStore(root, batch_size=10) as store:
+        store.add(run_record(root, port, _spec("batched", 10)))
+        assert store.conn.execute("SELECT COUNT(*) FROM runs").fetchone()[0] == 0
+        assert list(store.query()["name"]) == ["batched"]
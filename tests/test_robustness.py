@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest.performance import create_drawdowns, create_sharpe_ratio
+from backtest.robustness import robustness
+
+
+@pytest.fixture
+def equity_curve():
+    rng = np.random.default_rng(0)
+    returns = rng.normal(0.0005, 0.01, 500)
+    returns[0] = 0.0
+    curve = np.cumprod(1 + returns)
+    return pd.DataFrame({"equity_returns": returns, "equity_curve": curve, "total": 1e5 * curve},
+                        index=pd.bdate_range("2020-01-01", periods=len(returns)))
+
+
+def _contains(summary, name, value):
+    row = summary.loc[name]
+    assert row["observed"] == pytest.approx(value)
+    assert row["lower"] - 1e-9 <= value <= row["upper"] + 1e-9
+
+
+def test_block_interval_contains_the_point_estimates(equity_curve):
+    summary = robustness(equity_curve, method="block", n_samples=1000, seed=1, max_workers=1)
+    max_dd, dd_duration = create_drawdowns(equity_curve["equity_curve"])
+    _contains(summary, "sharpe", create_sharpe_ratio(equity_curve["equity_returns"]))
+    _contains(summary, "max_drawdown", max_dd)
+    _contains(summary, "drawdown_duration", dd_duration)
+    _contains(summary, "total_return", equity_curve["equity_curve"].iloc[-1] - 1)
+    ## the seed fixes the samples, whatever the number of workers
+    pd.testing.assert_frame_equal(summary, robustness(equity_curve, method="block", n_samples=1000, seed=1,
+                                                      max_workers=2))
+
+
+def test_shuffle_interval_contains_the_point_estimates(equity_curve):
+    pnl = np.random.default_rng(2).normal(50, 1000, 60)
+    summary = robustness(equity_curve, trades=pnl, method="shuffle", n_samples=1000, seed=1, max_workers=1)
+    max_dd, dd_duration = create_drawdowns(pd.Series(1 + np.cumsum(pnl) / 1e5))
+    _contains(summary, "max_drawdown", max_dd)
+    _contains(summary, "drawdown_duration", dd_duration)
+    ## without replacement every order of the trades ends at the same total
+    _contains(summary, "total_return", pnl.sum() / 1e5)
+    assert summary.loc["total_return", "std"] == pytest.approx(0.0, abs=1e-12)
@@ -0,0 +1,121 @@
+import contextlib
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest.performance import create_sharpe_ratio
+from backtest.utilities.pruning import AnyPruner, DrawdownPruner, RunningMetrics, SharpePruner
+from backtest.utilities.search import Study, TPESampler, Trial, successive_halving, tpe_search
+from tests.conftest import build_engine, random_signals
+
+
+class _Port(object):
+    def __init__(self, totals):
+        self.all_holdings = [{"total": total} for total in totals]
+
+
+def test_running_metrics_follow_the_performance_ones():
+    totals = 1e5 * np.cumprod(1 + np.random.default_rng(0).normal(0.001, 0.01, 100))
+    metrics = RunningMetrics()
+    ## fed in pieces like a pruner does
+    for end in (10, 11, 60, 100):
+        metrics.update(_Port(totals[:end]).all_holdings)
+    returns = pd.Series(totals).pct_change().dropna()
+    assert metrics.n == 99
+    assert metrics.sharpe == pytest.approx(create_sharpe_ratio(returns))
+    assert metrics.total_return == pytest.approx(totals[-1] / totals[0] - 1)
+    assert metrics.max_drawdown == pytest.approx((1 - totals / np.maximum.accumulate(totals)).max())
+
+
+def test_pruners():
+    totals = 1e5 * np.r_[np.linspace(1, 1.1, 30), np.linspace(1.1, 0.8, 30)]
+    falling = _Port(totals)
+    pruner = DrawdownPruner(0.2, every=10, warmup=20)
+    assert not pruner.due(10) and pruner.due(20) and not pruner.due(25)
+    assert not pruner.check(30, _Port(totals[:30]))
+    assert pruner.check(60, falling) and pruner.pruned_at == 60 and "drawdown" in pruner.reason
+
+    ## a sharpe this far below the best's lower bound is pruned, but not before min_periods
+    study = Study()
+    best = Trial(0, {})
+    best.value, best.metrics = 2.0, {"sharpe": 2.0, "sharpe_se": 0.5}
+    study.trials.append(best)
+    assert not SharpePruner(study, min_periods=100).check(60, falling)
+    pruner = SharpePruner(study, min_periods=50)
+    assert pruner.check(60, falling) and "best lower bound 1.50" in pruner.reason
+    assert not SharpePruner(Study(), min_periods=50).check(60, falling)
+
+    ## each pruner keeps its own schedule
+    any_pruner = AnyPruner([DrawdownPruner(0.2, every=7), SharpePruner(study, every=5, min_periods=50)])
+    assert any_pruner.due(7) and any_pruner.due(10) and not any_pruner.due(11)
+    assert any_pruner.check(55, falling) and "sharpe" in any_pruner.reason
+
+
+def test_tpe_samples_around_the_good_trials():
+    sampler = TPESampler({"x": ("float", 0.0, 1.0), "kind": ("choice", ["a", "b"])}, n_startup=10, seed=0)
+    study = Study()
+    for number in range(40):
+        params = sampler.sample(study)
+        assert 0.0 <= params["x"] <= 1.0 and params["kind"] in ("a", "b")
+        trial = Trial(number, params)
+        trial.value = -(params["x"] - 0.8) ** 2 - (params["kind"] == "b")
+        study.trials.append(trial)
+    distance = [abs(t.params["x"] - 0.8) for t in study.trials]
+    ## the last trials are much closer to the best x than the random startup ones
+    assert np.mean(distance[-15:]) < np.mean(distance[:10]) / 1.5
+    assert sum(t.params["kind"] == "a" for t in study.trials[-15:]) >= 12
+
+
+def _builder(store, built=None, closed=None, fail_on=None):
+    def build(params):
+        if fail_on is not None and params["seed"] == fail_on:
+            raise Exception("build failed")
+        run = build_engine(store, lambda bars: random_signals(bars, seed=params["seed"]))
+        run["resources"] = contextlib.ExitStack()
+        if closed is not None:
+            run["resources"].callback(closed.append, params["seed"])
+        if built is not None:
+            built.append(params["seed"])
+        return run
+    return build
+
+
+def test_tpe_search_prunes_trials(shared_store):
+    study = tpe_search(_builder(shared_store), {"seed": ("int", 0, 20)}, n_trials=4, n_startup=2, seed=0,
+                       make_pruners=lambda study: [DrawdownPruner(0.0, every=10, warmup=10)])
+    assert [t.number for t in study.trials] == [0, 1, 2, 3]
+    ## every run loses something in its first 10 bars
+    assert all(t.pruned and t.bars_seen == 10 for t in study.trials)
+    assert study.best is None
+
+    study = tpe_search(_builder(shared_store), {"seed": ("int", 0, 20)}, n_trials=3, seed=0)
+    assert not any(t.pruned for t in study.trials)
+    assert study.best.value == max(t.value for t in study.trials)
+
+
+def test_successive_halving_builds_and_releases_runs_as_it_goes(shared_store):
+    built, closed = [], []
+    trials = successive_halving(_builder(shared_store, built, closed), [{"seed": s} for s in range(4)],
+                                min_bars=20, eta=2)
+    assert sorted(built) == sorted(closed) == [0, 1, 2, 3]
+    ## halved at 20 and 40 bars, the one left runs to the end of the data
+    assert [t.pruned for t in trials] == [False, True, True, True]
+    assert [t.bars_seen for t in trials[1:]] == [40, 20, 20]
+    assert trials[0].bars_seen > 40
+    assert trials[2].value >= trials[3].value
+
+    ## runs built before a failing one are still released
+    built, closed = [], []
+    with pytest.raises(Exception, match="build failed"):
+        successive_halving(_builder(shared_store, built, closed, fail_on=2), [{"seed": s} for s in range(4)],
+                           min_bars=20, eta=2)
+    assert built == sorted(closed) == [0, 1]
+
+
+def test_trials_without_a_value_rank_last():
+    from backtest.utilities.search import _rank_value
+
+    trials = [Trial(i, {}) for i in range(3)]
+    trials[1].value, trials[2].value = np.nan, 0.5
+    assert [t.number for t in sorted(trials, key=_rank_value, reverse=True)] == [2, 0, 1]
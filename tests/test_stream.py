@@ -0,0 +1,112 @@
+import logging
+import queue
+
+import pandas as pd
+import pytest
+
+from backtest.data.stream import AlpacaStreamFeed, BarAggregator, QueueFeed, StreamingDataHandler
+from tests.stubs import StubAlpacaStream
+
+
+def _trade(symbol, ts, price, size=100):
+    return {"T": "t", "S": symbol, "t": ts, "p": price, "s": size}
+
+
+def test_daily_buckets_follow_the_exchange_session():
+    agg = BarAggregator("1D")
+    ## 21:00 New York on Jan 3rd is already Jan 4th in UTC
+    late = pd.Timestamp("2024-01-04T02:00:00Z").value
+    assert agg._bucket(late) == pd.Timestamp("2024-01-03", tz="America/New_York").value
+    ## across the DST change the session still starts at local midnight
+    summer = pd.Timestamp("2024-07-01T15:00:00Z").value
+    assert agg._bucket(summer) == pd.Timestamp("2024-07-01T04:00:00Z").value
+
+
+def test_stream_to_store_end_to_end(monkeypatch):
+    pytest.importorskip("websocket")
+    monkeypatch.setenv("alpaca_key_id", "key")
+    monkeypatch.setenv("alpaca_secret_key", "secret")
+    script = [
+        [_trade("AAPL", "2024-01-03T15:00:00Z", 10.0), _trade("MSFT", "2024-01-03T15:00:00Z", 5.0)],
+        [_trade("AAPL", "2024-01-03T20:59:00Z", 12.0), _trade("AAPL", "2024-01-03T21:30:00Z", 9.0)],
+        [_trade("AAPL", "2024-01-04T14:31:00Z", 11.0, 50)],
+    ]
+    history = {"AAPL": pd.DataFrame({"open": [9.5], "high": [9.5], "low": [9.5], "close": [9.5], "volume": [1.0]},
+                                    index=pd.DatetimeIndex([pd.Timestamp("2024-01-02T05:00:00Z")]))}
+    events = queue.Queue()
+    with StubAlpacaStream(script) as server:
+        bars = StreamingDataHandler(events, ["AAPL"], AlpacaStreamFeed(server.url), timeframe="1D")
+        bars.warm_start(history)
+        bars.start()
+        bars._reader.join(5)
+        assert not bars._reader.is_alive()
+        bars.update_bars()
+
+    assert server.subscriptions == [{"action": "subscribe", "trades": ["AAPL"]}]
+    assert bars.updated_symbols == {"AAPL"}
+    assert events.get(block=False).type == "MARKET"
+    latest = bars.get_latest_bars("AAPL", 5)
+    assert list(latest["datetime"]) == list(pd.to_datetime(["2024-01-02T05:00", "2024-01-03T05:00", "2024-01-04T05:00"]))
+    assert list(latest["open"]) == [9.5, 10.0, 11.0]
+    assert list(latest["high"]) == [9.5, 12.0, 11.0]
+    assert list(latest["close"]) == [9.5, 9.0, 11.0]
+    assert list(latest["volume"]) == [1.0, 300.0, 50.0]
+    assert "MSFT" not in bars.store
+
+
+def test_stream_rejected_auth(monkeypatch):
+    pytest.importorskip("websocket")
+    monkeypatch.setenv("alpaca_key_id", "wrong")
+    monkeypatch.setenv("alpaca_secret_key", "secret")
+    with StubAlpacaStream([]) as server:
+        with pytest.raises(Exception, match="authentication failed"):
+            next(AlpacaStreamFeed(server.url).messages())
+
+
+def _history(*closes):
+    index = pd.DatetimeIndex([pd.Timestamp("2024-01-02T05:00:00Z")])
+    return {sym: pd.DataFrame({"open": [c], "high": [c], "low": [c], "close": [c], "volume": [1.0]}, index=index)
+            for sym, c in closes}
+
+
+def test_late_ticks_are_counted_and_logged(caplog):
+    agg = BarAggregator("1min")
+    agg.on_trade("AAPL", pd.Timestamp("2024-01-03T15:00:10Z").value, 10.0, 1)
+    assert agg.on_trade("AAPL", pd.Timestamp("2024-01-03T15:01:00Z").value, 11.0, 1) is not None
+    with caplog.at_level(logging.INFO):
+        assert agg.on_trade("AAPL", pd.Timestamp("2024-01-03T15:00:50Z").value, 12.0, 1) is None
+    assert agg.late_ticks == 1
+    assert "late tick for AAPL" in caplog.text
+
+
+def test_warm_start_is_acted_on_and_strategies_only_see_updated_symbols():
+    from backtest.strategy.naive import BuyAndHoldStrategy
+    from backtest.utilities.utils import _calculate_signals
+
+    class Seen(BuyAndHoldStrategy):
+        def _calculate_signal(self, symbol):
+            self.seen.append(symbol)
+
+    events = queue.Queue()
+    feed = QueueFeed()
+    bars = StreamingDataHandler(events, ["AAPL", "MSFT", "IBM"], feed, timeframe="1D")
+    bars.warm_start(_history(("MSFT", 5.0), ("AAPL", 10.0)))
+    strategy = Seen(bars, events)
+    try:
+        ## daily bars only complete tomorrow, the history is acted on right away
+        strategy.seen = []
+        bars.update_bars()
+        _calculate_signals(strategy, bars, None, events.get(block=False))
+        assert bars.updated_symbols == {"AAPL", "MSFT"} and strategy.seen == ["AAPL", "MSFT"]
+        bars.update_bars()
+        assert not bars.updated_symbols and events.empty()
+
+        ## a bar of one symbol only runs the strategy for it
+        strategy.seen = []
+        bars.on_message({"T": "b", "S": "IBM", "t": "2024-01-03T05:00:00Z", "o": 1.0, "h": 1.0, "l": 1.0,
+                         "c": 1.0, "v": 1.0})
+        bars.update_bars()
+        _calculate_signals(strategy, bars, None, events.get(block=False))
+        assert strategy.seen == ["IBM"]
+    finally:
+        bars.stop()
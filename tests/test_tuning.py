@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest.strategy.dataset import DatasetWriter
+from backtest.strategy.tuning import grid_search, purged_splits
+
+
+def _dates(n_dates=20, n_symbols=3):
+    return np.repeat(pd.bdate_range("2021-01-04", periods=n_dates).values.astype(np.int64), n_symbols)
+
+
+def test_purged_splits_leave_out_the_target_window_and_embargo():
+    dates = _dates()
+    unique = np.unique(dates)
+    folds = purged_splits(dates, n_splits=4, horizon=2, embargo=1)
+    assert len(folds) == 4
+    assert np.array_equal(np.sort(np.concatenate([test for _, test in folds])), np.arange(len(dates)))
+    pos = np.searchsorted(unique, dates)
+    for train, test in folds:
+        first, last = pos[test].min(), pos[test].max()
+        ## everything but the block, the 2 bars whose target reaches into it and the bar after it
+        kept = (pos < first - 2) | (pos > last + 1)
+        assert np.array_equal(train, np.flatnonzero(kept))
+
+
+def test_walk_forward_only_trains_on_the_past():
+    dates = _dates()
+    folds = purged_splits(dates, n_splits=4, horizon=1, walk_forward=True)
+    ## the first block has nothing before it
+    assert len(folds) == 3
+    for train, test in folds:
+        assert dates[train].max() < dates[test].min()
+    with pytest.raises(Exception, match="can't be split"):
+        purged_splits(dates[:9], n_splits=4)
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    rng = np.random.default_rng(0)
+    dates = _dates(60, 4)
+    X = rng.normal(size=(len(dates), 3))
+    ## a rank-like target that isn't a return
+    y = X @ [1.0, -0.5, 0.0] + rng.normal(0, 0.5, len(dates))
+    writer = DatasetWriter(str(tmp_path / "ds"), ["a", "b", "c"])
+    for s in range(4):
+        rows = slice(s, None, 4)
+        writer.append(f"S{s}", X[rows], y[rows], dates[rows])
+    dataset = writer.close()
+    X, y = dataset.load()
+    return dataset, y
+
+
+def test_signal_backtest_needs_explicit_returns(dataset):
+    from sklearn.linear_model import Ridge
+
+    dataset, y = dataset
+    report = grid_search(dataset, Ridge, {"alpha": [0.1, 1e4]}, n_splits=3, max_workers=1)
+    assert not any(col.startswith("bt_") for col in report.columns)
+    assert report["ic_mean"].is_monotonic_decreasing
+
+    returns = np.sign(y) * 0.01
+    report = grid_search(dataset, Ridge, {"alpha": [0.1, 1e4]}, n_splits=3, returns=returns, max_workers=1)
+    assert "bt_sharpe_mean" in report
+    ## ranked by ic unless told otherwise
+    assert report["ic_mean"].is_monotonic_decreasing
+    report = grid_search(dataset, Ridge, {"alpha": [0.1, 1e4]}, n_splits=3, returns=returns,
+                         score="mse_mean", max_workers=1)
+    assert report["mse_mean"].is_monotonic_decreasing
+
+
+def _write(path, n_dates, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = _dates(n_dates, 1)
+    X = rng.normal(size=(len(dates), 2))
+    writer = DatasetWriter(path, ["a", "b"])
+    writer.append("S0", X, X[:, 0] + rng.normal(0, 0.1, len(dates)), dates)
+    return writer.close()
+
+
+def test_rebuilt_dataset_is_read_again(tmp_path):
+    from sklearn.linear_model import Ridge
+
+    path = str(tmp_path / "ds")
+    _write(path, 100)
+    report = grid_search(path, Ridge, {"alpha": [1.0]}, n_splits=5, max_workers=1)
+    assert report.loc[0, "train_rows_mean"] == 80 and report.loc[0, "test_rows_mean"] == 20
+    _write(path, 1000, seed=1)
+    report = grid_search(path, Ridge, {"alpha": [1.0]}, n_splits=5, max_workers=1)
+    assert report.loc[0, "train_rows_mean"] == 800 and report.loc[0, "test_rows_mean"] == 200